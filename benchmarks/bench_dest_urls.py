@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''Compare ``Location.dest_urls`` built from url templates with seven
+``reverse()`` calls per location.
+
+Usage: python benchmarks/bench_dest_urls.py [locations] [repeat]
+
+Runs against a minimal urlconf with the destination url patterns; the
+locations wrap stand-in city objects so no database is needed.
+'''
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from django.conf import settings  # noqa
+settings.configure(ROOT_URLCONF=__name__, INSTALLED_APPS=[])
+import django  # noqa
+django.setup()
+
+from django.conf.urls import url  # noqa
+from django.core.urlresolvers import reverse  # noqa
+from dr_django_tools.shared.commondata.utils import (  # noqa
+    DEST_URL_NAMES, Location, dest_urls_many)
+
+
+def view(request, *args, **kwargs):
+    pass
+
+
+DEST = r'^d/(?P<country>[-\w]+)/(?P<region>[-\w]+)/(?P<city>[-\w]+)/'
+urlpatterns = [url(DEST + '$', view, name='destination')] + [
+    url(r'^d/([-\w]+)/([-\w]+)/([-\w]+)/%s/$' % name[5:].replace('_', '-'),
+        view, name=name)
+    for key, name in DEST_URL_NAMES[1:]]
+
+
+class Slugged(object):
+    def __init__(self, slug, **kwargs):
+        self.id = 1
+        self.slug = slug
+        self.__dict__.update(kwargs)
+
+
+class City(Slugged):
+    pass
+
+
+def locations(count):
+    country = Slugged('country')
+    return [Location(City('city-%i' % x, country=country,
+                          region=Slugged('region-%i' % (x % 50))))
+            for x in range(count)]
+
+
+def with_reverse(locations):
+    result = []
+    for location in locations:
+        args = location.url_args()
+        result.append(dict((key, reverse(name, args=args))
+                           for key, name in DEST_URL_NAMES))
+    return result
+
+
+def one_by_one(locations):
+    return [location.dest_urls for location in locations]
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 1000
+    repeat = int(argv[2]) if len(argv) > 2 else 5
+    locs = locations(count)
+    assert with_reverse(locs) == dest_urls_many(locs)
+    for label, func in [('reverse()', with_reverse),
+                        ('Location.dest_urls', one_by_one),
+                        ('dest_urls_many', dest_urls_many)]:
+        elapsed = min(timeit.repeat(lambda: func(locs), number=1,
+                                    repeat=repeat))
+        print('%-20s %8.1f ms  %6.1f us/location'
+              % (label, elapsed * 1e3, elapsed / count * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
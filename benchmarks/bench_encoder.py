@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''Report encode time against output size for the encoder profiles.
+
+Usage: python benchmarks/bench_encoder.py [source image] [repeat]
+
+Every profile of ``ENCODER_PROFILES`` and a grid of JPEG quality,
+progressive and subsampling settings is used to encode the thumbnail
+(120x70) and a 800x600 rendition of the source.  Without a source image a
+noisy gradient photo stand-in is generated.
+'''
+from __future__ import print_function
+
+import io
+import os
+import random
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from dr_django_tools.shared.commondata.image_utils import (  # noqa
+    ENCODER_PROFILES, resize_and_crop, save_image)
+
+SIZES = [(120, 70), (800, 600)]
+
+
+def generate():
+    rand = random.Random(1)
+    im = Image.new('RGB', (1600, 1200))
+    im.putdata([((x * 255) // 1600 + rand.randint(-20, 20),
+                 (y * 255) // 1200 + rand.randint(-20, 20),
+                 128 + rand.randint(-40, 40))
+                for y in range(1200) for x in range(1600)])
+    return im
+
+
+def grid():
+    for name in sorted(ENCODER_PROFILES):
+        yield name, ENCODER_PROFILES[name]
+    for quality in (60, 75, 85, 95):
+        for progressive in (False, True):
+            for subsampling in ('4:4:4', '4:2:0'):
+                yield ('q%i%s %s' % (quality, ' prog' if progressive else '',
+                                     subsampling),
+                       {'format': 'JPEG', 'quality': quality,
+                        'optimize': True, 'progressive': progressive,
+                        'subsampling': subsampling})
+
+
+def encode(img, options, repeat):
+    start = time.time()
+    for x in range(repeat):
+        buf = io.BytesIO()
+        try:
+            save_image(img, buf, options)
+        except (IOError, KeyError):
+            return None, None  # no encoder for this format in this PIL
+    return (time.time() - start) / repeat, len(buf.getvalue())
+
+
+def main(argv):
+    source = argv[1] if len(argv) > 1 else None
+    repeat = int(argv[2]) if len(argv) > 2 else 20
+    original = Image.open(source) if source else generate()
+    buf = io.BytesIO()
+    original.convert('RGB').save(buf, 'PNG')
+
+    for size in SIZES:
+        buf.seek(0)
+        out = io.BytesIO()
+        resize_and_crop(buf, out, size, profile={'format': 'PNG'})
+        img = Image.open(io.BytesIO(out.getvalue()))
+        img.load()
+        print('%ix%i' % size)
+        for label, options in grid():
+            elapsed, length = encode(img, options, repeat)
+            if elapsed is None:
+                print('  %-22s unsupported' % label)
+                continue
+            print('  %-22s %8.2f ms %9i bytes' % (label, elapsed * 1e3,
+                                                  length))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
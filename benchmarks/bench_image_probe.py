@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''Compare header-only dimension probing with ``Image.open(path).size``.
+
+Usage: python benchmarks/bench_image_probe.py [count] [directory]
+
+Without a directory ``count`` JPEG/PNG/GIF/WebP files are generated in a
+temporary directory first.
+'''
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from dr_django_tools.shared.commondata.image_utils import image_dimensions  # noqa
+
+FORMATS = [('JPEG', '.jpg'), ('PNG', '.png'), ('GIF', '.gif'),
+           ('WEBP', '.webp')]
+
+
+def generate(directory, count):
+    rand = random.Random(1)
+    sources = {}
+    for fmt, ext in FORMATS:
+        im = Image.new('RGB', (1024, 768), (200, 120, 40))
+        path = os.path.join(directory, 'source' + ext)
+        try:
+            im.save(path, fmt)
+        except (IOError, KeyError):
+            continue  # no encoder for this format in this build of PIL
+        with open(path, 'rb') as f:
+            sources[ext] = f.read()
+        os.remove(path)
+    exts = sorted(sources)
+    for x in range(count):
+        ext = rand.choice(exts)
+        with open(os.path.join(directory, '%06i%s' % (x, ext)), 'wb') as f:
+            f.write(sources[ext])
+
+
+def pil_size(path):
+    return Image.open(path).size
+
+
+def run(label, func, paths, threads=None):
+    start = time.time()
+    if threads:
+        pool = ThreadPool(threads)
+        pool.map(func, paths)
+        pool.close()
+        pool.join()
+    else:
+        for path in paths:
+            func(path)
+    elapsed = time.time() - start
+    print('%-28s %8.3fs  %6.1f us/file'
+          % (label, elapsed, elapsed / len(paths) * 1e6))
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+    directory = argv[2] if len(argv) > 2 else None
+    cleanup = directory is None
+    if cleanup:
+        directory = tempfile.mkdtemp()
+        generate(directory, count)
+    try:
+        paths = [os.path.join(directory, name)
+                 for name in sorted(os.listdir(directory))][:count]
+        run('Image.open().size', pil_size, paths)
+        run('image_dimensions', image_dimensions, paths)
+        run('image_dimensions, 8 threads', image_dimensions, paths, 8)
+    finally:
+        if cleanup:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+'''Measure the cold import time of the commondata helpers.
+
+Usage: python benchmarks/bench_import.py [module] [runs]
+
+Every run imports the module in a fresh interpreter.  On Python 3.7+ the
+slowest imports reported by ``python -X importtime`` are listed as well.
+'''
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_MODULE = 'dr_django_tools.shared.commondata.utils'
+
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    return env
+
+
+def cold_import(module, runs=10):
+    '''Best wall time, in seconds, of importing ``module`` in a new process
+    minus the time of starting an empty interpreter.
+    '''
+    def best(code):
+        times = []
+        for x in range(runs):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', code], env=_env())
+            times.append(time.time() - start)
+        return min(times)
+    return best('import %s' % module) - best('pass')
+
+
+def importtime(module, top=10):
+    if sys.version_info < (3, 7):
+        return []
+    p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                          'import %s' % module],
+                         stderr=subprocess.PIPE, env=_env())
+    _, err = p.communicate()
+    rows = []
+    for line in err.decode('utf8').splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main(argv):
+    module = argv[1] if len(argv) > 1 else DEFAULT_MODULE
+    runs = int(argv[2]) if len(argv) > 2 else 10
+    print('%s: %.1f ms' % (module, cold_import(module, runs) * 1000))
+    for cumulative, name in importtime(module):
+        print('%10.1f ms %s' % (cumulative / 1000.0, name))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
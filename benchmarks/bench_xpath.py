@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''Benchmark the XPath helpers against plain ``element.xpath()`` calls.
+
+Usage: python benchmarks/bench_xpath.py [feed.xml] [repeat]
+
+Defaults to the sample feed in benchmarks/data, point it at a real vendor
+feed for representative numbers.
+'''
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from dr_django_tools.shared.commondata.utils import XMLNodeHelper  # noqa
+
+NS = {
+    'v': 'http://www.example.com/schemas/vendor/1.0',
+    'geo': 'http://www.w3.org/2003/01/geo/wgs84_pos#',
+}
+DEFAULT_FEED = os.path.join(os.path.dirname(__file__), 'data',
+                            'vendor_feed.xml')
+
+# the lookups a typical property importer does per record
+TEXT_PATHS = ['v:name', 'v:address/v:city', 'v:address/v:region',
+              'v:address/v:country', 'geo:lat', 'geo:long', 'v:rating',
+              'v:description']
+ATTR_PATHS = [('v:address/v:country', 'code'), ('v:rating', 'scale'),
+              ('v:rates', 'currency'), ('v:chain', 'code')]
+
+
+def uncached(records):
+    for node in records:
+        for xp in TEXT_PATHS:
+            res = node.xpath(xp, namespaces=NS)
+            if res:
+                res[0].text
+        for xp, attr in ATTR_PATHS:
+            res = node.xpath(xp, namespaces=NS)
+            if res:
+                res[0].attrib.get(attr, '')
+
+
+def helpers(records):
+    for node in records:
+        helper = XMLNodeHelper(node, NS)
+        for xp in TEXT_PATHS:
+            helper.xpath_text(xp)
+        for xp, attr in ATTR_PATHS:
+            helper.xpath_attr(xp, attr)
+
+
+def main(argv):
+    path = argv[1] if len(argv) > 1 else DEFAULT_FEED
+    repeat = int(argv[2]) if len(argv) > 2 else 2000
+    records = etree.parse(path).getroot().xpath('v:property', namespaces=NS)
+    lookups = len(records) * (len(TEXT_PATHS) + len(ATTR_PATHS)) * repeat
+    for name, func in (('element.xpath', uncached),
+                       ('XMLNodeHelper', helpers)):
+        elapsed = min(timeit.repeat(lambda: func(records), number=repeat,
+                                    repeat=3))
+        print('%-14s %8.3fs  %6.2f us/lookup'
+              % (name, elapsed, elapsed / lookups * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,10 @@
+from django.db import models
+
+
+class Place(models.Model):
+    name = models.CharField(max_length=200)
+    slug = models.CharField(max_length=200, null=True, blank=True,
+                            db_index=True)
+    latitude = models.FloatField(default=0)
+    longitude = models.FloatField(default=0)
+    updated_at = models.DateTimeField(null=True)
@@ -0,0 +1,24 @@
+'''The fields of the django-cities models the commondata helpers use, so the
+benchmarks run on SQLite without GeoDjango.
+'''
+from django.db import models
+
+
+class Country(models.Model):
+    name = models.CharField(max_length=200)
+    slug = models.CharField(max_length=200, db_index=True)
+    code = models.CharField(max_length=2, db_index=True)
+
+
+class Region(models.Model):
+    name = models.CharField(max_length=200)
+    slug = models.CharField(max_length=200, db_index=True)
+    code = models.CharField(max_length=200, db_index=True)
+    country = models.ForeignKey(Country, on_delete=models.CASCADE)
+
+
+class City(models.Model):
+    name = models.CharField(max_length=200)
+    slug = models.CharField(max_length=200, db_index=True)
+    country = models.ForeignKey(Country, on_delete=models.CASCADE)
+    region = models.ForeignKey(Region, null=True, on_delete=models.CASCADE)
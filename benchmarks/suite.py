@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+'''Benchmark suite for the hot paths of the library.
+
+Usage: python benchmarks/suite.py [--quick] [--only NAME] [--repeat N]
+                                  [--output results.json]
+                                  [--compare baseline.json] [--threshold X]
+
+Everything runs offline: an in-memory SQLite database with the stand-in
+models of benchmarks/standins, generated images and HTML, and a local HTTP
+server for downloads.  ``--output`` stores the results as JSON together with
+the Python, Django and Pillow versions and the git commit; ``--compare``
+prints the change of every case against such a file and exits with status 1
+when a case got slower by more than ``--threshold`` (default 15%).
+'''
+from __future__ import print_function
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(HERE, 'standins'))
+
+from django.conf import settings  # noqa
+settings.configure(
+    SECRET_KEY='benchmarks',
+    ALLOWED_HOSTS=['testserver'],
+    INSTALLED_APPS=['cities', 'benchapp'],
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                           'NAME': ':memory:'}},
+)
+import django  # noqa
+django.setup()
+
+from django.core.management import call_command  # noqa
+from django.test import RequestFactory  # noqa
+from PIL import Image  # noqa
+
+from benchapp.models import Place  # noqa
+from cities.models import City, Country, Region  # noqa
+from dr_django_tools.shared.commondata import utils  # noqa
+from dr_django_tools.shared.commondata.image_utils import resize_and_crop  # noqa
+from dr_django_tools.shared.django.sitemap import SiteMap  # noqa
+from dr_django_tools.shared.django.urlutils import SHAPE_ROWS, jsonres  # noqa
+from dr_django_tools.shared.django.view_helpers import is_mobile_and_ie  # noqa
+
+try:
+    from http.server import HTTPServer, SimpleHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# scratch directory of the current run and callbacks to run after it
+WORKDIR = None
+_cleanups = []
+
+CASES = []
+
+
+def case(name, params=(None,), quick=None):
+    '''Register ``setup(param)`` for every param; it returns ``(run, ops)``
+    where ``run()`` is what is timed and ``ops`` the number of operations a
+    run does.  ``quick`` are the params used with ``--quick``.
+    '''
+    def register(setup):
+        CASES.append((name, tuple(params),
+                      tuple(params if quick is None else quick), setup))
+        return setup
+    return register
+
+
+def case_key(name, param):
+    return name if param is None else '%s[%s]' % (name, param)
+
+
+NAME_WORDS = [u'Grand', u'Hotel', u'Plaza', u'Caf\xe9', u'de', u'la', u'Mer',
+              u'&amp;', u'Resort', u'Spa', u'Ch\xe2teau', u'Inn', u'Suites',
+              u'Bed & Breakfast', u'Lodge', u'Villa', u"D'Or", u'Royal']
+
+
+def names(count, seed=1):
+    rand = random.Random(seed)
+    return [u' '.join(rand.choice(NAME_WORDS)
+                      for y in range(rand.randint(2, 6)))
+            for x in range(count)]
+
+
+@case('slugify')
+def slugify_case(param):
+    values = names(1000)
+    return lambda: [utils.slugify(x) for x in values], len(values)
+
+
+@case('unique_slugify', params=(0, 10, 100))
+def unique_slugify_case(collisions):
+    Place.objects.all().delete()
+    slugs = ['grand-hotel'] + ['grand-hotel-%i' % (x + 1)
+                               for x in range(collisions - 1)]
+    Place.objects.bulk_create([Place(name='Grand Hotel', slug=slug)
+                               for slug in slugs[:collisions]])
+
+    def run():
+        for x in range(20):
+            utils.unique_slugify(Place(name='Grand Hotel'), 'Grand Hotel')
+    return run, 20
+
+
+COUNTRY_CODES = [a + b for a in 'ABCDEFGH' for b in 'ABCDEFGHIJ'][:50]
+
+
+def populate_cities():
+    if Country.objects.exists():
+        return
+    Country.objects.bulk_create([
+        Country(id=i + 1, name='Country %i' % i, slug='country-%i' % i,
+                code=code) for i, code in enumerate(COUNTRY_CODES)])
+    Region.objects.bulk_create([
+        Region(id=c * 20 + r + 1, name='Region %i %i' % (c, r),
+               slug='region-%i-%i' % (c, r), code='R%i' % r,
+               country_id=c + 1)
+        for c in range(50) for r in range(20)])
+    City.objects.bulk_create([
+        City(name='City %i %i %i' % (c, r, x),
+             slug='city-%i-%i-%i' % (c, r, x),
+             country_id=c + 1, region_id=c * 20 + r + 1)
+        for c in range(50) for r in range(20) for x in range(10)])
+
+
+@case('lookup_location', params=('country', 'region', 'city'))
+def lookup_location_case(level):
+    populate_cities()
+    rand = random.Random(3)
+    queries = []
+    for x in range(100):
+        c, r, i = rand.randrange(50), rand.randrange(20), rand.randrange(10)
+        args = [COUNTRY_CODES[c]]
+        if level != 'country':
+            args.append('R%i' % r)
+        if level == 'city':
+            args.append('city-%i-%i-%i' % (c, r, i))
+        queries.append(args)
+    return lambda: [utils.lookup_location(*x) for x in queries], len(queries)
+
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, '
+    'like Gecko) Chrome/70.0.3538.77 Safari/537.36',
+    'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 6.1; Trident/4.0)',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 12_0 like Mac OS X) AppleWebKit/605.1'
+    '.15 (KHTML, like Gecko) Version/12.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 8.0.0; SM-G960F) AppleWebKit/537.36 (KHTML, '
+    'like Gecko) Chrome/70.0.3538.80 Mobile Safari/537.36',
+    'Googlebot/2.1 (+http://www.google.com/bot.html)',
+]
+
+
+@case('is_mobile_and_ie')
+def is_mobile_and_ie_case(param):
+    factory = RequestFactory()
+    requests = [factory.get('/', HTTP_USER_AGENT=USER_AGENTS[x % 5])
+                for x in range(1000)]
+    return lambda: [is_mobile_and_ie(x) for x in requests], len(requests)
+
+
+@case('sitemap_render', params=(10000, 100000, 1000000), quick=(10000,))
+def sitemap_render_case(count):
+    sitemap = SiteMap()
+    day = datetime.date(2018, 1, 1)
+    for x in range(count):
+        sitemap.add('/hotels/hotel-%i/' % x,
+                    day + datetime.timedelta(days=x % 365))
+    request = RequestFactory().get('/sitemap.xml')
+    return lambda: sitemap.render(request), count
+
+
+def photo_jpeg(size):
+    # smooth noise, closer to a photo than a flat color for the encoder
+    rand = random.Random(size[0])
+    small = (max(size[0] // 8, 1), max(size[1] // 8, 1))
+    data = bytearray(rand.getrandbits(8)
+                     for x in range(small[0] * small[1] * 3))
+    im = Image.frombytes('RGB', small, bytes(data))
+    buf = io.BytesIO()
+    im.resize(size, Image.BILINEAR).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def parse_size(value):
+    return tuple(int(x) for x in value.split('x'))
+
+
+@case('resize_and_crop',
+      params=('640x480:120x70', '1600x1200:120x70', '1600x1200:800x600',
+              '4000x3000:120x70', '4000x3000:800x600'),
+      quick=('640x480:120x70', '1600x1200:120x70'))
+def resize_and_crop_case(param):
+    source, target = [parse_size(x) for x in param.split(':')]
+    data = photo_jpeg(source)
+    profile = 'thumbnail' if target == (120, 70) else 'resized'
+    return lambda: resize_and_crop(io.BytesIO(data), io.BytesIO(), target,
+                                   profile=profile), 1
+
+
+@case('jsonres', params=('serializer', 'fields', 'rows'))
+def jsonres_case(variant):
+    Place.objects.all().delete()
+    rand = random.Random(5)
+    now = datetime.datetime(2018, 1, 1)
+    Place.objects.bulk_create([
+        Place(name=name, slug='place-%i' % x,
+              latitude=rand.uniform(-90, 90),
+              longitude=rand.uniform(-180, 180),
+              updated_at=now + datetime.timedelta(hours=x))
+        for x, name in enumerate(names(1000))])
+    fields = ('name', 'slug', 'latitude', 'longitude', 'updated_at')
+    if variant == 'serializer':
+        res = jsonres()
+    elif variant == 'fields':
+        res = jsonres(fields=fields)
+    else:
+        res = jsonres(fields=fields, shape=SHAPE_ROWS)
+    return lambda: res.serialize(Place.objects.all()), 1000
+
+
+def descriptions(count):
+    rand = random.Random(7)
+    tags = [u'<p>', u'</p>', u'<b>', u'</b>', u'<br/>', u'&amp;', u'&#169;',
+            u'<a href="http://example.com/?a=1&b=2">', u'</a>']
+    words = [w for name in NAME_WORDS for w in name.split()] + \
+        [u'beach', u'view', u'rooms', u'pool', u'breakfast', u'walk']
+    result = []
+    for x in range(count):
+        parts = []
+        for y in range(rand.randint(100, 300)):
+            parts.append(rand.choice(tags) if rand.random() < 0.15
+                         else rand.choice(words))
+        result.append(u' '.join(parts))
+    return result
+
+
+@case('strip_tags')
+def strip_tags_case(param):
+    values = descriptions(500)
+    return lambda: [utils.strip_tags(x) for x in values], len(values)
+
+
+@case('shorten')
+def shorten_case(param):
+    values = descriptions(500)
+    return lambda: [utils.shorten(x, 200) for x in values], len(values)
+
+
+@case('distance_in_miles')
+def distance_case(param):
+    rand = random.Random(9)
+    pairs = [(rand.uniform(-80, 80), rand.uniform(-180, 180),
+              rand.uniform(-80, 80), rand.uniform(-180, 180))
+             for x in range(10000)]
+    return lambda: [utils.distance_in_miles(*x) for x in pairs], len(pairs)
+
+
+class _Handler(SimpleHTTPRequestHandler):
+
+    def translate_path(self, path):
+        return os.path.join(WORKDIR, os.path.basename(path.split('?')[0]))
+
+    def log_message(self, *args):
+        pass
+
+
+def http_server():
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    _cleanups.append(stop)
+    return 'http://127.0.0.1:%i/' % server.server_address[1]
+
+
+@case('grab', params=('file', 'http'))
+def grab_case(source):
+    path = os.path.join(WORKDIR, 'source.jpg')
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(photo_jpeg((2000, 1500)))
+    url = path if source == 'file' else http_server() + 'source.jpg'
+    target = os.path.join(WORKDIR, 'target-%s.jpg' % source)
+
+    def run():
+        # without a target there is no If-Modified-Since and a full download
+        if os.path.exists(target):
+            os.remove(target)
+        utils.grab(url, target)
+    return run, 1
+
+
+def measure(run, repeat, max_time):
+    '''Times of up to ``repeat`` runs after a warm up run, stopping early
+    once ``max_time`` seconds are spent.  A warm up run longer than
+    ``max_time`` is the only sample.
+    '''
+    start = _clock()
+    run()
+    first = _clock() - start
+    if first > max_time:
+        return [first]
+    times = []
+    while len(times) < repeat and _clock() - start < max_time:
+        t = _clock()
+        run()
+        times.append(_clock() - t)
+    return times
+
+
+def run_cases(quick=False, only=None, repeat=5, max_time=5.0):
+    results = {}
+    for name, params, quick_params, setup in CASES:
+        if only and not any(x in name for x in only):
+            continue
+        for param in (quick_params if quick else params):
+            key = case_key(name, param)
+            try:
+                run, ops = setup(param)
+                times = sorted(measure(run, repeat, max_time))
+            except Exception as e:
+                results[key] = {'error': '%s: %s' % (e.__class__.__name__, e)}
+                print('%-40s error: %s' % (key, results[key]['error']))
+                continue
+            best = times[0]
+            results[key] = {
+                'best': best,
+                'median': times[len(times) // 2],
+                'runs': len(times),
+                'ops': ops,
+                'us_per_op': best / ops * 1e6,
+            }
+            print('%-40s %10.3f ms %12.2f us/op  (%i runs)'
+                  % (key, best * 1e3, best / ops * 1e6, len(times)))
+    return results
+
+
+def git_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                      stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode('ascii').strip()
+
+
+def environment():
+    import PIL
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'django': django.get_version(),
+        'pillow': getattr(PIL, '__version__', None) or
+        getattr(PIL, 'PILLOW_VERSION', None),
+        'platform': platform.platform(),
+        'commit': git_commit(),
+    }
+
+
+def compare(results, baseline, threshold):
+    '''Print the change of every case found in both result sets and return
+    the keys of the cases that got slower than ``threshold`` allows.
+    '''
+    for key in ('python', 'django', 'pillow'):
+        old = baseline['environment'].get(key)
+        new = results['environment'].get(key)
+        if old != new:
+            print('note: %s %s in the baseline, %s now' % (key, old, new))
+    slower = []
+    for key in sorted(results['cases']):
+        new = results['cases'][key]
+        old = baseline['cases'].get(key)
+        if not old or 'best' not in old or 'best' not in new:
+            continue
+        change = new['best'] / old['best'] - 1
+        flag = ''
+        if change > threshold:
+            flag = 'SLOWER'
+            slower.append(key)
+        elif change < -threshold:
+            flag = 'faster'
+        print('%-40s %10.3f ms -> %10.3f ms %+7.1f%% %s'
+              % (key, old['best'] * 1e3, new['best'] * 1e3, change * 100,
+                 flag))
+    return slower
+
+
+def main(argv):
+    global WORKDIR
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--quick', action='store_true',
+                        help='skip the largest inputs')
+    parser.add_argument('--only', action='append',
+                        help='only cases with this in their name')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-time', type=float, default=5.0,
+                        help='seconds to spend on one case at most')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='results file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.15)
+    args = parser.parse_args(argv[1:])
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    WORKDIR = tempfile.mkdtemp()
+    try:
+        cases = run_cases(args.quick, args.only, args.repeat, args.max_time)
+    finally:
+        for cleanup in _cleanups:
+            cleanup()
+        shutil.rmtree(WORKDIR)
+
+    results = {
+        'created': datetime.datetime.utcnow().isoformat() + 'Z',
+        'environment': environment(),
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,118 @@
+'''Asyncio counterparts of the fetch helpers in ``utils``.
+
+Needs Python 3.5+ and aiohttp, which is imported on first use.  Responses
+are streamed to disk chunk by chunk, so memory use stays bounded however
+many downloads are in flight.  File writes and PIL work run in the loop's
+default executor, so a slow disk does not stall the other downloads; that
+costs a thread hand-off per chunk of ``CHUNK_SIZE`` bytes.  Every helper takes an optional aiohttp ``session``; pass one
+shared session when running many downloads so connections are pooled,
+otherwise a session is opened for the call.
+'''
+import asyncio
+import os
+import tempfile
+
+from .lazymodule import LazyModule
+from . import utils
+
+aiohttp = LazyModule('aiohttp')
+
+CHUNK_SIZE = utils.FETCH_CHUNK_SIZE
+
+
+async def fetchfile(source, session=None):
+    '''Return an open file object.  If the source contains a url the content
+    is downloaded into a named temporary file, which is removed when the
+    returned file is closed.
+    '''
+    if '://' in source:
+        f = tempfile.NamedTemporaryFile()
+        try:
+            await _download(source, f, session=session)
+        except BaseException:
+            f.close()
+            raise
+        f.seek(0)
+        return f
+
+    return open(source, 'rb')
+
+
+async def grab(url, target, verify=True, session=None):
+    '''Download ``url`` to ``target`` unless it was not modified since
+    ``target`` was written.  ftp urls and local paths are handed to
+    ``utils.grab`` in the executor.
+    '''
+    if not url.startswith('http'):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, utils.grab, url, target,
+                                          verify)
+
+    headers = utils.conditional_headers(target)
+    return await _download(url, target, headers, verify, session)
+
+
+async def grab_many(pairs, verify=True, limit=100):
+    '''Download every ``(url, target)`` pair over one shared session with at
+    most ``limit`` connections open.  Returns the results of ``grab`` in
+    order, with the exception instead for failed downloads.
+    '''
+    connector = aiohttp.TCPConnector(limit=limit)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(
+            *[grab(url, target, verify, session) for url, target in pairs],
+            return_exceptions=True)
+
+
+async def grab_to_temp(url, verify=True, session=None):
+    handle, filename = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        await grab(url, filename, verify, session)
+    except BaseException:
+        os.remove(filename)
+        raise
+    return filename
+
+
+async def grab_and_scale(url, target, width, height, session=None):
+    handle, tmp1 = tempfile.mkstemp(suffix='.jpg')
+    os.close(handle)
+
+    try:
+        await grab(url, tmp1, session=session)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, utils.scale_image, tmp1, target,
+                                   width, height)
+    finally:
+        if os.path.exists(tmp1):
+            os.remove(tmp1)
+
+
+async def _download(url, target, headers=None, verify=True, session=None):
+    '''Download ``url`` to ``target``, a path or a file object open for
+    writing.
+    '''
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await _download(url, target, headers, verify, session)
+
+    kwargs = {} if verify else {'ssl': False}
+    async with session.get(url, headers=headers, **kwargs) as res:
+        if res.status == 200:
+            if not isinstance(target, str):
+                await _write_body(res, target)
+            else:
+                utils._detach(target)
+                with open(target, 'wb') as f:
+                    await _write_body(res, f)
+        elif res.status != 304:
+            raise IOError('Error (%s) while trying to remotely request: %s'
+                          % (res.status, url))
+    return res
+
+
+async def _write_body(res, f):
+    loop = asyncio.get_event_loop()
+    async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+        await loop.run_in_executor(None, f.write, chunk)
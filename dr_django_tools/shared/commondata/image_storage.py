@@ -0,0 +1,310 @@
+'''Storage backends for image binaries.
+
+``settings.IMAGE_STORAGE`` names the backend class (dotted path) used for
+image binaries, ``settings.IMAGE_THUMBNAIL_STORAGE`` the one used for
+generated thumbnails; both default to ``LocalImageStorage``.  Binaries are
+addressed by the relative name ``image_path(type_, id, full=False)``.
+'''
+import errno
+import io
+import mmap
+import os
+import threading
+
+from django.conf import settings
+
+from . import image_store
+
+_known_dirs = set()
+
+
+def ensure_dir(path):
+    '''Create directory ``path`` unless this process already knows it
+    exists.
+    '''
+    if path in _known_dirs:
+        return
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    _known_dirs.add(path)
+
+
+class ImageStorage(object):
+    # whether binaries are plain files under path(name)
+    local = False
+
+    def path(self, name):
+        raise NotImplementedError('%s does not store binaries as files'
+                                  % self.__class__.__name__)
+
+    def local_path(self, name):
+        '''Return the path of a file holding the binary of ``name``.  Storage
+        without files of its own may extract it to a cache first; readers
+        should prefer ``open``.
+        '''
+        if self.local:
+            return self.path(name)
+        raise NotImplementedError('%s can not extract binaries to files'
+                                  % self.__class__.__name__)
+
+    def exists(self, name):
+        raise NotImplementedError()
+
+    def read(self, name):
+        raise NotImplementedError()
+
+    def open(self, name):
+        return io.BytesIO(self.read(name))
+
+    def save(self, name, data):
+        raise NotImplementedError()
+
+    def delete(self, name):
+        raise NotImplementedError()
+
+
+class LocalImageStorage(ImageStorage):
+    '''Binaries as files under ``settings.IMAGE_DIR``.'''
+    local = True
+
+    def path(self, name):
+        return os.path.join(settings.IMAGE_DIR, name)
+
+    def prepare(self, name):
+        '''Return the path for ``name`` with its directory in place.'''
+        path = self.path(name)
+        ensure_dir(os.path.dirname(path))
+        return path
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def save(self, name, data):
+        path = self.prepare(name)
+        image_store.detach(path)
+        tmp = image_store.temp_name(path)
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)
+        if image_store.enabled():
+            image_store.intern(path)
+
+    def delete(self, name):
+        path = self.path(name)
+        if image_store.enabled():
+            image_store.release(path)
+            return
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+class PackImageStorage(ImageStorage):
+    '''Many small binaries appended to large pack files.
+
+    Pack files live in ``settings.IMAGE_PACK_DIR`` (default
+    ``IMAGE_DIR/packs``) and are never rewritten; an append-only ``index``
+    file records name, pack number, offset and length of every binary, and a
+    negative pack number marks a deletion.  Writers from several processes
+    are serialized with a lock file, readers map the packs with ``mmap`` and
+    pick up entries appended by other processes when the index has grown.
+
+    Binaries are read from the mapped packs with ``read`` and ``open``.
+    ``local_path`` is a fallback for code that needs a file: it extracts the
+    binary to ``cache`` under the pack directory, one file per pack and
+    offset so an extracted file never goes stale, and keeps at most
+    ``cache_size`` (``settings.IMAGE_PACK_CACHE_SIZE``) files there, removing
+    the least recently used ones.
+    '''
+
+    def __init__(self, location=None, pack_size=None, cache_size=None):
+        self.location = location or getattr(settings, 'IMAGE_PACK_DIR', None) \
+            or os.path.join(settings.IMAGE_DIR, 'packs')
+        self.pack_size = pack_size or getattr(settings, 'IMAGE_PACK_SIZE',
+                                              256 * 1024 * 1024)
+        self.cache_size = cache_size or getattr(
+            settings, 'IMAGE_PACK_CACHE_SIZE', 1000)
+        self._index = {}
+        self._index_pos = 0
+        self._pack = 0
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _index_path(self):
+        return os.path.join(self.location, 'index')
+
+    def _pack_path(self, pack):
+        return os.path.join(self.location, 'pack-%05i.dat' % pack)
+
+    def _refresh(self):
+        # read index entries appended since the last refresh
+        try:
+            f = open(self._index_path(), 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+        with f:
+            f.seek(self._index_pos)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # partially written entry
+                self._index_pos += len(line)
+                name, pack, offset, length = line.decode('utf8').split('\t')
+                pack = int(pack)
+                if pack < 0:
+                    self._index.pop(name, None)
+                    continue
+                self._index[name] = (pack, int(offset), int(length))
+                self._pack = max(self._pack, pack)
+
+    def _lookup(self, name):
+        try:
+            size = os.stat(self._index_path()).st_size
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            size = 0
+        if size > self._index_pos:
+            with self._lock:
+                self._refresh()
+        return self._index.get(name)
+
+    def exists(self, name):
+        return self._lookup(name) is not None
+
+    def read(self, name):
+        entry = self._lookup(name)
+        if entry is None:
+            raise IOError(errno.ENOENT, 'No such image in pack storage', name)
+        pack, offset, length = entry
+        if not length:
+            return b''
+        m = self._map(pack, offset + length)
+        return m[offset:offset + length]
+
+    def local_path(self, name):
+        entry = self._lookup(name)
+        if entry is None:
+            raise IOError(errno.ENOENT, 'No such image in pack storage', name)
+        pack, offset, length = entry
+        cache = os.path.join(self.location, 'cache')
+        path = os.path.join(cache, '%05i-%i-%s' % (pack, offset,
+                                                   os.path.basename(name)))
+        try:
+            # the modification time orders the cache by last use
+            os.utime(path, None)
+            return path
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        ensure_dir(cache)
+        tmp = image_store.temp_name(path)
+        with open(tmp, 'wb') as f:
+            f.write(self.read(name))
+        os.rename(tmp, path)
+        self._trim_cache(cache, path)
+        return path
+
+    def _trim_cache(self, cache, keep):
+        files = []
+        for filename in os.listdir(cache):
+            path = os.path.join(cache, filename)
+            if filename.endswith('.tmp') or path == keep:
+                continue
+            try:
+                files.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass  # removed by another process
+        files.sort()
+        for mtime, path in files[:max(len(files) + 1 - self.cache_size, 0)]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+    def _map(self, pack, needed):
+        m = self._maps.get(pack)
+        if m is None or len(m) < needed:
+            with self._lock:
+                m = self._maps.get(pack)
+                if m is None or len(m) < needed:
+                    with open(self._pack_path(pack), 'rb') as f:
+                        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._maps[pack] = m
+        return m
+
+    def save(self, name, data):
+        self._append(name, data)
+
+    def delete(self, name):
+        if self._lookup(name) is not None:
+            self._append(name, None)
+
+    def _append(self, name, data):
+        import fcntl
+        ensure_dir(self.location)
+        with self._lock:
+            with open(os.path.join(self.location, 'lock'), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    if data is None:
+                        entry = (-1, 0, 0)
+                    else:
+                        entry = self._write_data(data)
+                    with open(self._index_path(), 'ab') as index:
+                        index.write(('%s\t%i\t%i\t%i\n' % ((name,) + entry))
+                                    .encode('utf8'))
+                    self._refresh()
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_data(self, data):
+        pack = self._pack
+        path = self._pack_path(pack)
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        if offset and offset + len(data) > self.pack_size:
+            pack += 1
+            path = self._pack_path(pack)
+            offset = 0
+        with open(path, 'ab') as f:
+            f.write(data)
+        return pack, offset, len(data)
+
+
+_storages = {}
+
+
+def get_storage(thumbnail=False):
+    '''Return the configured storage for image binaries, or for generated
+    thumbnails when ``thumbnail`` is true.
+    '''
+    setting = 'IMAGE_THUMBNAIL_STORAGE' if thumbnail else 'IMAGE_STORAGE'
+    dottedpath = getattr(settings, setting, None)
+    if dottedpath is None and thumbnail:
+        dottedpath = getattr(settings, 'IMAGE_STORAGE', None)
+    try:
+        return _storages[dottedpath]
+    except KeyError:
+        pass
+    if dottedpath is None:
+        storage = LocalImageStorage()
+    else:
+        from .utils import configured_item
+        storage = configured_item(setting, dottedpath)()
+    _storages[dottedpath] = storage
+    return storage
@@ -0,0 +1,203 @@
+'''Content addressed storage for image binaries.
+
+Enabled with ``settings.IMAGE_CONTENT_ADDRESSED = True``.  Every binary
+written to its ``image_path`` is interned: the content is stored once under
+``settings.IMAGE_CONTENT_DIR`` (default ``IMAGE_DIR/content``), named after
+its SHA-1, and the image path becomes a hard link to that file.  The link
+count of a content file is its reference count, so identical vendor photos
+take the disk space of one and paths returned by ``image_path`` keep working
+unchanged.
+
+Renditions are interned the same way.  A symlink named after the hash of
+their source and the rendition size points at the stored rendition, so
+identical sources are only resized once.
+
+Where a file can not be hard linked into the store (another device, too
+many links, no hard links at all) the store keeps a copy instead.  Copies
+are not reference counted: no image path links to them, so
+``collect_garbage`` removes them and a later ``render`` resizes again.
+'''
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+
+_CHUNK = 64 * 1024
+
+# link failures that just mean the file can not be shared
+_UNSHAREABLE = (errno.EXDEV, errno.EMLINK, errno.EPERM)
+
+# seconds after which a temporary file is taken as left behind by a crash
+TEMP_FILE_AGE = 3600
+
+
+def enabled():
+    return getattr(settings, 'IMAGE_CONTENT_ADDRESSED', False)
+
+
+def content_dir():
+    return getattr(settings, 'IMAGE_CONTENT_DIR', None) or \
+        os.path.join(settings.IMAGE_DIR, 'content')
+
+
+def content_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        chunk = f.read(_CHUNK)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(_CHUNK)
+    return h.hexdigest()
+
+
+def content_path(digest):
+    return os.path.join(content_dir(), digest[:2], digest[2:4],
+                        '%s.jpg' % digest)
+
+
+def intern(path):
+    '''Replace the file at ``path`` with a link to the stored copy of its
+    content, storing it first if it is new.  Returns the content hash.
+    '''
+    digest = content_hash(path)
+    blob = content_path(digest)
+    _ensure_dir(os.path.dirname(blob))
+    try:
+        os.link(path, blob)
+        return digest
+    except OSError as e:
+        if e.errno in _UNSHAREABLE:
+            # keep a copy, so rendition links to the blob resolve
+            if not os.path.exists(blob):
+                tmp = temp_name(blob)
+                shutil.copyfile(path, tmp)
+                os.rename(tmp, blob)
+            return digest
+        if e.errno != errno.EEXIST:
+            raise
+
+    if not os.path.samefile(path, blob):
+        _link_over(blob, path)
+    return digest
+
+
+def rendition_path(digest, size, variant=''):
+    return os.path.join(content_dir(), 'renditions', digest[:2],
+                        '%s-%ix%i%s.jpg' % (digest, size[0], size[1], variant))
+
+
+def render(source, target, size, renderer, variant=''):
+    '''Write the ``size`` rendition of ``source`` to ``target``.
+
+    ``renderer(source, target, size)`` is only called when no rendition of an
+    identical source exists yet; otherwise ``target`` is linked to it.
+    '''
+    key = rendition_path(content_hash(source), size, variant)
+    _ensure_dir(os.path.dirname(target))
+    try:
+        _link_over(os.path.realpath(key), target)
+        return
+    except (IOError, OSError) as e:
+        # no rendition yet, or a dangling link to a released one; the copy
+        # fallback of _link_over raises IOError on Python 2
+        if e.errno != errno.ENOENT:
+            raise
+
+    renderer(source, target, size)
+    blob = content_path(intern(target))
+    _ensure_dir(os.path.dirname(key))
+    tmp = temp_name(key)
+    os.symlink(blob, tmp)
+    os.rename(tmp, key)
+
+
+def release(path):
+    '''Remove ``path``, and the stored content when this was its last
+    reference.
+    '''
+    try:
+        links = os.stat(path).st_nlink
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    blob = None
+    if links > 1:
+        blob = content_path(content_hash(path))
+        if not os.path.exists(blob) or not os.path.samefile(path, blob):
+            blob = None
+    os.remove(path)
+    if blob is not None and os.stat(blob).st_nlink == 1:
+        os.remove(blob)
+
+
+def detach(path):
+    '''Make sure ``path`` is not shared before it is written to in place.'''
+    try:
+        if os.stat(path).st_nlink > 1:
+            release(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def collect_garbage(temp_file_age=None):
+    '''Remove stored content no image path links to anymore and rendition
+    links to removed content.  Temporary files are only removed once they
+    are ``temp_file_age`` (default ``TEMP_FILE_AGE``) seconds old, younger
+    ones may be about to be renamed into place by another process.  Returns
+    the number of files removed.
+    '''
+    if temp_file_age is None:
+        temp_file_age = TEMP_FILE_AGE
+    cutoff = time.time() - temp_file_age
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(content_dir()):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                if filename.endswith('.tmp'):
+                    stale = os.lstat(path).st_mtime < cutoff
+                elif os.path.islink(path):
+                    stale = not os.path.exists(path)
+                else:
+                    stale = os.stat(path).st_nlink == 1
+                if stale:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                # renamed or removed by another process meanwhile
+                if e.errno != errno.ENOENT:
+                    raise
+    return removed
+
+
+def temp_name(path):
+    '''A name next to ``path`` to write to before renaming it into place,
+    unique per process and thread.
+    '''
+    return '%s.%i.%i.tmp' % (path, os.getpid(),
+                             threading.current_thread().ident)
+
+
+def _link_over(source, target):
+    tmp = temp_name(target)
+    try:
+        os.link(source, tmp)
+    except OSError as e:
+        if e.errno not in _UNSHAREABLE:
+            raise
+        shutil.copyfile(source, tmp)
+    os.rename(tmp, target)
+
+
+def _ensure_dir(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
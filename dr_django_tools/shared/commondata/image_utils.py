@@ -1,58 +1,293 @@
-from PIL import Image
-def resize_and_crop(img_path, modified_path, size, crop_type='top'):
+import hashlib
+import math
+import os
+import struct
+
+from .lazymodule import LazyModule
+from . import metrics
+
+Image = LazyModule('PIL.Image')
+
+# Encoder settings per rendition type.  ``format`` is the PIL format, the
+# other keys are passed to ``Image.save``, except ``strip``: when false the
+# EXIF data and ICC profile of the source are kept.  Entries of
+# ``settings.IMAGE_ENCODER_PROFILES`` update these or add new profiles.
+# Renditions are stored under .jpg paths, so named profiles have to encode
+# JPEG; other formats can be written with a dict of options.
+ENCODER_PROFILES = {
+    'default': {
+        'format': 'JPEG',
+        'quality': 75,
+        'optimize': True,
+        'strip': True,
+    },
+    'thumbnail': {
+        'format': 'JPEG',
+        'quality': 75,
+        'optimize': True,
+        'subsampling': '4:2:0',
+        'strip': True,
+    },
+    'resized': {
+        'format': 'JPEG',
+        'quality': 75,
+        'optimize': True,
+        'strip': True,
+    },
+    'scaled': {
+        'format': 'JPEG',
+        'quality': 75,
+        'optimize': True,
+        'progressive': True,
+        'strip': True,
+    },
+}
+
+# modes resampled as they are, others are converted to RGB first
+_RESAMPLE_MODES = ('RGB', 'L')
+
+# JPEG start-of-frame markers, the ones carrying the image dimensions
+_JPEG_SOF_MARKERS = frozenset(range(0xc0, 0xd0)) - frozenset([0xc4, 0xc8, 0xcc])
+
+
+def encoder_profile(profile=None):
+    """
+    Return the encoder options of `profile`, a profile name (default
+    'default') or a dict of options.
+    """
+    from django.conf import settings
+    if isinstance(profile, dict):
+        return profile
+    profile = profile or 'default'
+    overrides = {}
+    if settings.configured:
+        overrides = getattr(settings, 'IMAGE_ENCODER_PROFILES', None) or {}
+    if profile not in ENCODER_PROFILES and profile not in overrides:
+        raise ValueError('ERROR: unknown encoder profile %r' % profile)
+    options = dict(ENCODER_PROFILES.get(profile, ENCODER_PROFILES['default']))
+    options.update(overrides.get(profile, {}))
+    if options['format'] != 'JPEG':
+        raise ValueError('ERROR: encoder profile %r encodes %s, renditions are '
+                         'stored as .jpg files and have to be JPEG'
+                         % (profile, options['format']))
+    return options
+
+
+def profile_key(profile=None):
+    """
+    Return a short key that changes whenever the options of `profile` do, to
+    tell renditions encoded with different settings apart.
+    """
+    options = sorted(encoder_profile(profile).items())
+    return hashlib.md5(repr(options).encode('utf8')).hexdigest()[:8]
+
+
+def target_format(target):
+    """
+    Return the PIL format `Image.save` picks for `target` from its file
+    name extension, None for file objects without a known one.
+    """
+    text = (str, type(u''))
+    name = target if isinstance(target, text) else getattr(target, 'name',
+                                                            None)
+    if not isinstance(name, text):
+        return None
+    ext = os.path.splitext(name)[1].lower()
+    if not ext:
+        return None
+    Image.init()
+    return Image.EXTENSION.get(ext)
+
+
+def save_image(img, target, profile=None, format=None, source_info=None):
+    """
+    Save `img` to `target` (a path or file object) with the options of
+    encoder `profile`.
+
+    args:
+        format: overrides the format of the profile.  Without `format` and
+            `profile` the format follows the extension of `target`, like
+            `Image.save` does, and the profile's only for unknown ones.
+        source_info: `info` of the image `img` was derived from, the EXIF
+            data and ICC profile kept by profiles with `strip` off.
+    """
+    options = dict(encoder_profile(profile))
+    if format is None and profile is None:
+        format = target_format(target)
+    format = format or options.pop('format', None) or 'JPEG'
+    options.pop('format', None)
+    if not options.pop('strip', True):
+        info = img.info if source_info is None else source_info
+        for key in ('exif', 'icc_profile'):
+            if info.get(key):
+                options[key] = info[key]
+    img.save(target, format, **options)
+
+
+def crop_box(img_size, size, crop_type='top'):
+    """
+    Return the `(left, upper, right, lower)` region of an image of
+    `img_size` that is kept when it is scaled and cropped to `size`, in
+    source coordinates.
+    """
+    img_ratio = img_size[0] / float(img_size[1])
+    ratio = size[0] / float(size[1])
+    if ratio == img_ratio:
+        # If the scale is the same, we do not need to crop
+        return (0, 0, img_size[0], img_size[1])
+    if crop_type not in ('top', 'middle', 'bottom'):
+        raise ValueError('ERROR: invalid value for crop_type')
+
+    # The image is cropped vertically or horizontally depending on the ratio
+    vertical = ratio > img_ratio
+    length = img_size[1] if vertical else img_size[0]
+    kept = img_size[0] / ratio if vertical else img_size[1] * ratio
+    if crop_type == 'top':
+        start = 0
+    elif crop_type == 'middle':
+        start = (length - kept) / 2.0
+    else:
+        start = length - kept
+    if vertical:
+        return (0, start, img_size[0], start + kept)
+    return (start, 0, start + kept, img_size[1])
+
+
+def _resample(img, size, box):
+    """
+    Resize the `box` region of `img` to `size` with one Lanczos pass,
+    reducing it by an integer factor first when it is much larger.
+    """
+    lanczos = resample_filter()
+    bw, bh = box[2] - box[0], box[3] - box[1]
+    factor = int(min(bw / size[0], bh / size[1]) / 2)
+    if factor > 1 and hasattr(img, 'reduce'):
+        # reduce is Pillow 7+, and takes the box in source coordinates
+        int_box = tuple(int(round(x)) for x in box)
+        img = img.reduce(factor, box=int_box)
+        return img.resize(size, lanczos)
+    try:
+        return img.resize(size, lanczos, box)
+    except TypeError:
+        # no box argument before Pillow 3.4
+        return img.crop(tuple(int(round(x)) for x in box)).resize(size,
+                                                                  lanczos)
+
+
+def resample_filter():
+    """The Lanczos filter, `ANTIALIAS` in old versions of PIL."""
+    return getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+
+
+@metrics.timed('resize_and_crop')
+def resize_and_crop(img_path, modified_path, size, crop_type='top',
+                    format=None, profile=None):
     """
     Resize and crop an image to fit the specified size.
 
     args:
-        img_path: path for the image to resize.
-        modified_path: path to store the modified image.
+        img_path: path (or file object) for the image to resize.
+        modified_path: path (or file object) to store the modified image.
         size: `(width, height)` tuple.
         crop_type: can be 'top', 'middle' or 'bottom', depending on this
             value, the image will cropped getting the 'top/left', 'middle' or
             'bottom/right' of the image to fit the size.
+        format: image format to save as, by default the one of `profile`,
+            or of the extension of `modified_path` without a profile.
+        profile: encoder profile name or options, see `ENCODER_PROFILES`.
     raises:
         Exception: if can not open the file in img_path of there is problems
             to save the image.
         ValueError: if an invalid `crop_type` is provided.
     """
-    # If height is higher we resize vertically, if not we resize horizontally
     img = Image.open(img_path)
+    source_info = img.info
+    width, height = img.size
+    box = crop_box(img.size, size, crop_type)
+
+    # let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while keeping at
+    # least twice the pixels the resize needs
+    scale = size[0] / float(box[2] - box[0])
+    img.draft('RGB', (int(math.ceil(width * scale * 2)),
+                      int(math.ceil(height * scale * 2))))
+    if img.size != (width, height):
+        fx = img.size[0] / float(width)
+        fy = img.size[1] / float(height)
+        box = (box[0] * fx, box[1] * fy, box[2] * fx, box[3] * fy)
+
+    if img.mode not in _RESAMPLE_MODES:
+        img = img.convert('RGB')
+    img = _resample(img, size, box)
     if img.mode != 'RGB':
         img = img.convert('RGB')
-    # Get current and desired ratio for the images
-    img_ratio = img.size[0] / float(img.size[1])
-    ratio = size[0] / float(size[1])
-    #The image is scaled/cropped vertically or horizontally depending on the ratio
-    if ratio > img_ratio:
-        img = img.resize((size[0], int(round(size[0] * img.size[1] / img.size[0]))),
-                Image.ANTIALIAS)
-        # Crop in the top, middle or bottom
-        if crop_type == 'top':
-            box = (0, 0, img.size[0], size[1])
-        elif crop_type == 'middle':
-            box = (0, int(round((img.size[1] - size[1]) / 2)), img.size[0],
-                   int(round((img.size[1] + size[1]) / 2)))
-        elif crop_type == 'bottom':
-            box = (0, img.size[1] - size[1], img.size[0], img.size[1])
-        else :
-            raise ValueError('ERROR: invalid value for crop_type')
-        img = img.crop(box)
-    elif ratio < img_ratio:
-        img = img.resize((int(round(size[1] * img.size[0] / img.size[1])), size[1]),
-                Image.ANTIALIAS)
-        # Crop in the top, middle or bottom
-        if crop_type == 'top':
-            box = (0, 0, size[0], img.size[1])
-        elif crop_type == 'middle':
-            box = (int(round((img.size[0] - size[0]) / 2)), 0,
-                   int(round((img.size[0] + size[0]) / 2)), img.size[1])
-        elif crop_type == 'bottom':
-            box = (img.size[0] - size[0], 0, img.size[0], img.size[1])
-        else :
-            raise ValueError('ERROR: invalid value for crop_type')
-        img = img.crop(box)
-    else :
-        img = img.resize((size[0], size[1]),
-                Image.ANTIALIAS)
-        # If the scale is the same, we do not need to crop
-    img.save(modified_path)
\ No newline at end of file
+    save_image(img, modified_path, profile, format, source_info)
+
+
+def image_dimensions(path):
+    """
+    Return the `(width, height)` of a JPEG, PNG, GIF or WebP file by parsing
+    its header, without decoding any pixels.
+
+    Returns None when the format is not recognised or the header is
+    truncated; `Image.open(path).size` is the fallback for those.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(30)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            if len(head) >= 24:
+                return struct.unpack('>II', head[16:24])
+            return None
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            if len(head) >= 10:
+                return struct.unpack('<HH', head[6:10])
+            return None
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return _webp_dimensions(head)
+        if head[:2] == b'\xff\xd8':
+            f.seek(2)
+            return _jpeg_dimensions(f)
+    return None
+
+
+def _webp_dimensions(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and len(head) >= 30:
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L' and len(head) >= 25:
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X' and len(head) >= 30:
+        width = struct.unpack('<I', head[24:27] + b'\x00')[0]
+        height = struct.unpack('<I', head[27:30] + b'\x00')[0]
+        return width + 1, height + 1
+    return None
+
+
+def _jpeg_dimensions(f):
+    # walk the segment headers, seeking over their payloads
+    while True:
+        byte = f.read(1)
+        if byte != b'\xff':
+            return None
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = ord(byte)
+        if marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            continue
+        if marker in (0xd9, 0xda):
+            # end of image or start of scan before any frame header
+            return None
+        data = f.read(2)
+        if len(data) < 2:
+            return None
+        length = struct.unpack('>H', data)[0]
+        if marker in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>xHH', data)
+            return width, height
+        f.seek(length - 2, 1)
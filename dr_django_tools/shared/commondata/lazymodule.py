@@ -0,0 +1,28 @@
+import importlib
+
+
+class LazyModule(object):
+    '''Stand-in for a module that is only imported on first attribute access,
+    so importing a module that depends on it stays cheap.
+    '''
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return '<LazyModule %s (%s)>' % (self.__dict__['_name'], state)
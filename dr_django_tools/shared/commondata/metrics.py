@@ -0,0 +1,245 @@
+'''Timers, counters and byte totals for the image fetch and resize paths.
+
+Measurements go to the sinks listed in ``settings.METRICS_SINKS``, each a
+dotted class path or a ``(dotted path, kwargs)`` pair, e.g.::
+
+    METRICS_SINKS = [
+        ('dr_django_tools.shared.commondata.metrics.StatsdSink',
+         {'host': 'stats.local', 'prefix': 'images.'}),
+    ]
+
+Sinks can also be added at runtime with ``add_sink``.  Without sinks every
+hook returns after a single check, so instrumented code runs at full speed.
+``METRICS_SINKS`` is not read while Django settings are not configured, so
+the instrumented helpers also work outside of a Django project.
+'''
+import functools
+import logging
+import socket
+import threading
+import time
+
+# wall clock with the best resolution available
+_clock = getattr(time, 'perf_counter', time.time)
+
+_sinks = None
+_lock = threading.Lock()
+
+
+def _load_sinks():
+    global _sinks
+    from django.conf import settings
+    if not settings.configured:
+        # read METRICS_SINKS once settings are there
+        return []
+    with _lock:
+        if _sinks is None:
+            from .utils import configured_item
+            sinks = []
+            for entry in getattr(settings, 'METRICS_SINKS', None) or ():
+                kwargs = {}
+                if isinstance(entry, (tuple, list)):
+                    entry, kwargs = entry
+                sink_class = configured_item('METRICS_SINKS', entry)
+                sinks.append(sink_class(**kwargs))
+            _sinks = sinks
+    return _sinks
+
+
+def sinks():
+    return _sinks if _sinks is not None else _load_sinks()
+
+
+def enabled():
+    return bool(_sinks if _sinks is not None else _load_sinks())
+
+
+def add_sink(sink):
+    global _sinks
+    current = sinks()
+    with _lock:
+        _sinks = current + [sink]
+    return sink
+
+
+def remove_sink(sink):
+    global _sinks
+    current = sinks()
+    with _lock:
+        _sinks = [x for x in current if x is not sink]
+
+
+def reset():
+    '''Forget all sinks; ``settings.METRICS_SINKS`` is read again on next
+    use.
+    '''
+    global _sinks
+    with _lock:
+        _sinks = None
+
+
+def timing(name, ms):
+    for sink in sinks():
+        sink.timing(name, ms)
+
+
+def incr(name, value=1):
+    for sink in sinks():
+        sink.count(name, value)
+
+
+def add_bytes(name, nbytes):
+    '''Add ``nbytes`` to the byte total ``name``.'''
+    for sink in sinks():
+        sink.count(name, nbytes)
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, name, sinks):
+        self.name = name
+        self.sinks = sinks
+
+    def __enter__(self):
+        self.start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        ms = (_clock() - self.start) * 1000.0
+        for sink in self.sinks:
+            sink.timing(self.name, ms)
+            if exc_type is not None:
+                sink.count(self.name + '.errors', 1)
+        return False
+
+
+def timer(name):
+    '''Context manager recording the time spent in its block as ``name``,
+    and a ``name.errors`` count when the block raises.
+    '''
+    current = _sinks if _sinks is not None else _load_sinks()
+    if not current:
+        return _null_timer
+    return _Timer(name, current)
+
+
+def timed(name):
+    '''Decorator recording the time spent in each call like ``timer``.'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            current = _sinks if _sinks is not None else _load_sinks()
+            if not current:
+                return func(*args, **kwargs)
+            with _Timer(name, current):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LoggingSink(object):
+    '''Writes every measurement to a logger.'''
+
+    def __init__(self, logger='dr_django_tools.metrics', level=logging.DEBUG):
+        self.logger = logging.getLogger(logger)
+        self.level = level
+
+    def timing(self, name, ms):
+        self.logger.log(self.level, '%s: %.2fms', name, ms)
+
+    def count(self, name, value):
+        self.logger.log(self.level, '%s: +%s', name, value)
+
+
+class StatsdSink(object):
+    '''Sends measurements to a statsd daemon over UDP.
+
+    Sending never blocks or raises; datagrams that can not be sent are
+    dropped like any lost UDP packet.
+    '''
+
+    def __init__(self, host='localhost', port=8125, prefix=''):
+        self.address = (socket.gethostbyname(host), port)
+        self.prefix = prefix
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def _send(self, data):
+        try:
+            self.sock.sendto(data.encode('utf8'), self.address)
+        except (socket.error, OSError):
+            pass
+
+    def timing(self, name, ms):
+        self._send('%s%s:%.3f|ms' % (self.prefix, name, ms))
+
+    def count(self, name, value):
+        self._send('%s%s:%s|c' % (self.prefix, name, value))
+
+
+class MemorySink(object):
+    '''Keeps every timing and count in memory, for tests and for reading
+    percentiles in a shell while tuning worker counts.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = {}
+            self.counts = {}
+
+    def timing(self, name, ms):
+        with self._lock:
+            self.timings.setdefault(name, []).append(ms)
+
+    def count(self, name, value):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def percentile(self, name, p):
+        '''The ``p``-th percentile (nearest rank) of the timings of ``name``
+        in milliseconds, None without timings.
+        '''
+        with self._lock:
+            values = sorted(self.timings.get(name, ()))
+        return _nearest_rank(values, p)
+
+    def summary(self, name):
+        with self._lock:
+            values = sorted(self.timings.get(name, ()))
+        if not values:
+            return None
+        return {
+            'count': len(values),
+            'total': sum(values),
+            'min': values[0],
+            'max': values[-1],
+            'p50': _nearest_rank(values, 50),
+            'p95': _nearest_rank(values, 95),
+            'p99': _nearest_rank(values, 99),
+        }
+
+    def summaries(self):
+        return dict((name, self.summary(name)) for name in list(self.timings))
+
+
+def _nearest_rank(values, p):
+    if not values:
+        return None
+    rank = int(-(-len(values) * p // 100))  # ceil without floats
+    return values[min(max(rank, 1), len(values)) - 1]
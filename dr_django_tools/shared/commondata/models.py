@@ -1,21 +1,31 @@
-import os
-from django.db import models
+import errno
+import functools
+import importlib
+import io
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.core.exceptions import ImproperlyConfigured
 
 try:
     from cities import models as cities_models
 except ImportError:
-    pass
+    cities_models = None
 
 from lazy import lazy
-from PIL import Image
 from django.conf import settings
 
+from .lazymodule import LazyModule
+
 try:
     from django.contrib.gis.db import models as gis_models
-except ImportError:
+except (ImportError, ImproperlyConfigured):
+    # GeoDjango raises ImproperlyConfigured when GDAL is not installed
     pass
 
 from .utils import (image_path,
+                                             configured_item,
+                                             temp_grab,
+                                             invalidate_locations,
                                              unique_slugify,
                                              update_image,
                                              THUMBNAIL_DIMS,
@@ -30,7 +40,14 @@ from .utils import (image_path,
                                              IMAGE_TYPE_ACTIVITIES,
                                              IMAGE_TYPE_AMENITIES
                     )
-from .image_utils import resize_and_crop
+from .image_utils import resize_and_crop, image_dimensions, profile_key
+from . import image_store
+from . import metrics
+from .profiling import profiled
+from .image_storage import get_storage
+from .slugs import resource_slugbase, slug_base, slug_bases
+
+Image = LazyModule('PIL.Image')
 
 LOCATION_TYPES = (
     ('city', 'City'),
@@ -39,9 +56,16 @@ LOCATION_TYPES = (
 )
 DEFAULT_LOCATION_TYPE = LOCATION_TYPES[0][0]
 
+if cities_models is not None:
+    # cached get_location results go stale when any of these change
+    for _model in (cities_models.Country, cities_models.Region,
+                   cities_models.City):
+        for _signal in (post_save, post_delete):
+            _signal.connect(invalidate_locations, sender=_model,
+                            dispatch_uid='commondata.invalidate_locations')
+
 slug_templates = settings.SLUG_TEMPLATES
 image_slug_templates =  settings.IMAGE_SLUG_TEMPLATES
-resource_slugbase = settings.RESOURCE_SLUG_BASE
 
 
 class LocationAware(models.Model):
@@ -51,6 +75,7 @@ class LocationAware(models.Model):
                                      default=DEFAULT_LOCATION_TYPE)
 
     @property
+    @profiled('location')
     def location(self):
         if self.location_type == 'country':
             model_class = cities_models.Country
@@ -65,19 +90,70 @@ class LocationAware(models.Model):
         abstract = True
 
 
+_image_classes = {}
+
+
+def resolve_image_class(resource_class):
+    '''Return the image model of a resource model, the ``<ClassName>Image``
+    class found in one of the ``settings.IMAGE_MODELS`` modules.  The result
+    is kept per resource class so the discovery happens once per process.
+    '''
+    try:
+        return _image_classes[resource_class]
+    except KeyError:
+        pass
+
+    name = resource_class.__name__ + 'Image'
+    for pkg in settings.IMAGE_MODELS:
+        try:
+            module = importlib.import_module(pkg)
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                'IMAGE_MODELS entry %r could not be imported: %s' % (pkg, e))
+        image_class = getattr(module, name, None)
+        if image_class is not None:
+            _image_classes[resource_class] = image_class
+            return image_class
+
+    raise ImproperlyConfigured('%s has no image model: %s was not found in '
+                               'any of the IMAGE_MODELS modules (%s)'
+                               % (resource_class.__name__, name,
+                                  ', '.join(settings.IMAGE_MODELS)))
+
+
+def register_image_classes():
+    '''Resolve the image model of every installed ``SelectedPhotoAware``
+    model.  Call from an ``AppConfig.ready()`` so misconfiguration fails at
+    startup instead of on the first page that shows a photo.
+    '''
+    from django.apps import apps
+    for model in apps.get_models():
+        if issubclass(model, SelectedPhotoAware):
+            resolve_image_class(model)
+
+
+def prewarm_hooks():
+    '''Resolve every settings-driven hook and image model now: the storage
+    backends, metrics sinks, ``RESOURCE_SLUG_BASE`` and, through
+    ``register_image_classes``, the ``IMAGE_MODELS`` classes.  Call from an
+    ``AppConfig.ready()`` so misconfiguration fails at startup and the first
+    requests do not pay for the imports.
+    '''
+    configured_item('RESOURCE_SLUG_BASE', settings.RESOURCE_SLUG_BASE)
+    get_storage()
+    get_storage(thumbnail=True)
+    metrics.sinks()
+    register_image_classes()
+
+
 class SelectedPhotoAware(object):
 
-    @lazy
+    @property
     def image_class(self):
-        for pkg in settings.IMAGE_MODELS:
-            try:
-                module = __import__(pkg, globals(), locals(),[self.__class__.__name__+'Image'])
-                if hasattr(module, self.__class__.__name__+'Image'):
-                    return getattr(module, self.__class__.__name__+'Image')
-            except Exception:
-                pass
+        return resolve_image_class(self.__class__)
 
     @property
+    @profiled('selected_photo')
     def selected_photo(self):
         for image_type in (IMAGE_TYPE_SELECTED_THUMB,
                            IMAGE_TYPE_GENERAL,
@@ -153,8 +229,16 @@ except NameError:
 
 def save_resource(obj):
     if not obj.slug:
-        slugbase = resource_slugbase(obj)
-        unique_slugify(obj, slugbase)
+        unique_slugify(obj, slug_base(obj))
+
+
+def setup_resource_slugs(objects):
+    '''Give every resource in ``objects`` without a slug one, like
+    ``save_resource`` but with the slug bases rendered by ``slug_bases``.
+    '''
+    objects = [obj for obj in objects if not obj.slug]
+    for obj, base in zip(objects, slug_bases(objects)):
+        unique_slugify(obj, base)
 
 
 class Resource(MetaAware, SelectedPhotoAware):
@@ -235,6 +319,7 @@ class Resizeable(object):
 
         return self._generate(width, height)
 
+    @metrics.timed('resizeable.generate')
     def _generate(self, width, height):
         parent = self.parent
         new_image = parent.__class__(resource=parent.resource,
@@ -244,33 +329,87 @@ class Resizeable(object):
                                      width=width,
                                      height=height)
         new_image.save()
-        resource_type = parent.resource.__class__.__name__.lower()
-        source = parent.file_path
-        target = image_path(resource_type, new_image.id)
-
-        d = os.path.dirname(target)
-        if not os.path.exists(d):
-            os.makedirs(d)
-
-        resize_and_crop(source, target, (width, height))
+        render_image(binary_source(parent), new_image, (width, height),
+                     'resized')
         new_image.save()
 
         return new_image
 
 
+def is_thumbnail(image):
+    '''Whether ``image`` is the thumbnail made by ``ensure_thumbnail``; the
+    renditions of ``Resizeable`` share its image type but have a parent.
+    '''
+    return getattr(image, 'image_type', None) == IMAGE_TYPE_PHOTO_THUMB and \
+        getattr(image, 'parent_id', None) is None
+
+
+def image_storage(image):
+    '''Return the storage backend holding the binary of ``image``.'''
+    return get_storage(thumbnail=is_thumbnail(image))
+
+
+def storage_name(image):
+    return image_path(image.resource.__class__.__name__.lower(), image.id,
+                      full=False)
+
+
+def binary_source(image):
+    '''Return something ``Image.open`` can read the binary of ``image``
+    from: its path, or a file object for storage without files.
+    '''
+    storage = image_storage(image)
+    if storage.local:
+        return storage.path(storage_name(image))
+    return storage.open(storage_name(image))
+
+
+def render_image(source, image, size, profile=None):
+    '''Resize and crop ``source`` into the binary of ``image`` with encoder
+    ``profile``, reusing an existing rendition of identical content when
+    content addressed storage is on.
+    '''
+    storage = image_storage(image)
+    name = storage_name(image)
+    if not storage.local:
+        buf = io.BytesIO()
+        resize_and_crop(source, buf, size, profile=profile)
+        storage.save(name, buf.getvalue())
+        return
+
+    target = storage.prepare(name)
+    if image_store.enabled():
+        image_store.render(source, target, size,
+                           functools.partial(resize_and_crop,
+                                             profile=profile),
+                           variant='-' + profile_key(profile))
+    else:
+        resize_and_crop(source, target, size, profile=profile)
+
+
 def update_binary(image, url, force=False, generate_thumbnail=False):
-    resource_type = image.resource.__class__.__name__.lower()
-    if not os.path.exists(image.file_path) or force:
-        update_image(resource_type, image, url)
+    storage = image_storage(image)
+    if force or not storage.exists(storage_name(image)):
+        if storage.local:
+            resource_type = image.resource.__class__.__name__.lower()
+            update_image(resource_type, image, url)
+        else:
+            with temp_grab(url) as filename:
+                with open(filename, 'rb') as f:
+                    storage.save(storage_name(image), f.read())
     if generate_thumbnail:
         image.ensure_thumbnail()
 
 
 def file_path(image):
-    source = image_path(type_=image.resource.__class__.__name__.lower(), id=image.id)
-    return source
+    '''Return the path of a file holding the binary of ``image``; for
+    storage without files this extracts it to a bounded cache, readers
+    should use ``binary_source`` instead.
+    '''
+    return image_storage(image).local_path(storage_name(image))
 
 
+@metrics.timed('ensure_thumbnail')
 def ensure_thumbnail(image):
     if image.thumbnail is not None:
         return
@@ -284,17 +423,8 @@ def ensure_thumbnail(image):
 
     unique_slugify(new_image, image.slug)
     new_image.save()
-    resource_type = image.resource.__class__.__name__.lower()
-    source = image.file_path
-    target = image_path(resource_type, new_image.id)
-
-    d = os.path.dirname(target)
-    if not os.path.exists(d):
-        os.makedirs(d)
-
-    resize_and_crop(source,
-                    target,
-                    THUMBNAIL_DIMS)
+    render_image(binary_source(image), new_image, THUMBNAIL_DIMS,
+                 'thumbnail')
 
 
 class BaseImage(models.Model):
@@ -327,6 +457,7 @@ class BaseImage(models.Model):
         return alt or ''
 
     @property
+    @profiled('thumbnail')
     def thumbnail(self):
         try:
             image = self.__class__.objects.get(
@@ -348,7 +479,7 @@ class BaseImage(models.Model):
 
     @property
     def binary_exists(self):
-        return os.path.exists(self.file_path)
+        return image_storage(self).exists(storage_name(self))
 
     @property
     def file_path(self):
@@ -358,8 +489,7 @@ class BaseImage(models.Model):
         update_binary(self, url, force, generate_thumbnail)
 
     def remove(self):
-        if self.binary_exists:
-            os.remove(self.file_path)
+        image_storage(self).delete(storage_name(self))
         self.delete()
 
     def save(self):
@@ -369,16 +499,97 @@ class BaseImage(models.Model):
         super(BaseImage, self).save()
 
 
+def probe_image_dims(path):
+    dims = image_dimensions(path)
+    if dims is None:
+        dims = Image.open(path).size
+    return dims
+
+
+@metrics.timed('setup_image_dims')
 def setup_image_dims(image):
-    if image.binary_exists:
-        im = Image.open(image.file_path)
-        image.width, image.height = im.size
+    storage = image_storage(image)
+    if not storage.local:
+        if storage.exists(storage_name(image)):
+            im = Image.open(storage.open(storage_name(image)))
+            image.width, image.height = im.size
+        return
+    try:
+        dims = probe_image_dims(image.file_path)
+    except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return
+    image.width, image.height = dims
+
+
+def _probe_existing(path):
+    if path is None:
+        return None
+    try:
+        return probe_image_dims(path)
+    except (IOError, OSError):
+        return None
 
 
+def update_image_dims(images, workers=8, batch_size=500):
+    '''Probe the binaries of many images on a thread pool and write changed
+    width/height values back in bulk.  Images without a (readable) binary
+    are skipped.  Returns the list of updated images.
+    '''
+    from multiprocessing.pool import ThreadPool
+
+    images = list(images)
+    if not images:
+        return []
+    image_class = images[0].__class__
+    resource_field = image_class._meta.get_field('resource')
+    resource_class = getattr(resource_field, 'related_model', None) or \
+        resource_field.rel.to
+    # the resource class comes from the field so no resource is fetched
+    resource_type = resource_class.__name__.lower()
+    paths = []
+    for image in images:
+        storage = image_storage(image)
+        name = image_path(resource_type, image.id, full=False)
+        # binaries without a file of their own are left alone
+        paths.append(storage.path(name) if storage.local else None)
+
+    pool = ThreadPool(workers)
+    try:
+        dims = pool.map(_probe_existing, paths)
+    finally:
+        pool.close()
+        pool.join()
+
+    changed = []
+    for image, d in zip(images, dims):
+        if d is not None and (image.width, image.height) != tuple(d):
+            image.width, image.height = d
+            changed.append(image)
+
+    if hasattr(image_class.objects, 'bulk_update'):
+        image_class.objects.bulk_update(changed, ['width', 'height'],
+                                        batch_size=batch_size)
+    else:
+        with transaction.atomic():
+            for image in changed:
+                image_class.objects.filter(pk=image.pk).update(
+                    width=image.width, height=image.height)
+    return changed
+
+
+@metrics.timed('setup_image_slug')
 def setup_image_slug(image):
-    if not image.slug: 
-        slugbase = resource_slugbase(obj=image, additional_context={
-            'resource_name': getattr(image.resource, 'name', ''),
-            'image_description': getattr(image, 'description', '') or '',
-        })
-        unique_slugify(image, slugbase)
+    if not image.slug:
+        unique_slugify(image, slug_base(image, image=True))
+
+
+@metrics.timed('setup_image_slugs')
+def setup_image_slugs(images):
+    '''``setup_image_slug`` for many images of one model; their resources
+    are fetched with one query.
+    '''
+    images = [image for image in images if not image.slug]
+    for image, base in zip(images, slug_bases(images, image=True)):
+        unique_slugify(image, base)
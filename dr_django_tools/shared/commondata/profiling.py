@@ -0,0 +1,226 @@
+'''Attribute database queries and wall time to the model mixin properties.
+
+Properties that hit the database (``selected_photo``, ``thumbnail``,
+``location``, ``Location.item`` ...) are labelled with ``profiled``.  While a
+``Profile`` is active in the thread every labelled call adds its queries and
+time to the profile::
+
+    with Profile() as profile:
+        render_listing()
+    profile.report()
+    # ['total: 61 queries, 48.0ms',
+    #  'selected_photo: 48 queries, 31.2ms (12 calls)', ...]
+
+``query_budget`` fails a test when a block, or a label in it, runs more
+queries than allowed.  ``QueryProfileMiddleware`` logs the report of every
+request when ``settings.QUERY_PROFILE`` is true.
+
+Queries are counted from the connection's query log, which is kept while a
+profile is active even with ``DEBUG`` off and is not reset by requests made
+in the block, e.g. through the test client; the log holds the last 9000
+queries, so longer blocks are under counted.  Without an active profile a
+labelled call costs one thread local lookup.
+'''
+import contextlib
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections, reset_queries
+
+logger = logging.getLogger('dr_django_tools.profiling')
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class LabelStats(object):
+    __slots__ = ('calls', 'queries', 'ms')
+
+    def __init__(self):
+        self.calls = 0
+        self.queries = 0
+        self.ms = 0.0
+
+
+class Profile(object):
+    '''Queries and wall time of a block, in total and per label.'''
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.connection = connections[using]
+        self.stats = OrderedDict()
+        self.queries = 0
+        self.ms = 0.0
+        self._depth = {}
+
+    def _query_count(self):
+        return len(self.connection.queries_log)
+
+    def __enter__(self):
+        self._force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        # like CaptureQueriesContext: a request would clear the query log
+        self._reconnect = request_started.disconnect(reset_queries)
+        self._start = (self._query_count(), _clock())
+        profiles = getattr(_local, 'profiles', None)
+        _local.profiles = (profiles or ()) + (self,)
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.profiles = _local.profiles[:-1]
+        queries, start = self._start
+        self.queries = self._query_count() - queries
+        self.ms = (_clock() - start) * 1000.0
+        self.connection.force_debug_cursor = self._force_debug_cursor
+        if self._reconnect:
+            request_started.connect(reset_queries)
+        return False
+
+    def _begin(self, label):
+        # only the outermost call of a recursive label is counted
+        depth = self._depth.get(label, 0)
+        self._depth[label] = depth + 1
+        if depth:
+            return None
+        return self._query_count(), _clock()
+
+    def _end(self, label, start):
+        self._depth[label] -= 1
+        if start is None:
+            return
+        stats = self.stats.get(label)
+        if stats is None:
+            stats = self.stats[label] = LabelStats()
+        stats.calls += 1
+        stats.queries += self._query_count() - start[0]
+        stats.ms += (_clock() - start[1]) * 1000.0
+
+    def report(self):
+        '''One line for the whole block, then one per label, most queries
+        first.
+        '''
+        lines = ['total: %i queries, %.1fms' % (self.queries, self.ms)]
+        labels = sorted(self.stats.items(), key=lambda x: -x[1].queries)
+        for label, stats in labels:
+            lines.append('%s: %i queries, %.1fms (%i calls)'
+                         % (label, stats.queries, stats.ms, stats.calls))
+        return lines
+
+    def check(self, max_queries=None, **label_budgets):
+        '''Raise ``QueryBudgetExceeded`` when the block ran more than
+        ``max_queries`` queries, or a label more than its budget in
+        ``label_budgets``.
+        '''
+        over = []
+        if max_queries is not None and self.queries > max_queries:
+            over.append('total: %i queries, budget %i'
+                        % (self.queries, max_queries))
+        for label, budget in sorted(label_budgets.items()):
+            stats = self.stats.get(label)
+            if stats is not None and stats.queries > budget:
+                over.append('%s: %i queries, budget %i'
+                            % (label, stats.queries, budget))
+        if over:
+            raise QueryBudgetExceeded('Query budget exceeded (%s)\n%s'
+                                      % ('; '.join(over),
+                                         '\n'.join(self.report())))
+
+
+class _Section(object):
+
+    def __init__(self, label, profiles):
+        self.label = label
+        self.profiles = profiles
+
+    def __enter__(self):
+        self.starts = [p._begin(self.label) for p in self.profiles]
+        return self
+
+    def __exit__(self, *exc_info):
+        for profile, start in zip(self.profiles, self.starts):
+            profile._end(self.label, start)
+        return False
+
+
+class _NullSection(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_section = _NullSection()
+
+
+def section(label):
+    '''Context manager adding its block to ``label`` in the active
+    profiles.
+    '''
+    profiles = getattr(_local, 'profiles', None)
+    if not profiles:
+        return _null_section
+    return _Section(label, profiles)
+
+
+def profiled(label):
+    '''Decorator adding every call to ``label`` in the active profiles.
+    Put it below ``@property`` to label a property.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiles = getattr(_local, 'profiles', None)
+            if not profiles:
+                return func(*args, **kwargs)
+            with _Section(label, profiles):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def query_budget(max_queries=None, using=DEFAULT_DB_ALIAS, **label_budgets):
+    '''Profile the block and raise ``QueryBudgetExceeded`` when it exceeds
+    the budgets, see ``Profile.check``::
+
+        with query_budget(10, selected_photo=2):
+            self.client.get('/hotels/')
+    '''
+    with Profile(using) as profile:
+        yield profile
+    profile.check(max_queries, **label_budgets)
+
+
+class QueryProfileMiddleware(object):
+    '''Log the profile of every request when ``settings.QUERY_PROFILE`` is
+    true; requests over ``settings.QUERY_PROFILE_BUDGET`` queries are logged
+    as warnings.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_PROFILE', False):
+            return self.get_response(request)
+
+        with Profile() as profile:
+            response = self.get_response(request)
+        budget = getattr(settings, 'QUERY_PROFILE_BUDGET', None)
+        level = logging.DEBUG
+        if budget is not None and profile.queries > budget:
+            level = logging.WARNING
+        logger.log(level, '%s %s\n%s', request.method, request.path,
+                   '\n'.join(profile.report()))
+        return response
@@ -0,0 +1,197 @@
+'''Slug bases of resources and images.
+
+Slug bases come from the ``settings.RESOURCE_SLUG_BASE`` hook.  With
+``settings.COMPILED_SLUG_TEMPLATES`` on, models listed in
+``settings.SLUG_TEMPLATES`` or ``settings.IMAGE_SLUG_TEMPLATES`` skip the hook
+and render their template here instead.  Those settings then map a model
+class name, or ``'app_label.ModelName'``, to a template in this syntax::
+
+    SLUG_TEMPLATES = {'Hotel': '{name} {destination.name}'}
+    IMAGE_SLUG_TEMPLATES = {'HotelImage': '{resource_name} {description}'}
+
+Fields are attribute paths on the object, ``str.format`` style or
+``%(path)s``; image templates can also use the ``resource_name`` and
+``image_description`` context keys.  Missing attributes and None render
+empty.  A template is compiled once per model class; models without one
+still use the hook.
+
+``slug_bases`` renders many objects of one model and fetches the related
+objects their templates use with one query per relation.
+'''
+import operator
+import re
+import string
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.core.signals import setting_changed
+from django.db.models import prefetch_related_objects
+from django.utils.encoding import force_text
+
+from .utils import configured_item
+
+IMAGE_CONTEXT_KEYS = frozenset(['resource_name', 'image_description'])
+
+_PERCENT_FIELD = re.compile(r'%\((\w+(?:\.\w+)*)\)')
+
+
+def resource_slugbase(*args, **kwargs):
+    '''Call ``settings.RESOURCE_SLUG_BASE``, a callable or its dotted path.'''
+    hook = configured_item('RESOURCE_SLUG_BASE', settings.RESOURCE_SLUG_BASE)
+    return hook(*args, **kwargs)
+
+
+def image_slug_context(image):
+    return {
+        'resource_name': getattr(image.resource, 'name', ''),
+        'image_description': getattr(image, 'description', '') or '',
+    }
+
+
+def _resolver(field):
+    head, _, rest = field.partition('.')
+    full = operator.attrgetter(field)
+    tail = operator.attrgetter(rest) if rest else None
+
+    def resolve(obj, context):
+        try:
+            if context is not None and head in context:
+                value = context[head]
+                if tail is not None:
+                    value = tail(value)
+            else:
+                value = full(obj)
+        except (AttributeError, ObjectDoesNotExist):
+            return u''
+        return u'' if value is None else force_text(value)
+    return resolve
+
+
+class SlugTemplate(object):
+    '''A slug template compiled into a formatter and one attribute getter
+    per field.
+    '''
+
+    def __init__(self, template):
+        self.template = template
+        template = force_text(template)
+        fields = []
+        if _PERCENT_FIELD.search(template):
+            fields = _PERCENT_FIELD.findall(template)
+            self._percent = template
+        else:
+            parts = []
+            for literal, field, spec, conversion in \
+                    string.Formatter().parse(template):
+                parts.append(literal.replace(u'{', u'{{').replace(u'}', u'}}'))
+                if field is None:
+                    continue
+                parts.append(u'{%i%s%s}' % (len(fields),
+                                            u'!' + conversion if conversion
+                                            else u'',
+                                            u':' + spec if spec else u''))
+                fields.append(field)
+            self._percent = None
+            self._format = u''.join(parts).format
+        self.fields = tuple(fields)
+        self._resolvers = [_resolver(field) for field in fields]
+        self.uses_context = any(field.partition('.')[0] in IMAGE_CONTEXT_KEYS
+                                for field in fields)
+
+    def render(self, obj, context=None):
+        values = [resolve(obj, context) for resolve in self._resolvers]
+        if self._percent is not None:
+            return self._percent % dict(zip(self.fields, values))
+        return self._format(*values)
+
+    def relations(self, model):
+        '''Lookup paths of the related objects the fields go through.'''
+        paths = set()
+        for field in self.fields:
+            path = _relation_path(model, field.split('.')[:-1])
+            if path:
+                paths.add(path)
+        return paths
+
+
+def _relation_path(model, names):
+    path = []
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            break
+        if not (field.many_to_one or field.one_to_one):
+            break
+        path.append(name)
+        model = field.related_model
+    return '__'.join(path)
+
+
+_templates = {}
+
+
+def slug_template(model, image=False):
+    '''The compiled template of ``model``, None when it has none or
+    ``settings.COMPILED_SLUG_TEMPLATES`` is off.
+    '''
+    key = (model, image)
+    try:
+        return _templates[key]
+    except KeyError:
+        pass
+    templates = {}
+    if getattr(settings, 'COMPILED_SLUG_TEMPLATES', False):
+        setting = 'IMAGE_SLUG_TEMPLATES' if image else 'SLUG_TEMPLATES'
+        templates = getattr(settings, setting, None) or {}
+    template = templates.get(model._meta.label, templates.get(model.__name__))
+    if template is not None:
+        template = SlugTemplate(template)
+    _templates[key] = template
+    return template
+
+
+def _clear_templates(setting, **kwargs):
+    if setting in ('COMPILED_SLUG_TEMPLATES', 'SLUG_TEMPLATES',
+                   'IMAGE_SLUG_TEMPLATES'):
+        _templates.clear()
+
+
+setting_changed.connect(_clear_templates)
+
+
+def _render(obj, image, template):
+    context = None
+    if image and (template is None or template.uses_context):
+        context = image_slug_context(obj)
+    if template is not None:
+        return template.render(obj, context)
+    if image:
+        return resource_slugbase(obj=obj, additional_context=context)
+    return resource_slugbase(obj)
+
+
+def slug_base(obj, image=False):
+    '''The text the slug of ``obj``, a resource or with ``image`` an
+    image, is made from.
+    '''
+    return _render(obj, image, slug_template(obj.__class__, image))
+
+
+def slug_bases(objects, image=False):
+    '''``slug_base`` of every object in ``objects``, all of one model, with
+    the related objects the template uses (and the resource of images)
+    prefetched.
+    '''
+    objects = list(objects)
+    if not objects:
+        return []
+    model = objects[0].__class__
+    template = slug_template(model, image)
+    paths = template.relations(model) if template is not None else set()
+    if image and (template is None or template.uses_context) and \
+            _relation_path(model, ['resource']):
+        paths.add('resource')
+    if paths:
+        prefetch_related_objects(objects, *sorted(paths))
+    return [_render(obj, image, template) for obj in objects]
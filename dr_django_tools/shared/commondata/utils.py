@@ -1,21 +1,52 @@
+import contextlib
+import hashlib
+import mmap
+import shutil
 import tempfile
-from urlparse import urlparse
+try:
+    from urlparse import urlparse
+except ImportError:
+    # python 3, for the asyncio helpers in aio
+    from urllib.parse import urlparse
 import math
 import fnmatch
 import os
 import importlib
 import time
 import datetime
-from HTMLParser import HTMLParser
-
-import requests
-from pycountry import countries
-from fuzzywuzzy import process
-import ftputil
-from unidecode import unidecode
-from PIL import Image
+import threading
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from HTMLParser import HTMLParser
+except ImportError:
+    from html.parser import HTMLParser
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
 from django.conf import settings
-from django.core.urlresolvers import reverse
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import SimpleLazyObject
+
+from .lazymodule import LazyModule
+from . import image_store
+from . import metrics
+from .profiling import profiled
+from .image_storage import ensure_dir
+from .image_utils import save_image, resample_filter
+
+# heavy dependencies are imported on first use
+requests = LazyModule('requests')
+pycountry = LazyModule('pycountry')
+process = LazyModule('fuzzywuzzy.process')
+ftputil = LazyModule('ftputil')
+_unidecode = LazyModule('unidecode')
+Image = LazyModule('PIL.Image')
 
 
 THUMBNAIL_DIMS = (120, 70)  # preferred width/height of thumbnails
@@ -48,30 +79,146 @@ def td2HHMMSSstr(td):
     return tdstr
 
 
+# bytes a fetched url is kept in memory before it spills to disk
+FETCH_SPOOL_SIZE = 8 * 1024 * 1024
+FETCH_CHUNK_SIZE = 64 * 1024
+
+
 def fetchfile(source):
     '''Return an open file object.  If the source contains a url then the
-    requests library is used to download the content and store as a
-    temporary file and return that temporary file.
+    requests library is used to stream the content into a named temporary
+    file, which is removed when the returned file is closed.
     '''
 
     if '://' in source:
-        ignored, filename = tempfile.mkstemp()
-        with open(filename, 'wb') as f:
-            r = requests.get(source)
-            f.write(r.content)
-        return open(filename, 'rb')
+        f = tempfile.NamedTemporaryFile()
+        try:
+            _stream_to(source, f)
+        except BaseException:
+            f.close()
+            raise
+        f.seek(0)
+        return f
 
     return open(source, 'rb')
 
 
+@contextlib.contextmanager
+def fetched(source, max_size=None, verify=True):
+    '''Context manager yielding a file object with the content of
+    ``source``, a local path or a url.  A url is streamed into a spooled
+    temporary file, held in memory up to ``max_size`` bytes (default
+    ``FETCH_SPOOL_SIZE``) and written to disk above that; with a
+    ``max_size`` of 0 it goes to disk right away.  The file is closed and
+    any temporary file removed on exit.
+    '''
+    if '://' not in source:
+        with open(source, 'rb') as f:
+            yield f
+        return
+
+    if max_size is None:
+        max_size = FETCH_SPOOL_SIZE
+    if max_size:
+        spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    else:
+        # a SpooledTemporaryFile never rolls over with a max_size of 0
+        spool = tempfile.TemporaryFile()
+    with spool as f:
+        _stream_to(source, f, verify)
+        f.seek(0)
+        yield f
+
+
+@contextlib.contextmanager
+def fetched_view(source, max_size=None, verify=True):
+    '''Context manager yielding the content of ``source`` as a read only
+    buffer: bytes when it fits in ``max_size``, otherwise a ``mmap`` of the
+    file it was spooled to, so large downloads are never copied into memory.
+    '''
+    with fetched(source, max_size, verify) as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(0)
+        if size == 0:
+            yield b''
+        elif size <= (FETCH_SPOOL_SIZE if max_size is None else max_size):
+            yield f.read()
+        else:
+            # make sure the content is in the file before it is mapped
+            if hasattr(f, 'rollover'):
+                f.rollover()
+            f.flush()
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield view
+            finally:
+                view.close()
+
+
+def _stream_to(url, f, verify=True):
+    with contextlib.closing(requests.get(url, stream=True,
+                                         verify=verify)) as res:
+        if res.status_code != 200:
+            raise IOError('Error (%s) while trying to remotely request: %s'
+                          % (res.status_code, url))
+        for chunk in res.iter_content(FETCH_CHUNK_SIZE):
+            f.write(chunk)
+
+
+MODULEITEM_CACHE_SIZE = 256
+
+_moduleitems = OrderedDict()
+_moduleitems_lock = threading.Lock()
+_missing = object()
+
+
 def moduleitem(dottedpath):
-    mname = '.'.join(dottedpath.split('.')[:-1])
-    itemname = dottedpath.split('.')[-1]
-    module_ = importlib.import_module(mname)
-    item = getattr(module_, itemname)
+    '''Return the object at ``dottedpath``, e.g. ``'package.module.Class'``.
+
+    Resolved paths are kept, up to ``MODULEITEM_CACHE_SIZE`` of them, so
+    hooks resolved on every call cost a dict lookup.  Raises ImportError
+    naming the path when the module can not be imported or lacks the item.
+    '''
+    item = _moduleitems.get(dottedpath, _missing)
+    if item is not _missing:
+        return item
+
+    mname, _, itemname = dottedpath.rpartition('.')
+    if not mname:
+        raise ImportError('%r is not a dotted path to a module item'
+                          % dottedpath)
+    try:
+        module_ = importlib.import_module(mname)
+    except ImportError as e:
+        raise ImportError('Could not import %r: %s' % (dottedpath, e))
+    try:
+        item = getattr(module_, itemname)
+    except AttributeError:
+        raise ImportError('Could not import %r: module %r has no item %r'
+                          % (dottedpath, mname, itemname))
+
+    with _moduleitems_lock:
+        _moduleitems[dottedpath] = item
+        while len(_moduleitems) > MODULEITEM_CACHE_SIZE:
+            _moduleitems.popitem(last=False)
     return item
 
 
+def configured_item(setting, value):
+    '''Resolve ``value`` of ``setting`` with ``moduleitem`` when it is a
+    dotted path; other values, like callables set directly, are returned as
+    they are.  Raises ImproperlyConfigured naming the setting when the path
+    does not resolve.
+    '''
+    if not isinstance(value, string_types):
+        return value
+    try:
+        return moduleitem(value)
+    except ImportError as e:
+        raise ImproperlyConfigured('%s: %s' % (setting, e))
+
+
 def image_path(type_, id, full=True):
     short = '%012i' % int(id)
     target = '%s/%s/%s/%s.jpg' % (type_, short[:4], short[4:8], short)
@@ -80,29 +227,185 @@ def image_path(type_, id, full=True):
     return target
 
 
+@metrics.timed('update_image')
 def update_image(type_, image, url, width=-1, height=-1):
     target = image_path(type_, image.id)
-    local = os.path.dirname(target)
-    if not os.path.exists(local):
-        os.makedirs(local)
-    headers = {
-    }
-    if os.path.exists(target):
-        updated = time.ctime(os.path.getmtime(target))
-        headers['If-Modified-Since'] = time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.strptime(updated))
+    ensure_dir(os.path.dirname(target))
     if width != -1:
         grab_and_scale(url, target, width, height)
     else:
         grab(url, target)
+    if image_store.enabled():
+        image_store.intern(target)
+
+
+# common names and spellings that differ from the ISO 3166 names
+COUNTRY_ALIASES = {
+    'usa': 'US',
+    'united states of america': 'US',
+    'america': 'US',
+    'uk': 'GB',
+    'great britain': 'GB',
+    'britain': 'GB',
+    'england': 'GB',
+    'scotland': 'GB',
+    'wales': 'GB',
+    'uae': 'AE',
+    'russia': 'RU',
+    'south korea': 'KR',
+    'north korea': 'KP',
+    'vietnam': 'VN',
+    'iran': 'IR',
+    'syria': 'SY',
+    'laos': 'LA',
+    'bolivia': 'BO',
+    'venezuela': 'VE',
+    'tanzania': 'TZ',
+    'moldova': 'MD',
+    'macedonia': 'MK',
+    'taiwan': 'TW',
+    'micronesia': 'FM',
+    'palestine': 'PS',
+    'vatican': 'VA',
+    'vatican city': 'VA',
+    'holland': 'NL',
+    'the netherlands': 'NL',
+    'burma': 'MM',
+    'ivory coast': 'CI',
+    'cape verde': 'CV',
+    'brunei': 'BN',
+    'the bahamas': 'BS',
+    'us virgin islands': 'VI',
+    'u.s. virgin islands': 'VI',
+    'british virgin islands': 'VG',
+    'saint martin': 'MF',
+    'sint maarten': 'SX',
+    'curacao': 'CW',
+}
+
+COUNTRY_CODE_CACHE_SIZE = 10000
+
+_country_index = None
+_country_code_cache = {}
+
+
+class _CountryIndex(object):
+    def __init__(self):
+        from fuzzywuzzy.utils import full_process
+        self.names = []
+        self.exact = {}
+        self.codes = {}
+        self.candidates = []
+        self.candidate_codes = {}
+        for country in pycountry.countries:
+            self.names.append(country.name)
+            self.codes[country.alpha2] = country.alpha2
+            self.codes[country.alpha3] = country.alpha2
+            for name in (country.name, getattr(country, 'official_name', None)):
+                if not name:
+                    continue
+                self.exact.setdefault(_normalize_country(name), country.alpha2)
+                if ', ' in name:
+                    # 'Korea, Republic of' -> 'Republic of Korea'
+                    head, tail = name.split(', ', 1)
+                    self.exact.setdefault(
+                        _normalize_country(tail + ' ' + head), country.alpha2)
+            candidate = full_process(country.name, force_ascii=True)
+            if candidate not in self.candidate_codes:
+                self.candidates.append(candidate)
+                self.candidate_codes[candidate] = country.alpha2
+        for alias, code in COUNTRY_ALIASES.items():
+            self.exact.setdefault(_normalize_country(alias), code)
+
+
+def _get_country_index():
+    global _country_index
+    if _country_index is None:
+        _country_index = _CountryIndex()
+    return _country_index
+
+
+def _normalize_country(name):
+    if isinstance(name, bytes):
+        name = name.decode('utf8')
+    name = _unidecode.unidecode(name).lower().replace('st. ', 'saint ')
+    return ' '.join(name.split())
+
+
+def _unprocessed(s):
+    return s
+
+
+def get_country_names():
+    return list(_get_country_index().names)
+
+
+# kept for importers of the old module attributes; filled on first use
+countries = SimpleLazyObject(lambda: pycountry.countries)
+country_names = SimpleLazyObject(lambda: _get_country_index().names)
+
+
+def lookup_country_code(name):
+    '''Return the ISO 3166 alpha2 code for a country name.  Exact names,
+    common aliases and ISO alpha2/alpha3 codes are looked up directly,
+    anything else is fuzzy matched against the country names.  Codes only
+    match when written in capitals ('CA', 'CAN'), so short names in lower
+    case are still fuzzy matched.
+    '''
+    try:
+        return _country_code_cache[name]
+    except KeyError:
+        pass
 
+    index = _get_country_index()
+    key = _normalize_country(name)
+    code = index.exact.get(key)
+    if code is None and len(key) in (2, 3) and name.strip().isupper():
+        code = index.codes.get(key.upper())
+    if code is None:
+        real_name = process.extractOne(name.replace('St. ', 'Saint '),
+                                       index.candidates,
+                                       processor=_unprocessed)
+        code = index.candidate_codes[real_name[0]]
 
-country_names = [x.name for x in countries]
+    if len(_country_code_cache) >= COUNTRY_CODE_CACHE_SIZE:
+        _country_code_cache.clear()
+    _country_code_cache[name] = code
+    return code
 
 
-def lookup_country_code(name):
-    name = name.replace('St. ', 'Saint ')
-    real_name = process.extractOne(name, country_names)
-    return countries.get(name=real_name[0]).alpha2
+XPATH_CACHE_SIZE = 512
+
+_xpath_cache = OrderedDict()
+_xpath_cache_lock = threading.Lock()
+
+
+def _namespace_key(namespaces):
+    if not namespaces:
+        return None
+    return tuple(sorted(namespaces.items()))
+
+
+def compile_xpath(xp, namespaces=None):
+    '''Return a compiled ``lxml.etree.XPath`` for the expression.  Compiled
+    expressions are cached per process, keyed by expression and namespaces,
+    up to ``XPATH_CACHE_SIZE`` of them; the oldest are dropped first.
+    '''
+    return _compiled_xpath(xp, namespaces, _namespace_key(namespaces))
+
+
+def _compiled_xpath(xp, namespaces, ns_key):
+    try:
+        return _xpath_cache[(xp, ns_key)]
+    except KeyError:
+        pass
+    from lxml import etree
+    compiled = etree.XPath(xp, namespaces=namespaces or None)
+    with _xpath_cache_lock:
+        _xpath_cache[(xp, ns_key)] = compiled
+        while len(_xpath_cache) > XPATH_CACHE_SIZE:
+            _xpath_cache.popitem(last=False)
+    return compiled
 
 
 class TreeHelper(object):
@@ -114,14 +417,15 @@ class TreeHelper(object):
         return self.tree.getroot()
 
     def xpath_single(self, xp):
-        if self.root.xpath(xp):
-            return self.root.xpath(xp)[0]
+        res = _compiled_xpath(xp, None, None)(self.root)
+        if res:
+            return res[0]
         else:
             return False
 
     def xpath_text(self, xp):
         node = self.xpath_single(xp)
-        if node != False:
+        if node is not False:
             return node.text
         else:
             return ''
@@ -134,13 +438,10 @@ class XMLNodeHelper(object):
     def __init__(self, node, namespaces=None):
         self.node = node
         self.namespaces = namespaces
+        self._ns_key = _namespace_key(namespaces)
 
     def xpath_single(self, xp):
-        if self.namespaces:
-            res = self.node.xpath(xp, namespaces=self.namespaces)
-        else:
-            res = self.node.xpath(xp)
-
+        res = self.xpath(xp)
         if len(res) == 0:
             return None
             
@@ -156,23 +457,83 @@ class XMLNodeHelper(object):
         el = self.xpath_single(xp)
         if el is None:
             return ''
-        if attr in el.attrib:
-            return el.attrib[attr]
-        return ''
+        return el.attrib.get(attr, '')
 
     def xpath(self, xp):
-        if self.namespaces:
-            return self.node.xpath(xp, namespaces=self.namespaces)
-        return self.node.xpath(xp)
+        return _compiled_xpath(xp, self.namespaces, self._ns_key)(self.node)
+
+
+def iter_xml_records(source, tag, namespaces=None):
+    '''Stream the ``tag`` elements of an XML feed, yielding an
+    ``XMLNodeHelper`` per record as soon as its end tag is parsed.  Each
+    record and the siblings before it are cleared once the caller moves on,
+    so memory stays flat regardless of feed size.
+
+    ``source`` is a path or an open file object, ``tag`` may be prefixed with
+    a namespace prefix from ``namespaces`` (``'v:property'``).
+    '''
+    from lxml import etree
+    tag = _clark_name(tag, namespaces)
+    for event, element in etree.iterparse(source, events=('end',), tag=tag):
+        yield XMLNodeHelper(element, namespaces)
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
 
+def _clark_name(tag, namespaces):
+    if ':' not in tag or tag.startswith('{'):
+        return tag
+    prefix, name = tag.split(':', 1)
+    return '{%s}%s' % ((namespaces or {})[prefix], name)
 
-def grab_to_temp(url, verify=True):
-    handle, filename = tempfile.mkstemp()
+
+def grab_to_temp(url, verify=True, suffix=''):
+    '''Download ``url`` to a new temporary file and return its name; the
+    caller removes it.  Prefer ``temp_grab`` which does that.
+    '''
+    handle, filename = tempfile.mkstemp(suffix=suffix)
     os.close(handle)
-    grab(url, filename, verify)
+    try:
+        grab(url, filename, verify)
+    except BaseException:
+        os.remove(filename)
+        raise
     return filename
 
 
+@contextlib.contextmanager
+def temp_grab(url, verify=True, suffix=''):
+    '''Context manager yielding the name of a temporary file holding the
+    content of ``url``, removed on exit.
+    '''
+    filename = grab_to_temp(url, verify, suffix)
+    try:
+        yield filename
+    finally:
+        _remove_quietly(filename)
+
+
+def _remove_quietly(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def conditional_headers(target):
+    '''Request headers to only download ``url`` again when it changed after
+    ``target`` was written.
+    '''
+    headers = {}
+    if os.path.exists(target) and os.path.getsize(target) > 0:
+        updated = time.ctime(os.path.getmtime(target))
+        headers['If-Modified-Since'] = time.strftime(
+            '%a, %d %b %Y %H:%M:%S +0000', time.strptime(updated))
+    return headers
+
+
+@metrics.timed('grab')
 def grab(url, target, verify=True):
     if url.startswith('ftp://'):
         # handle ftp download
@@ -187,50 +548,61 @@ def grab(url, target, verify=True):
             username, password = pieces[0].split(':')
             parts.append(username)
             parts.append(password)
-        ftp = ftputil.FTPHost(*parts)
-        for filename in ftp.listdir('.'):
-            if not fnmatch.fnmatch(filename, path):
-                continue
-            ftp.download(filename, target)
+        with ftputil.FTPHost(*parts) as ftp:
+            for filename in ftp.listdir('.'):
+                if not fnmatch.fnmatch(filename, path):
+                    continue
+                _detach(target)
+                ftp.download(filename, target)
+                _count_grabbed(target)
         return
 
-    headers = {}
-    if os.path.exists(target) and os.path.getsize(target) > 0:
-        updated = time.ctime(os.path.getmtime(target))
-        headers['If-Modified-Since'] = time.strftime(
-            '%a, %d %b %Y %H:%M:%S +0000', time.strptime(updated))
-
     if url.startswith('http'):
-        res = requests.get(url, headers=headers, stream=True, verify=verify)
-        if res.status_code == 200:
-            with open(target, 'wb') as f:
-                for chunk in res.iter_content(2048):
-                    f.write(chunk)
-        elif res.status_code != 304:
-            raise IOError('Error (%s) while trying to remotely request: %s'
-                          % (res.status_code, url))
+        res = requests.get(url, headers=conditional_headers(target),
+                           stream=True, verify=verify)
+        with contextlib.closing(res):
+            if res.status_code == 200:
+                _detach(target)
+                with open(target, 'wb') as f:
+                    for chunk in res.iter_content(FETCH_CHUNK_SIZE):
+                        f.write(chunk)
+                _count_grabbed(target)
+            elif res.status_code != 304:
+                raise IOError('Error (%s) while trying to remotely request: %s'
+                              % (res.status_code, url))
     else:
         res = None
+        _detach(target)
         with open(target, 'wb') as fout, open(url, 'rb') as fin:
-            chunk = None
-            while chunk is None or len(chunk) == 2048:
-                chunk = fin.read(2048)
-                fout.write(chunk)
+            shutil.copyfileobj(fin, fout, FETCH_CHUNK_SIZE)
+        _count_grabbed(target)
 
     return res
 
 
-def grab_and_scale(url, target, width, height):
-    ignored, tmp1 = tempfile.mkstemp(suffix='.jpg')
+def _count_grabbed(target):
+    if metrics.enabled():
+        metrics.add_bytes('grab.bytes', os.path.getsize(target))
+
+
+@metrics.timed('grab_and_scale')
+def grab_and_scale(url, target, width, height, profile='scaled'):
+    with temp_grab(url, suffix='.jpg') as tmp1:
+        scale_image(tmp1, target, width, height, profile)
+
+
+def scale_image(source, target, width, height, profile='scaled'):
+    im = Image.open(source)
+    info = im.info
+    im.thumbnail((width, height), resample_filter())
+    _detach(target)
+    save_image(im, target, profile, source_info=info)
 
-    try:
-        grab(url, tmp1)
-        im = Image.open(tmp1)
-        im.thumbnail((width, height), Image.ANTIALIAS)
-        im.save(target, "JPEG")
-    finally:
-        if os.path.exists(tmp1):
-            os.remove(tmp1)
+
+def _detach(target):
+    # never write through a link shared with other images
+    if image_store.enabled():
+        image_store.detach(target)
 
 
 def first(query):
@@ -391,38 +763,167 @@ def dict_value(obj, field, d):
 
 
 def shorten(text, width, **kwargs):
-    text = strip_tags(text or u'')
+    '''Strip tags from ``text`` and cut it after the first word that brings
+    it to ``width`` characters.  Only as much of the document as needed is
+    scanned.
+    '''
+    pieces = []
+    size = 0
+    for piece in _iter_text(text or u''):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= width:
+            res = _shorten_words(u''.join(pieces), width, False)
+            if res is not None:
+                return res
+
+    text = u''.join(pieces)
     if len(text) < width:
         return text
-    s = text.strip().split()
-    res = u''
-    for x in s:
-        res += u' ' + unicode(x)
-        if len(res) >= width:
+    return _shorten_words(text, width, True)
+
+
+def _shorten_words(text, width, complete):
+    # returns None when the word crossing ``width`` may continue past the
+    # end of ``text``
+    words = text.split()
+    length = 0
+    for num, word in enumerate(words):
+        length += len(word) + 1
+        if length >= width:
+            if not complete and num == len(words) - 1 \
+                    and not text[-1].isspace():
+                return None
+            words = words[:num + 1]
             break
+    else:
+        if not complete:
+            return None
 
-    if res >= width:
+    res = u''
+    if words:
+        res = u' ' + u' '.join(words)
+    if len(res) >= width:
         res += u' ...'
 
     return res
 
 
+def shorten_many(texts, width):
+    return [shorten(text, width) for text in texts]
+
+
+LOCATION_CACHE_SIZE = 1024
+# seconds a process serves a location from its own cache before it checks
+# the shared cache for invalidations made by other processes
+LOCATION_LOCAL_TTL = 60
+LOCATION_CACHE_TIMEOUT = 24 * 60 * 60
+
+_LOCATION_GENERATION_KEY = 'commondata:location:generation'
+_location_cache = OrderedDict()
+_location_lock = threading.Lock()
+
+
+@profiled('get_location')
 def get_location(country_slug, region_slug, city_slug):
-    from cities.models import Country, Region, City
+    '''Return the ``Location`` of a country/region/city slug triple, with
+    '-' for no region or city.
+
+    Locations are looked up with one query and cached twice: in a process
+    local LRU of ``LOCATION_CACHE_SIZE`` entries and in the Django cache
+    named by ``settings.LOCATION_CACHE_ALIAS`` (default 'default', None to
+    disable).  Saving or deleting cities models invalidates both, see
+    ``invalidate_locations``; other processes notice within
+    ``LOCATION_LOCAL_TTL`` seconds.
+
+    Both caches hold the pickled location, so every call gets a copy of its
+    own that callers are free to change.  A missing country, region or city
+    raises the ``DoesNotExist`` of its model.
+    '''
+    key = (country_slug, region_slug, city_slug)
+    now = time.time()
+    with _location_lock:
+        entry = _location_cache.pop(key, None)
+        if entry is not None and entry[0] > now:
+            _location_cache[key] = entry
+            return pickle.loads(entry[1])
+
+    cache = _location_shared_cache()
     location = None
-    if region_slug == '-':
-        location = Country.objects.get(slug=country_slug)
-    elif city_slug == '-':
-        country = Country.objects.get(slug=country_slug)
-        location = Region.objects.get(country_id=country.id,
-                                      slug=region_slug)
+    if cache is None:
+        location = _query_location(*key)
+        data = pickle.dumps(location, pickle.HIGHEST_PROTOCOL)
     else:
-        country = Country.objects.get(slug=country_slug)
-        region = Region.objects.get(slug=region_slug,
-                                    country_id=country.id)
-        location = City.objects.get(slug=city_slug,
-                                    region_id=region.id,
-                                    country_id=country.id)
+        shared_key = 'commondata:location:%s' % hashlib.md5(
+            u'/'.join(key).encode('utf8')).hexdigest()
+        values = cache.get_many([_LOCATION_GENERATION_KEY, shared_key])
+        generation = values.get(_LOCATION_GENERATION_KEY)
+        if generation is None:
+            generation = _new_location_generation(cache)
+        cached = values.get(shared_key)
+        if cached is not None and cached[0] == generation:
+            data = cached[1]
+        else:
+            location = _query_location(*key)
+            data = pickle.dumps(location, pickle.HIGHEST_PROTOCOL)
+            cache.set(shared_key, (generation, data), LOCATION_CACHE_TIMEOUT)
+
+    with _location_lock:
+        _location_cache[key] = (now + LOCATION_LOCAL_TTL, data)
+        while len(_location_cache) > LOCATION_CACHE_SIZE:
+            _location_cache.popitem(last=False)
+    return pickle.loads(data) if location is None else location
+
+
+def invalidate_locations(sender=None, **kwargs):
+    '''Forget all cached locations.  Connected to ``post_save`` and
+    ``post_delete`` of the cities models.
+    '''
+    with _location_lock:
+        _location_cache.clear()
+    cache = _location_shared_cache()
+    if cache is not None:
+        try:
+            cache.incr(_LOCATION_GENERATION_KEY)
+        except ValueError:
+            _new_location_generation(cache)
+
+
+def _location_shared_cache():
+    alias = getattr(settings, 'LOCATION_CACHE_ALIAS', 'default')
+    if alias is None:
+        return None
+    from django.core.cache import caches
+    return caches[alias]
+
+
+def _new_location_generation(cache):
+    # a fresh value, so entries of a lost generation key never match again
+    cache.add(_LOCATION_GENERATION_KEY, int(time.time() * 1000), None)
+    return cache.get(_LOCATION_GENERATION_KEY)
+
+
+def _query_location(country_slug, region_slug, city_slug):
+    from cities.models import Country, Region, City
+    try:
+        if region_slug == '-':
+            location = Country.objects.get(slug=country_slug)
+        elif city_slug == '-':
+            location = Region.objects.select_related('country').get(
+                country__slug=country_slug, slug=region_slug)
+        else:
+            location = City.objects.select_related('country', 'region').get(
+                country__slug=country_slug, region__slug=region_slug,
+                slug=city_slug)
+    except (Region.DoesNotExist, City.DoesNotExist):
+        # raise for the first missing level, like looking them up one by one
+        if not Country.objects.filter(slug=country_slug).exists():
+            raise Country.DoesNotExist(
+                'Country matching query does not exist.')
+        if city_slug != '-' and not Region.objects.filter(
+                country__slug=country_slug, slug=region_slug).exists():
+            raise Region.DoesNotExist('Region matching query does not exist.')
+        raise
     return Location(location)
 
 
@@ -431,54 +932,40 @@ class Location(object):
         if isinstance(id_or_object, int):
             self.id = id_or_object
             self.type_ = type_
+            self._item = None
         else:
             self.id = id_or_object.id
             self.type_ = id_or_object.__class__.__name__.lower()
+            self._item = id_or_object
 
     @property
+    @profiled('location_item')
     def item(self):
-        from cities.models import Country, Region, City
-        if self.type_ == 'city':
-            city = City.objects.get(id=self.id)
-            return city
-        elif self.type_ == 'region':
-            region = Region.objects.get(id=self.id)
-            return region
-        else:
-            country = Country.objects.get(id=self.id)
-            return country
+        if self._item is None:
+            self._item = _location_query(self.type_).get(id=self.id)
+        return self._item
 
     @property
     def slug(self):
-        from cities.models import Country, Region, City
+        item = self.item
         if self.type_ == 'city':
-            city = City.objects.get(id=self.id)
-            return [str(city.country.slug), str(city.region.slug), str(city.slug)]
+            return [str(item.country.slug), str(item.region.slug), str(item.slug)]
         elif self.type_ == 'region':
-            region = Region.objects.get(id=self.id)
-            return [str(region.country.slug), str(region.slug), '-']
+            return [str(item.country.slug), str(item.slug), '-']
         else:
-            country = Country.objects.get(id=self.id)
-            return [str(country.slug), '-', '-']
+            return [str(item.slug), '-', '-']
 
     @property
     def dest_urls(self):
+        return dest_urls_many([self])[0]
+
+    def url_args(self):
         item = self.item
         if self.type_ == 'city':
-            args = [item.country.slug, item.region.slug, item.slug]
+            return [item.country.slug, item.region.slug, item.slug]
         elif self.type_ == 'region':
-            args = [item.country.slug, item.slug, '-']
-        else:
-            args = [item.slug, '-', '-']
-        return {
-            'destination': reverse('destination', args=args),
-            'hotels': reverse('dest_hotels', args=args),
-            'vacation_rentals': reverse('dest_vacation_rentals', args=args),
-            'activities': reverse('dest_activities', args=args),
-            'restaurants': reverse('dest_restaurants', args=args),
-            'beaches': reverse('dest_beaches', args=args),
-            'deals': reverse('dest_deals', args=args),
-        }
+            return [item.country.slug, item.slug, '-']
+        return [item.slug, '-', '-']
 
     def address(self):
         if self.type_ == 'city':
@@ -499,6 +986,66 @@ class Location(object):
         }
 
 
+# keys of Location.dest_urls and the url patterns they reverse
+DEST_URL_NAMES = (
+    ('destination', 'destination'),
+    ('hotels', 'dest_hotels'),
+    ('vacation_rentals', 'dest_vacation_rentals'),
+    ('activities', 'dest_activities'),
+    ('restaurants', 'dest_restaurants'),
+    ('beaches', 'dest_beaches'),
+    ('deals', 'dest_deals'),
+)
+
+
+@profiled('dest_urls_many')
+def dest_urls_many(locations):
+    '''Return the ``dest_urls`` of every location in ``locations``.  The
+    items of locations built from an id are fetched with one query per
+    location type, and urls are formatted from precompiled templates.
+    '''
+    from dr_django_tools.shared.django.urlutils import (plain_args,
+                                                        url_templates)
+    locations = list(locations)
+    _load_location_items(locations)
+    keys = [key for key, name in DEST_URL_NAMES]
+    templates = url_templates([name for key, name in DEST_URL_NAMES], 3)
+    result = []
+    for location in locations:
+        args = location.url_args()
+        plain = plain_args(args)
+        if plain is None:
+            urls = [template.reverse(args) for template in templates]
+        else:
+            urls = [template.format_plain(plain) for template in templates]
+        result.append(dict(zip(keys, urls)))
+    return result
+
+
+def _location_query(type_):
+    from cities.models import Country, Region, City
+    if type_ == 'city':
+        return City.objects.select_related('country', 'region')
+    elif type_ == 'region':
+        return Region.objects.select_related('country')
+    return Country.objects.all()
+
+
+def _load_location_items(locations):
+    pending = {}
+    for location in locations:
+        if location._item is None:
+            pending.setdefault(location.type_, []).append(location)
+    for type_, group in pending.items():
+        query = _location_query(type_)
+        items = query.in_bulk([location.id for location in group])
+        for location in group:
+            location._item = items.get(location.id)
+            if location._item is None:
+                raise query.model.DoesNotExist(
+                    '%s %s does not exist' % (type_, location.id))
+
+
 def get_api_url(request):
     api_url = os.environ.get('API_URL', None)
     if api_url is None:
@@ -541,7 +1088,7 @@ def slugify(s):
     elif not isinstance(part1, unicode):
         part1 = unicode(part1)
 
-    part1 = unidecode(part1).strip()
+    part1 = _unidecode.unidecode(part1).strip()
     # part1 is now a competely safe ascii string
 
     part2 = ''
@@ -664,10 +1211,51 @@ class MLStripper(HTMLParser):
         return u''.join(self.fed)
 
 
+# Markup as the HTMLParser based MLStripper sees it: script/style bodies are
+# kept as text (group 1), tags, comments, declarations and entity or char
+# references are dropped.  Constructs the parser leaves unterminated swallow
+# the rest of the input, except for a bare '&#' which it emits as text when a
+# ';' follows somewhere (group 2).  The leading lookahead lets the engine skip
+# plain text quickly.
+_markup_re = re.compile(
+    r'(?=[<&])(?:'
+    r'<(?:script|style)(?=[\t\n\r\f />\x00])[^>]*>(.*?)</(?:script|style)\s*>'
+    r'|<(?:script|style)(?:[\t\n\r\f /\x00][^>]*)?/>'
+    r'|<(?:script|style)[\t\n\r\f />\x00].*'
+    r'|<!--.*?(?:--\s*>|\Z)'
+    r'|<[a-z][^\t\n\r\f />\x00]*'
+    r'(?:=+\s*"[^"]*"|=+\s*\'[^\']*\'|[^>])*(?:>|\Z)'
+    r'|<[/!?][^>]*(?:>|\Z)'
+    r'|<\Z'
+    r'|&#(?:[0-9]+|x[0-9a-f]+)(?:;|(?=[^0-9a-f]))'
+    r'|(&#)(?=.*;).*'
+    r'|&#.*'
+    r'|&[a-z][-.a-z0-9]*(?:;|(?=[^a-z0-9]))'
+    r'|&[a-z].*'
+    r'|&\Z)',
+    re.I | re.S)
+
+
 def strip_tags(html):
-    s = MLStripper()
-    s.feed(html)
-    return s.get_data()
+    return u''.join(filter(None, _markup_re.split(html)))
+
+
+def strip_tags_many(htmls):
+    split = _markup_re.split
+    return [u''.join(filter(None, split(html))) for html in htmls]
+
+
+def _iter_text(html):
+    pos = 0
+    for match in _markup_re.finditer(html):
+        if match.start() > pos:
+            yield html[pos:match.start()]
+        kept = match.group(1) or match.group(2)
+        if kept:
+            yield kept
+        pos = match.end()
+    if pos < len(html):
+        yield html[pos:]
 
 
 
@@ -1,5 +1,72 @@
-from xml.etree import ElementTree as etree
+import re
+
+from django.db.models.query import QuerySet
 from django.http import Http404, HttpResponse
+from django.utils.encoding import iri_to_uri
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# absolute paths build_absolute_uri would return unchanged after the host:
+# no characters iri_to_uri quotes, no query, fragment, params or dot segments
+_PLAIN_PATH = re.compile(r"^/(?!/)[-A-Za-z0-9_.~/%\[\]=:$&()+,!*@']*\Z")
+_DOT_SEGMENT = re.compile(r'/\.\.?(?:/|\Z)')
+
+
+def absolute_url_builder(request):
+    '''Return a function making urls absolute like
+    ``request.build_absolute_uri``, with scheme and host looked up once.
+    '''
+    prefix = iri_to_uri('%s://%s' % (request.scheme, request.get_host()))
+
+    def build(location):
+        if _PLAIN_PATH.match(location) and not _DOT_SEGMENT.search(location):
+            return prefix + location
+        return request.build_absolute_uri(location)
+    return build
+
+
+def _xml_text(text):
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return text.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+
+class QuerySetSource(object):
+    '''Sitemap entries for the rows of a QuerySet.
+
+    Only ``fields`` and ``lastmod_field`` are selected, streamed with
+    ``values_list().iterator()`` so no model instances are made.  ``url`` is
+    a format string taking the field values (``'/hotels/%s/'``) or a
+    function called with them; ``lastmod_field`` may be None.
+    '''
+
+    def __init__(self, queryset, url, fields=('slug',),
+                 lastmod_field='updated_at'):
+        self.queryset = queryset
+        self.url = url
+        self.fields = tuple(fields)
+        self.lastmod_field = lastmod_field
+
+    def __iter__(self):
+        url = self.url
+        if isinstance(url, string_types):
+            template = url
+            url = lambda *values: template % values
+        fields = self.fields
+        if self.lastmod_field:
+            fields += (self.lastmod_field,)
+        rows = self.queryset.values_list(*fields).iterator()
+        if self.lastmod_field:
+            for row in rows:
+                yield url(*row[:-1]), row[-1]
+        else:
+            for row in rows:
+                yield url(*row), None
+
 
 class SiteMap(object):
     top_type = 'urlset'
@@ -14,53 +81,116 @@ class SiteMap(object):
 
         self._last_modified = []
 
-    def add(self, url):
+    def add(self, url, lastmod=None):
+        '''Add ``url``, a path, an absolute url or an object with a
+        ``get_absolute_url`` method, last modified on date ``lastmod``.
+        '''
         self._entries.append(url)
+        if lastmod is not None:
+            missing = len(self._entries) - 1 - len(self._last_modified)
+            self._last_modified.extend([None] * missing)
+            self._last_modified.append(lastmod)
 
-    def render(self, request):
-        root = etree.Element(self.top_type)
-        root.set('xmlns', 'http://www.sitemaps.org/schemas/sitemap/0.9')
+    def add_queryset(self, queryset, url, fields=('slug',),
+                     lastmod_field='updated_at'):
+        '''Add an entry for every row of ``queryset``, see
+        ``QuerySetSource``.  Rows are read when the sitemap is rendered.
+        '''
+        self._entries.append(QuerySetSource(queryset, url, fields,
+                                            lastmod_field))
+
+    def iter_entries(self):
+        '''Yield the ``(url, lastmod)`` pair of every entry.'''
+        last_modified = self._last_modified
+        nmodified = len(last_modified)
         for k, entry in enumerate(self._entries):
-            url_el = etree.SubElement(root, self.sub_type)
-            loc_el = etree.SubElement(url_el, 'loc')
-            loc_el.text = request.build_absolute_uri(entry)
-
-            try:
-                if self._last_modified[k]:
-                    loc_el = etree.SubElement(url_el, 'lastmod')
-                    loc_el.text = self._last_modified[k].strftime('%Y-%m-%d')
-            except IndexError:
-                pass
-            if self.sub_type == 'url':
-                loc_el = etree.SubElement(url_el, 'changefreq')
-                loc_el.text = self.change_freq
-
-        response = HttpResponse(etree.tostring(root), 'text/xml')
+            if isinstance(entry, QuerySetSource):
+                for pair in entry:
+                    yield pair
+            else:
+                yield entry, last_modified[k] if k < nmodified else None
+
+    def render(self, request):
+        build = absolute_url_builder(request)
+        dates = {}
+        open_entry = '<%s><loc>' % self.sub_type
+        if self.sub_type == 'url':
+            close_entry = '<changefreq>%s</changefreq></url>' % _xml_text(
+                self.change_freq)
+        else:
+            close_entry = '</%s>' % self.sub_type
+
+        # the same markup ElementTree produced, written out directly
+        parts = ['<%s xmlns="%s">' % (self.top_type, SITEMAP_NS)]
+        for entry, lastmod in self.iter_entries():
+            if not isinstance(entry, string_types):
+                entry = entry.get_absolute_url()
+            parts.append(open_entry)
+            parts.append(_xml_text(build(entry)))
+            parts.append('</loc>')
+            if lastmod:
+                ordinal = lastmod.toordinal()
+                try:
+                    day = dates[ordinal]
+                except KeyError:
+                    day = dates[ordinal] = lastmod.strftime('%Y-%m-%d')
+                parts.append('<lastmod>%s</lastmod>' % day)
+            parts.append(close_entry)
+
+        if len(parts) == 1:
+            body = '<%s xmlns="%s" />' % (self.top_type, SITEMAP_NS)
+        else:
+            parts.append('</%s>' % self.top_type)
+            body = ''.join(parts)
+        response = HttpResponse(body.encode('ascii'), 'text/xml')
         return response
 
 class Columnizer(object):
+    '''Split results into columns of consecutive items, as many as the
+    attribute name says so templates can use ``columnizer.3``.
+
+    An ordered QuerySet is split with one LIMIT/OFFSET query per column, a
+    list or tuple by slicing and any other iterable, unordered QuerySets
+    included, is read into a list once: without an ORDER BY the database
+    may return rows in a different order for every slice.
+    Columns are cached per column count.
+    '''
+
     def __init__(self, results):
         self.results = results
+        self._count = None
+        self._columns = {}
 
     def __getattr__(self, k):
-        if k in dir(Columnizer):
-            return object.__getattr__(self, k)
-        collen = int(k)
-        cols = []
-        row = []
-        multiple = int(self.count / collen)
-        if self.count % collen > 0:
+        # only reached for names that are not regular attributes
+        if not k.isdigit():
+            raise AttributeError(k)
+        return self.columns(int(k))
+
+    def columns(self, collen):
+        try:
+            return self._columns[collen]
+        except KeyError:
+            pass
+        count = self.count
+        multiple = count // collen
+        if count % collen > 0:
             multiple += 1
-        for (x, res) in enumerate(self.results):
-            if x % multiple == 0:
-                row = []
-                cols.append(row)
-            row.append(res)
+        cols = [list(self.results[start:start + multiple])
+                for start in range(0, count, multiple or 1)]
+        self._columns[collen] = cols
         return cols
 
     @property
     def count(self):
-        return len(self.results)
+        if self._count is None:
+            if isinstance(self.results, QuerySet) and self.results.ordered:
+                self._count = self.results.count()
+            else:
+                if not isinstance(self.results, (list, tuple)):
+                    self.results = list(self.results)
+                self._count = len(self.results)
+        return self._count
 
 class SiteMapIndex(SiteMap):
     top_type = 'sitemapindex'
@@ -1,14 +1,22 @@
 import datetime
+import hashlib
+import inspect
 import json
 import decimal
+import re
 
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.core.cache import caches
 from django.db import models
 from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import query
 from django.forms.models import model_to_dict
+from django.utils.encoding import force_text
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.signals import setting_changed
+from django.utils.cache import patch_vary_headers
 
 def configurable_login_required(function):
     def wrapper(*args, **kw):
@@ -19,17 +27,189 @@ def configurable_login_required(function):
             return function(*args, **kw)
     return wrapper
 
+# output shapes for a field projected QuerySet
+SHAPE_SERIALIZER = 'serializer'  # same layout as serializers.serialize('json')
+SHAPE_DICT = 'dict'  # [{"pk": 1, "name": "..."}, ...]
+SHAPE_ROWS = 'rows'  # [[1, "..."], ...]
+SHAPES = (SHAPE_SERIALIZER, SHAPE_DICT, SHAPE_ROWS)
+
+
 class jsonres(object):
-    def __init__(self, f):
+    '''Render the return value of a view as a JSON response.
+
+    Can be used bare (``@jsonres``) or with options
+    (``@jsonres(fields=('name', 'slug'))``).  When ``fields`` is given a
+    QuerySet is serialized straight from ``values_list()`` rows so no model
+    instances are built; ``shape`` picks the output layout (see ``SHAPES``),
+    defaulting to the layout of Django's json serializer.
+
+    Caching is opt-in.  ``cache_timeout`` (seconds) stores the serialized body
+    in the ``cache_alias`` cache under ``cache_key(*args, **kwargs)``, or the
+    request's full path and authenticated user when no key function is
+    given; a key function has to tell users apart itself where responses
+    depend on them.  The values of the request headers named in ``vary_on``
+    are part of the key either way and listed in the response's ``Vary``
+    header.  Cached and versioned responses carry an ETag and a matching
+    ``If-None-Match`` is answered with a 304.  ``version(*args, **kwargs)`` is
+    a cheap version key used as the ETag instead of hashing the body; it is
+    checked before the view runs.
+    '''
+
+    def __init__(self, f=None, fields=None, shape=SHAPE_SERIALIZER,
+                 cache_timeout=None, cache_key=None, version=None,
+                 cache_alias='default', vary_on=()):
+        if shape not in SHAPES:
+            raise ValueError('Invalid jsonres shape: %s' % shape)
         self._f = f
+        self.fields = tuple(fields) if fields else None
+        self.shape = shape
+        self.cache_timeout = cache_timeout
+        self.cache_key = cache_key
+        self.version = version
+        self.cache_alias = cache_alias
+        self.vary_on = tuple(vary_on)
 
     def __call__(self, *args, **kwargs):
-        res = self._f(*args, **kwargs)
+        if self._f is None:
+            # used as @jsonres(...), the only argument is the view
+            self._f = args[0]
+            return self
+
+        request = _find_request(args)
+        if (self.cache_timeout is None and self.version is None) or \
+                request is None or request.method not in ('GET', 'HEAD'):
+            res = self._f(*args, **kwargs)
+            return HttpResponse(self.serialize(res),
+                                content_type='application/json')
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        etag = None
+        if self.version is not None:
+            etag = '"%s"' % self.version(*args, **kwargs)
+            if _etag_matches(if_none_match, etag):
+                return self._vary(_not_modified(etag), request)
+
+        cache = key = None
+        if self.cache_timeout is not None:
+            cache = caches[self.cache_alias]
+            key = self._cache_key(request, etag, args, kwargs)
+            cached = cache.get(key)
+            if cached is not None:
+                etag, body = cached
+                if _etag_matches(if_none_match, etag):
+                    return self._vary(_not_modified(etag), request)
+                return self._vary(_json_response(body, etag), request)
+
+        body = self.serialize(self._f(*args, **kwargs))
+        if etag is None:
+            etag = '"%s"' % hashlib.md5(_to_bytes(body)).hexdigest()
+        if cache is not None:
+            cache.set(key, (etag, body), self.cache_timeout)
+        if _etag_matches(if_none_match, etag):
+            return self._vary(_not_modified(etag), request)
+        return self._vary(_json_response(body, etag), request)
+
+    def serialize(self, res):
         if isinstance(res, query.QuerySet):
-            j = serializers.serialize('json', res)
+            if self.fields:
+                return serialize_values(res, self.fields, self.shape)
+            return serializers.serialize('json', res)
+        return json.dumps(res, indent=2, cls=JSONEncoder)
+
+    def _cache_key(self, request, etag, args, kwargs):
+        if self.cache_key is not None:
+            key = self.cache_key(*args, **kwargs)
         else:
-            j = json.dumps(res, indent=2, cls=JSONEncoder)
-        return HttpResponse(j, content_type='application/json')
+            key = '%s:%s' % (request.get_full_path(), _user_key(request))
+        headers = [request.META.get(_meta_key(header), '')
+                   for header in self.vary_on]
+        key = u'%s.%s:%s:%s:%s' % (self._f.__module__, self._f.__name__,
+                                   key, u'\n'.join(headers), etag or '')
+        return 'jsonres:' + hashlib.md5(_to_bytes(key)).hexdigest()
+
+    def _vary(self, response, request):
+        headers = self.vary_on
+        if self.cache_key is None and hasattr(request, 'user'):
+            # the default key holds the user, known from the session cookie
+            headers += ('Cookie',)
+        if headers:
+            patch_vary_headers(response, headers)
+        return response
+
+
+def _user_key(request):
+    user = getattr(request, 'user', None)
+    if user is None:
+        return ''
+    authenticated = user.is_authenticated
+    if inspect.ismethod(authenticated):
+        # a method before Django 1.10
+        authenticated = authenticated()
+    return '%s' % user.pk if authenticated else ''
+
+
+def _meta_key(header):
+    key = header.upper().replace('-', '_')
+    if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+        return key
+    return 'HTTP_' + key
+
+
+def _find_request(args):
+    # function views get the request first, methods get it after self
+    for arg in args[:2]:
+        if hasattr(arg, 'META') and hasattr(arg, 'method'):
+            return arg
+    return None
+
+
+def _etag_matches(header, etag):
+    if not header or etag is None:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+
+def _not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def _json_response(body, etag):
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def _to_bytes(s):
+    if isinstance(s, bytes):
+        return s
+    return s.encode('utf8')
+
+
+def serialize_values(queryset, fields, shape=SHAPE_SERIALIZER):
+    '''Serialize the pk and ``fields`` of every row in ``queryset`` to JSON
+    in ``shape``.
+    '''
+    rows = queryset.values_list('pk', *fields)
+    # every shape follows the encoding rules of serializers.serialize('json')
+    if shape == SHAPE_ROWS:
+        return json.dumps([list(row) for row in rows], cls=DjangoJSONEncoder)
+    if shape == SHAPE_DICT:
+        names = ('pk',) + tuple(fields)
+        return json.dumps([dict(zip(names, row)) for row in rows],
+                          cls=DjangoJSONEncoder)
+
+    label = force_text(queryset.model._meta)
+    data = [{'model': label, 'pk': row[0], 'fields': dict(zip(fields, row[1:]))}
+            for row in rows]
+    return json.dumps(data, cls=DjangoJSONEncoder)
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -43,3 +223,119 @@ class JSONEncoder(json.JSONEncoder):
         if isinstance(o, models.Model):
             return model_to_dict(o)
         return super(JSONEncoder, self).default(o)
+
+
+# arguments reverse() leaves unquoted
+_PLAIN_ARG = re.compile(r'^[-A-Za-z0-9_.~]+\Z')
+_PARAM = re.compile(r'%\((\w+)\)s')
+
+_url_templates = {}
+
+
+class URLTemplate(object):
+    '''``reverse()`` of one named url pattern with positional arguments, by
+    string formatting.
+
+    The template is taken from the resolver when it is built.  Arguments are
+    still checked against the url pattern like ``reverse()`` does; arguments
+    that would need quoting, names with a namespace or more than one pattern,
+    and patterns with path converters go through ``reverse()``.
+    '''
+
+    def __init__(self, name, nargs, urlconf=None):
+        self.name = name
+        self.urlconf = urlconf
+        self.template = None
+        self.regex = None
+        try:
+            self._compile(nargs)
+        except Exception:
+            # unknown name, or resolver internals this does not understand
+            self.template = None
+
+    def _compile(self, nargs):
+        from django.core.urlresolvers import (get_resolver, get_script_prefix,
+                                              reverse)
+        if ':' in self.name:
+            return
+        prefix = get_script_prefix()
+        entries = get_resolver(self.urlconf).reverse_dict.getlist(self.name)
+        if len(entries) != 1 or len(entries[0]) > 3 and entries[0][3]:
+            return
+        possibility, pattern = entries[0][0], entries[0][1]
+        candidates = [(result, params) for result, params in possibility
+                      if len(params) == nargs]
+        if len(candidates) != 1:
+            return
+        result, params = candidates[0]
+        if _PARAM.findall(result) != list(params):
+            return
+        template = prefix.replace('%', '%%') + _PARAM.sub('%s', result)
+        self.regex = re.compile('^%s%s' % (re.escape(prefix), pattern),
+                                re.UNICODE)
+        # the template has to reproduce reverse() exactly
+        markers = tuple('m%ix' % x for x in range(nargs))
+        if template % markers == reverse(self.name, args=markers,
+                                         urlconf=self.urlconf):
+            self.template = template
+
+    def __call__(self, *args):
+        plain = plain_args(args)
+        if plain is None:
+            return self.reverse(args)
+        return self.format_plain(plain)
+
+    def format_plain(self, args):
+        '''Return the url of ``args``, text already known to need no
+        quoting (see ``plain_args``).
+        '''
+        if self.template is not None:
+            url = self.template % tuple(args)
+            if self.regex.search(url) and not url.startswith('//'):
+                return url
+        return self.reverse(args)
+
+    def reverse(self, args):
+        from django.core.urlresolvers import reverse
+        return reverse(self.name, args=args, urlconf=self.urlconf)
+
+
+def plain_args(args):
+    '''Return ``args`` as text when none of them needs quoting in a url,
+    otherwise None.
+    '''
+    args = ['%s' % arg for arg in args]
+    for arg in args:
+        if not _PLAIN_ARG.match(arg):
+            return None
+    return args
+
+
+def url_templates(names, nargs, urlconf=None):
+    '''Return the cached ``URLTemplate`` of every url pattern in ``names``
+    for the current urlconf, script prefix and language.
+    '''
+    from django.core.urlresolvers import get_script_prefix, get_urlconf
+    from django.utils.translation import get_language
+    names = tuple(names)
+    # i18n_patterns put the active language into the url
+    key = (names, nargs, urlconf or get_urlconf(), get_script_prefix(),
+           get_language())
+    try:
+        return _url_templates[key]
+    except KeyError:
+        templates = tuple(URLTemplate(name, nargs, urlconf) for name in names)
+        _url_templates[key] = templates
+        return templates
+
+
+def url_template(name, nargs, urlconf=None):
+    return url_templates((name,), nargs, urlconf)[0]
+
+
+def _clear_url_templates(setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        _url_templates.clear()
+
+
+setting_changed.connect(_clear_url_templates)
@@ -0,0 +1,82 @@
+'''Shared test setup.
+
+``configure()`` sets Django up once per test run with an in-memory SQLite
+database holding the stand-in cities models (benchmarks/standins) and the
+models of tests/testapp.  It raises ImportError when Django or a dependency
+of the commondata models is missing, so test modules can skip.
+'''
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+_ready = False
+
+
+def configure():
+    global _ready
+    if _ready:
+        return
+    standins = os.path.join(ROOT, 'benchmarks', 'standins')
+    if standins not in sys.path:
+        sys.path.insert(0, standins)
+
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(
+            SECRET_KEY='tests',
+            ALLOWED_HOSTS=['testserver'],
+            INSTALLED_APPS=['cities', 'tests.testapp'],
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                                   'NAME': ':memory:'}},
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            ROOT_URLCONF='tests.testapp.urls',
+            MIDDLEWARE=[],
+            IMAGE_DIR=tempfile.mkdtemp(prefix='dr-django-tools-tests-'),
+            IMAGE_MODELS=['tests.testapp.models'],
+            SLUG_TEMPLATES={},
+            IMAGE_SLUG_TEMPLATES={},
+            RESOURCE_SLUG_BASE='tests.testapp.models.slug_base',
+        )
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    _ready = True
+
+
+class LocalHTTPServer(object):
+    '''Serves the files of ``directory`` on a free local port from a
+    background thread.
+    '''
+
+    def __init__(self, directory):
+        import threading
+        try:
+            from http.server import HTTPServer, SimpleHTTPRequestHandler
+        except ImportError:
+            from BaseHTTPServer import HTTPServer
+            from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+        class Handler(SimpleHTTPRequestHandler):
+            def translate_path(self, path):
+                return os.path.join(directory,
+                                    os.path.basename(path.split('?')[0]))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, name):
+        return 'http://127.0.0.1:%i/%s' % (self.server.server_address[1],
+                                           name)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
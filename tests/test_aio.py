@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_aio
+----------------------------------
+
+Tests for the asyncio fetch helpers against a local http server.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import asyncio
+    # the helpers import it lazily
+    import aiohttp  # noqa
+    from tests import support
+    support.configure()
+    from dr_django_tools.shared.commondata import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+
+PAYLOAD = os.urandom(300 * 1024)
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(aio is None, 'aiohttp or commondata dependencies missing')
+class TestAsyncFetch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        with open(os.path.join(cls.root, 'blob.bin'), 'wb') as f:
+            f.write(PAYLOAD)
+        cls.server = support.LocalHTTPServer(cls.root)
+        cls.url = cls.server.url('')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        shutil.rmtree(cls.root)
+
+    def test_fetchfile(self):
+        with run(aio.fetchfile(self.url + 'blob.bin')) as f:
+            self.assertTrue(os.path.exists(f.name))
+            self.assertEqual(f.read(), PAYLOAD)
+        # the temporary file is removed on close
+        self.assertFalse(os.path.exists(f.name))
+
+    def test_grab_to_temp(self):
+        filename = run(aio.grab_to_temp(self.url + 'blob.bin'))
+        try:
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), PAYLOAD)
+        finally:
+            os.remove(filename)
+
+    def test_grab_many(self):
+        targets = [os.path.join(self.root, 'copy%i' % x) for x in range(20)]
+        pairs = [(self.url + 'blob.bin', target) for target in targets]
+        pairs.append((self.url + 'missing.bin',
+                      os.path.join(self.root, 'copy-missing')))
+
+        results = run(aio.grab_many(pairs, limit=5))
+        self.assertEqual([r.status for r in results[:-1]], [200] * 20)
+        self.assertIsInstance(results[-1], IOError)
+        for target in targets:
+            with open(target, 'rb') as f:
+                self.assertEqual(f.read(), PAYLOAD)
+
+    def test_unmodified_target_is_kept(self):
+        target = os.path.join(self.root, 'cached')
+        self.assertEqual(run(aio.grab(self.url + 'blob.bin', target)).status,
+                         200)
+        self.assertEqual(run(aio.grab(self.url + 'blob.bin', target)).status,
+                         304)
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), PAYLOAD)
+
+    def test_missing_url_raises(self):
+        target = os.path.join(self.root, 'missing')
+        with self.assertRaises(IOError):
+            run(aio.grab(self.url + 'missing.bin', target))
+        self.assertFalse(os.path.exists(target))
+
+    def test_grab_local_path(self):
+        target = os.path.join(self.root, 'local')
+        run(aio.grab(os.path.join(self.root, 'blob.bin'), target))
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), PAYLOAD)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_country
+----------------------------------
+
+Tests for `lookup_country_code`: exact names, aliases, ISO codes and the
+fuzzy fallback.
+"""
+
+import unittest
+
+try:
+    import fuzzywuzzy  # noqa
+    import pycountry  # noqa
+    import unidecode  # noqa
+    from tests import support
+    support.configure()
+    from dr_django_tools.shared.commondata import utils
+except ImportError:
+    utils = None
+
+
+@unittest.skipIf(utils is None, 'pycountry, fuzzywuzzy or django missing')
+class TestLookupCountryCode(unittest.TestCase):
+
+    def setUp(self):
+        utils._country_code_cache.clear()
+
+    def tearDown(self):
+        utils._country_code_cache.clear()
+
+    def check(self, cases):
+        for name, code in cases:
+            self.assertEqual(utils.lookup_country_code(name), code, name)
+
+    def test_exact_names(self):
+        self.check([
+            ('France', 'FR'),
+            ('united kingdom', 'GB'),
+            ('Korea, Republic of', 'KR'),
+            ('Republic of Korea', 'KR'),
+            ('  Germany ', 'DE'),
+            (u'C\xf4te d\'Ivoire', 'CI'),
+            ('St. Lucia', 'LC'),
+        ])
+
+    def test_aliases(self):
+        # fuzzy matching alone gave Belarus for 'USA' and Greenland for
+        # 'England'
+        self.check([
+            ('USA', 'US'),
+            ('usa', 'US'),
+            ('United States of America', 'US'),
+            ('UK', 'GB'),
+            ('England', 'GB'),
+            ('Scotland', 'GB'),
+            ('UAE', 'AE'),
+            ('Russia', 'RU'),
+            ('South Korea', 'KR'),
+            ('Holland', 'NL'),
+            ('Ivory Coast', 'CI'),
+        ])
+
+    def test_iso_codes(self):
+        self.check([
+            ('FR', 'FR'),
+            ('FRA', 'FR'),
+            ('CAN', 'CA'),
+            ('DEU', 'DE'),
+            ('JP', 'JP'),
+        ])
+
+    def test_lower_case_short_names_are_fuzzy(self):
+        # 'can' is not taken for the ISO3 code of Canada
+        self.assertNotEqual(utils.lookup_country_code('can'), 'CA')
+        self.check([('fr', 'FR'), ('ind', 'IN')])
+
+    def test_fuzzy_fallback(self):
+        self.check([
+            ('Untied States', 'US'),
+            ('Grmany', 'DE'),
+            ('Republic of France', 'FR'),
+        ])
+
+    def test_cached(self):
+        code = utils.lookup_country_code('Grmany')
+        utils._country_code_cache['Grmany'] = 'XX'
+        self.assertEqual(utils.lookup_country_code('Grmany'), 'XX')
+        self.assertEqual(code, 'DE')
+
+    def test_country_names(self):
+        names = utils.get_country_names()
+        self.assertIn('France', names)
+        names.append('Atlantis')
+        self.assertNotIn('Atlantis', utils.get_country_names())
+
+    def test_module_attributes(self):
+        self.assertIn('France', utils.country_names)
+        self.assertEqual(len(utils.country_names),
+                         len(utils.get_country_names()))
+        self.assertEqual(list(utils.country_names)[0],
+                         utils.get_country_names()[0])
+        self.assertEqual(utils.countries.get(alpha2='FR').name, 'France')
+
+
+if __name__ == '__main__':
+    unittest.main()
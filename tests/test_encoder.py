@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_encoder
+----------------------------------
+
+Tests for the encoder profiles used to save renditions.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from PIL import Image
+    from tests import support
+    support.configure()
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.commondata import image_utils
+except ImportError:
+    image_utils = None
+
+
+def source_jpeg(**options):
+    buf = io.BytesIO()
+    Image.new('RGB', (400, 300), (200, 120, 40)).save(buf, 'JPEG', **options)
+    buf.seek(0)
+    return buf
+
+
+@unittest.skipIf(image_utils is None, 'PIL or django is not installed')
+class TestEncoderProfiles(unittest.TestCase):
+
+    def test_builtin_profile(self):
+        options = image_utils.encoder_profile('thumbnail')
+        self.assertEqual(options['format'], 'JPEG')
+        self.assertTrue(options['optimize'])
+
+    def test_unknown_profile(self):
+        self.assertRaises(ValueError, image_utils.encoder_profile, 'nope')
+
+    def test_settings_override_and_add(self):
+        profiles = {'thumbnail': {'quality': 50},
+                    'hero': {'format': 'JPEG', 'quality': 90}}
+        with override_settings(IMAGE_ENCODER_PROFILES=profiles):
+            options = image_utils.encoder_profile('thumbnail')
+            self.assertEqual(options['quality'], 50)
+            self.assertTrue(options['optimize'])
+            self.assertEqual(image_utils.encoder_profile('hero')['quality'],
+                             90)
+            key = image_utils.profile_key('thumbnail')
+        self.assertNotEqual(key, image_utils.profile_key('thumbnail'))
+
+    def test_profiles_encode_jpeg(self):
+        profiles = {'thumbnail': {'format': 'WEBP'}}
+        with override_settings(IMAGE_ENCODER_PROFILES=profiles):
+            with self.assertRaises(ValueError) as ctx:
+                image_utils.encoder_profile('thumbnail')
+            self.assertIn('.jpg', str(ctx.exception))
+        # a dict of options may use any format
+        options = {'format': 'PNG'}
+        self.assertIs(image_utils.encoder_profile(options), options)
+
+    def test_resize_with_profile(self):
+        out = io.BytesIO()
+        image_utils.resize_and_crop(source_jpeg(), out, (120, 70),
+                                    profile='thumbnail')
+        out.seek(0)
+        img = Image.open(out)
+        self.assertEqual((img.format, img.size), ('JPEG', (120, 70)))
+
+    def test_format_from_extension(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name, format in (('out.png', 'PNG'), ('out.gif', 'GIF'),
+                             ('out.jpg', 'JPEG'), ('out', 'JPEG')):
+            path = os.path.join(tmpdir, name)
+            image_utils.resize_and_crop(source_jpeg(), path, (120, 70))
+            self.assertEqual(Image.open(path).format, format)
+        # an explicit profile keeps its format
+        path = os.path.join(tmpdir, 'thumb.png')
+        image_utils.resize_and_crop(source_jpeg(), path, (120, 70),
+                                    profile='thumbnail')
+        self.assertEqual(Image.open(path).format, 'JPEG')
+
+    def test_format_from_file_name(self):
+        out = io.BytesIO()
+        out.name = 'out.png'
+        image_utils.resize_and_crop(source_jpeg(), out, (120, 70))
+        out.seek(0)
+        self.assertEqual(Image.open(out).format, 'PNG')
+
+    def test_strip_metadata(self):
+        icc = b'\0' * 128
+        for strip in (True, False):
+            out = io.BytesIO()
+            image_utils.resize_and_crop(
+                source_jpeg(icc_profile=icc), out, (120, 70),
+                profile={'format': 'JPEG', 'strip': strip})
+            out.seek(0)
+            kept = Image.open(out).info.get('icc_profile')
+            self.assertEqual(kept, None if strip else icc)
+
+
+if __name__ == '__main__':
+    unittest.main()
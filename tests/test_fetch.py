@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fetch
+----------------------------------
+
+Tests for the streaming fetch helpers against a local http server.
+"""
+
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    # the helpers import it lazily
+    import requests  # noqa
+    from tests import support
+    support.configure()
+    from dr_django_tools.shared.commondata import utils
+except ImportError:
+    utils = None
+
+
+PAYLOAD = os.urandom(300 * 1024)
+
+
+@unittest.skipIf(utils is None, 'commondata dependencies are not installed')
+class TestFetch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        with open(os.path.join(cls.root, 'blob.bin'), 'wb') as f:
+            f.write(PAYLOAD)
+        cls.server = support.LocalHTTPServer(cls.root)
+        cls.url = cls.server.url('')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        shutil.rmtree(cls.root)
+
+    def test_fetchfile(self):
+        f = utils.fetchfile(self.url + 'blob.bin')
+        try:
+            self.assertEqual(f.read(), PAYLOAD)
+            # a real file name, for code passing it on
+            with open(f.name, 'rb') as g:
+                self.assertEqual(g.read(), PAYLOAD)
+        finally:
+            f.close()
+        self.assertFalse(os.path.exists(f.name))
+
+    def test_fetched_in_memory(self):
+        with utils.fetched(self.url + 'blob.bin') as f:
+            self.assertEqual(f.read(), PAYLOAD)
+
+    def test_fetched_view_small_is_bytes(self):
+        with utils.fetched_view(self.url + 'blob.bin') as view:
+            self.assertIsInstance(view, bytes)
+            self.assertEqual(view, PAYLOAD)
+
+    def test_fetched_view_large_is_mapped(self):
+        with utils.fetched_view(self.url + 'blob.bin',
+                                max_size=1024) as view:
+            self.assertIsInstance(view, mmap.mmap)
+            self.assertEqual(view[:], PAYLOAD)
+        self.assertRaises(ValueError, view.read, 1)
+
+    def test_fetched_view_max_size_zero(self):
+        with utils.fetched_view(self.url + 'blob.bin', max_size=0) as view:
+            self.assertIsInstance(view, mmap.mmap)
+            self.assertEqual(view[:], PAYLOAD)
+
+    def test_fetched_local_path(self):
+        with utils.fetched(os.path.join(self.root, 'blob.bin')) as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        self.assertTrue(f.closed)
+
+    def test_missing_url_raises(self):
+        with self.assertRaises(IOError):
+            with utils.fetched(self.url + 'missing.bin'):
+                pass
+
+    def test_temp_grab_removes_file(self):
+        with utils.temp_grab(self.url + 'blob.bin') as filename:
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), PAYLOAD)
+        self.assertFalse(os.path.exists(filename))
+
+    def test_grab_to_temp_removes_file_on_error(self):
+        before = set(os.listdir(tempfile.gettempdir()))
+        with self.assertRaises(IOError):
+            utils.grab_to_temp(self.url + 'missing.bin')
+        self.assertEqual(set(os.listdir(tempfile.gettempdir())) - before,
+                         set())
+
+
+if __name__ == '__main__':
+    unittest.main()
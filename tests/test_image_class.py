@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_image_class
+----------------------------------
+
+Tests for the resolution of the image model of resource models.
+"""
+
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.core.exceptions import ImproperlyConfigured
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.commondata import models
+    from tests.testapp.models import Hotel, HotelImage
+except ImportError:
+    models = None
+
+
+class Villa(object):
+    '''A resource without an image model.'''
+
+
+@unittest.skipIf(models is None, 'django is not installed')
+class TestResolveImageClass(unittest.TestCase):
+
+    def setUp(self):
+        models._image_classes.clear()
+
+    def tearDown(self):
+        models._image_classes.clear()
+
+    def test_found_in_image_models(self):
+        self.assertIs(models.resolve_image_class(Hotel), HotelImage)
+        self.assertIs(Hotel().image_class, HotelImage)
+
+    def test_cached_per_class(self):
+        models.resolve_image_class(Hotel)
+        # later IMAGE_MODELS changes do not matter anymore
+        with override_settings(IMAGE_MODELS=[]):
+            self.assertIs(models.resolve_image_class(Hotel), HotelImage)
+
+    def test_dotted_paths_are_searched_in_order(self):
+        with override_settings(IMAGE_MODELS=['os.path',
+                                             'tests.testapp.models']):
+            self.assertIs(models.resolve_image_class(Hotel), HotelImage)
+
+    def test_unknown_class(self):
+        with self.assertRaises(ImproperlyConfigured) as ctx:
+            models.resolve_image_class(Villa)
+        message = str(ctx.exception)
+        self.assertIn('VillaImage', message)
+        self.assertIn('tests.testapp.models', message)
+        self.assertNotIn(Villa, models._image_classes)
+
+    def test_bad_dotted_path(self):
+        with override_settings(IMAGE_MODELS=['no_such_package.models']):
+            with self.assertRaises(ImproperlyConfigured) as ctx:
+                models.resolve_image_class(Hotel)
+        self.assertIn("'no_such_package.models'", str(ctx.exception))
+
+    def test_register_image_classes(self):
+        models.register_image_classes()
+        self.assertIs(models._image_classes[Hotel], HotelImage)
+        with override_settings(IMAGE_MODELS=['os.path']):
+            models._image_classes.clear()
+            self.assertRaises(ImproperlyConfigured,
+                              models.register_image_classes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_image_dims
+----------------------------------
+
+Tests for the header based dimension probe and `update_image_dims`.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from PIL import Image
+    from tests import support
+    support.configure()
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.commondata import image_utils, models
+    from tests.testapp.models import Hotel, HotelImage
+except ImportError:
+    image_utils = None
+
+SIZE = (37, 21)
+
+
+def encode(format, size=SIZE, mode='RGB', **options):
+    buf = io.BytesIO()
+    color = (200, 120, 40, 128)[:len(mode)] if mode != 'P' else 3
+    Image.new(mode, size, color).save(buf, format, **options)
+    return buf.getvalue()
+
+
+def samples():
+    '''(name, bytes) of sample files in every probed format.'''
+    found = [
+        ('baseline.jpg', encode('JPEG')),
+        ('progressive.jpg', encode('JPEG', progressive=True)),
+        ('grey.jpg', encode('JPEG', mode='L')),
+        ('icc.jpg', encode('JPEG', icc_profile=b'\0' * 2000)),
+        ('rgb.png', encode('PNG')),
+        ('rgba.png', encode('PNG', mode='RGBA')),
+        ('palette.gif', encode('GIF', mode='P')),
+    ]
+    try:
+        found += [
+            ('lossy.webp', encode('WEBP')),
+            ('lossless.webp', encode('WEBP', lossless=True)),
+            # an alpha channel makes the encoder write a VP8X header
+            ('alpha.webp', encode('WEBP', mode='RGBA')),
+        ]
+    except (IOError, KeyError):
+        pass  # PIL without WebP support
+    return found
+
+
+@unittest.skipIf(image_utils is None, 'PIL or django is not installed')
+class TestImageDimensions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_formats(self):
+        for name, data in samples():
+            path = self.write(name, data)
+            self.assertEqual(Image.open(path).size, SIZE, name)
+            self.assertEqual(tuple(image_utils.image_dimensions(path)), SIZE,
+                             name)
+
+    def test_large_dimensions(self):
+        size = (16000, 3)
+        for format in ('JPEG', 'PNG', 'GIF'):
+            path = self.write('large', encode(format, size,
+                                              'P' if format == 'GIF'
+                                              else 'RGB'))
+            self.assertEqual(tuple(image_utils.image_dimensions(path)), size,
+                             format)
+
+    def test_truncated_headers(self):
+        for name, data in samples():
+            # every prefix gives no answer or the right one, never an error
+            for length in range(min(len(data), 400)):
+                path = self.write(name, data[:length])
+                dims = image_utils.image_dimensions(path)
+                if dims is not None:
+                    self.assertEqual(tuple(dims), SIZE, (name, length))
+
+    def test_corrupt_and_unknown(self):
+        for data in (b'', b'not an image at all', b'\xff\xd8\x00\x01\x02',
+                     b'\xff\xd8\xff\xda\x00\x02', b'GIF89a',
+                     b'RIFF\0\0\0\0WEBPXXXX' + b'\0' * 20,
+                     encode('BMP')):
+            path = self.write('x', data)
+            self.assertIsNone(image_utils.image_dimensions(path), data[:20])
+
+    def test_probe_falls_back_to_pil(self):
+        path = self.write('x.bmp', encode('BMP'))
+        self.assertEqual(tuple(models.probe_image_dims(path)), SIZE)
+        path = self.write('x.jpg', b'\xff\xd8garbage')
+        self.assertRaises(IOError, models.probe_image_dims, path)
+
+
+@unittest.skipIf(image_utils is None, 'PIL or django is not installed')
+class TestUpdateImageDims(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(IMAGE_DIR=self.tmpdir)
+        self.settings.enable()
+        Hotel.objects.bulk_create([Hotel(name='Hotel', slug='hotel',
+                                         location_id=1)])
+        self.hotel = Hotel.objects.get()
+
+    def tearDown(self):
+        Hotel.objects.all().delete()
+        self.settings.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def image(self, width, height, data=None):
+        image = HotelImage(resource=self.hotel, width=width, height=height)
+        HotelImage.objects.bulk_create([image])
+        image = HotelImage.objects.order_by('-pk')[0]
+        if data is not None:
+            path = models.image_storage(image).prepare(
+                models.storage_name(image))
+            with open(path, 'wb') as f:
+                f.write(data)
+        return image
+
+    def test_bulk_update(self):
+        stale = self.image(1, 1, encode('JPEG'))
+        unset = self.image(None, None, encode('PNG', (50, 40)))
+        correct = self.image(37, 21, encode('GIF', mode='P'))
+        missing = self.image(5, 5)
+        corrupt = self.image(6, 6, b'\xff\xd8garbage')
+
+        changed = models.update_image_dims(
+            HotelImage.objects.order_by('pk'), workers=2, batch_size=1)
+        self.assertEqual(sorted(image.pk for image in changed),
+                         [stale.pk, unset.pk])
+        dims = dict((image.pk, (image.width, image.height))
+                    for image in HotelImage.objects.all())
+        self.assertEqual(dims, {stale.pk: SIZE, unset.pk: (50, 40),
+                                correct.pk: SIZE, missing.pk: (5, 5),
+                                corrupt.pk: (6, 6)})
+
+    def test_nothing_to_do(self):
+        self.assertEqual(models.update_image_dims([]), [])
+        self.image(37, 21, encode('JPEG'))
+        self.assertEqual(models.update_image_dims(HotelImage.objects.all()),
+                         [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_image_storage
+----------------------------------
+
+Tests for the storage backends of image binaries.
+"""
+
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.commondata import image_storage, models
+    from tests.testapp.models import Hotel, HotelImage
+except ImportError:
+    image_storage = None
+
+PACK_STORAGE = 'dr_django_tools.shared.commondata.image_storage.' \
+    'PackImageStorage'
+
+
+class StorageTests(object):
+    '''Tests every backend has to pass.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(IMAGE_DIR=self.tmpdir)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_read(self):
+        storage = self.storage()
+        self.assertFalse(storage.exists('hotel/1/1.jpg'))
+        storage.save('hotel/1/1.jpg', b'first')
+        storage.save('hotel/1/2.jpg', b'')
+        self.assertTrue(storage.exists('hotel/1/1.jpg'))
+        self.assertEqual(storage.read('hotel/1/1.jpg'), b'first')
+        self.assertEqual(storage.open('hotel/1/1.jpg').read(), b'first')
+        self.assertEqual(storage.read('hotel/1/2.jpg'), b'')
+
+    def test_overwrite(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        storage.save('hotel/1/1.jpg', b'second')
+        self.assertEqual(storage.read('hotel/1/1.jpg'), b'second')
+        self.assertEqual(self.storage().read('hotel/1/1.jpg'), b'second')
+
+    def test_delete(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        storage.delete('hotel/1/1.jpg')
+        self.assertFalse(storage.exists('hotel/1/1.jpg'))
+        self.assertRaises(IOError, storage.read, 'hotel/1/1.jpg')
+        # deleting a missing binary is a no-op
+        storage.delete('hotel/1/1.jpg')
+
+    def test_local_path(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        with open(storage.local_path('hotel/1/1.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'first')
+        storage.save('hotel/1/1.jpg', b'second')
+        with open(storage.local_path('hotel/1/1.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'second')
+
+
+@unittest.skipIf(image_storage is None, 'django is not installed')
+class TestLocalImageStorage(StorageTests, unittest.TestCase):
+
+    def storage(self):
+        return image_storage.LocalImageStorage()
+
+    def test_files(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        path = os.path.join(self.tmpdir, 'hotel', '1', '1.jpg')
+        self.assertEqual(storage.path('hotel/1/1.jpg'), path)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['1.jpg'])
+
+
+@unittest.skipIf(image_storage is None, 'django is not installed')
+class TestPackImageStorage(StorageTests, unittest.TestCase):
+
+    def storage(self, **kwargs):
+        return image_storage.PackImageStorage(**kwargs)
+
+    def test_no_files(self):
+        self.assertRaises(NotImplementedError, self.storage().path,
+                          'hotel/1/1.jpg')
+
+    def test_index_refresh_across_instances(self):
+        writer, reader = self.storage(), self.storage()
+        self.assertFalse(reader.exists('hotel/1/1.jpg'))
+        writer.save('hotel/1/1.jpg', b'first')
+        self.assertEqual(reader.read('hotel/1/1.jpg'), b'first')
+        writer.save('hotel/1/2.jpg', b'second')
+        writer.delete('hotel/1/1.jpg')
+        self.assertFalse(reader.exists('hotel/1/1.jpg'))
+        self.assertEqual(reader.read('hotel/1/2.jpg'), b'second')
+        # a new instance replays the index, tombstones included
+        fresh = self.storage()
+        self.assertFalse(fresh.exists('hotel/1/1.jpg'))
+        self.assertEqual(fresh.read('hotel/1/2.jpg'), b'second')
+
+    def test_save_after_tombstone(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        storage.delete('hotel/1/1.jpg')
+        storage.save('hotel/1/1.jpg', b'again')
+        self.assertEqual(self.storage().read('hotel/1/1.jpg'), b'again')
+
+    def test_partial_index_entry(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        with open(storage._index_path(), 'ab') as f:
+            f.write(b'hotel/1/2.jpg\t0\t5')
+        self.assertFalse(self.storage().exists('hotel/1/2.jpg'))
+        self.assertEqual(self.storage().read('hotel/1/1.jpg'), b'first')
+
+    def test_mmap_read(self):
+        writer, reader = self.storage(), self.storage()
+        writer.save('hotel/1/1.jpg', b'first')
+        self.assertEqual(reader.read('hotel/1/1.jpg'), b'first')
+        self.assertIsInstance(reader._maps[0], mmap.mmap)
+        # the pack grew past the mapping, which is mapped again
+        writer.save('hotel/1/2.jpg', b'second' * 1000)
+        self.assertEqual(reader.read('hotel/1/2.jpg'), b'second' * 1000)
+        self.assertEqual(len(reader._maps[0]), 5 + 6000)
+
+    def test_pack_size(self):
+        storage = self.storage(pack_size=10)
+        for i in range(3):
+            storage.save('hotel/1/%i.jpg' % i, b'12345678')
+        self.assertEqual(sorted(storage._index.values()),
+                         [(0, 0, 8), (1, 0, 8), (2, 0, 8)])
+        reader = self.storage(pack_size=10)
+        for i in range(3):
+            self.assertEqual(reader.read('hotel/1/%i.jpg' % i), b'12345678')
+        reader.save('hotel/1/3.jpg', b'1')
+        self.assertEqual(reader._index['hotel/1/3.jpg'], (2, 8, 1))
+
+    def test_local_path_cache(self):
+        storage = self.storage()
+        storage.save('hotel/1/1.jpg', b'first')
+        path = storage.local_path('hotel/1/1.jpg')
+        self.assertEqual(storage.local_path('hotel/1/1.jpg'), path)
+        self.assertRaises(IOError, storage.local_path, 'hotel/1/2.jpg')
+
+    def test_local_path_cache_is_bounded(self):
+        storage = self.storage(cache_size=2)
+        for i in range(4):
+            storage.save('hotel/1/%i.jpg' % i, b'%i' % i)
+        cache = os.path.join(storage.location, 'cache')
+        first = storage.local_path('hotel/1/0.jpg')
+        os.utime(first, (0, 0))
+        second = storage.local_path('hotel/1/1.jpg')
+        os.utime(second, (1, 1))
+        # a hit marks the file as used
+        storage.local_path('hotel/1/0.jpg')
+        storage.local_path('hotel/1/2.jpg')
+        self.assertEqual(sorted(os.listdir(cache)),
+                         ['00000-0-0.jpg', '00000-2-2.jpg'])
+        path = storage.local_path('hotel/1/3.jpg')
+        self.assertEqual(len(os.listdir(cache)), 2)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'3')
+
+
+class TestStorage(image_storage.LocalImageStorage if image_storage
+                  else object):
+    pass
+
+
+@unittest.skipIf(image_storage is None, 'django is not installed')
+class TestImageRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(
+            IMAGE_DIR=self.tmpdir,
+            IMAGE_STORAGE=PACK_STORAGE,
+            IMAGE_THUMBNAIL_STORAGE='tests.test_image_storage.TestStorage')
+        self.settings.enable()
+        image_storage._storages.clear()
+
+    def tearDown(self):
+        image_storage._storages.clear()
+        self.settings.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_thumbnail_storage(self):
+        photo = HotelImage(id=1, image_type=1)
+        thumbnail = HotelImage(id=2, image_type=models.IMAGE_TYPE_PHOTO_THUMB)
+        rendition = HotelImage(id=3, image_type=models.IMAGE_TYPE_PHOTO_THUMB,
+                               parent_id=1)
+        self.assertIsInstance(models.image_storage(thumbnail), TestStorage)
+        for image in (photo, rendition):
+            self.assertIsInstance(models.image_storage(image),
+                                  image_storage.PackImageStorage)
+
+    def test_file_path_from_pack(self):
+        image = HotelImage(id=1, image_type=1, resource=Hotel(name='x'))
+        name = models.storage_name(image)
+        models.image_storage(image).save(name, b'binary')
+        self.assertEqual(models.binary_source(image).read(), b'binary')
+        with open(image.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'binary')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_image_store
+----------------------------------
+
+Tests for the content addressed storage of image binaries.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.commondata import image_store
+except ImportError:
+    image_store = None
+
+
+def write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def copy_renderer(calls):
+    def renderer(source, target, size):
+        calls.append((source, target, size))
+        shutil.copyfile(source, target)
+    return renderer
+
+
+@unittest.skipIf(image_store is None, 'django is not installed')
+class TestImageStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(IMAGE_DIR=self.tmpdir,
+                                          IMAGE_CONTENT_ADDRESSED=True)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def test_intern_shares_identical_content(self):
+        a, b = self.path('a/1.jpg'), self.path('b/2.jpg')
+        write(a, b'same bytes')
+        write(b, b'same bytes')
+        digest = image_store.intern(a)
+        self.assertEqual(image_store.intern(b), digest)
+        blob = image_store.content_path(digest)
+        self.assertTrue(os.path.samefile(a, blob))
+        self.assertTrue(os.path.samefile(b, blob))
+        self.assertEqual(os.stat(blob).st_nlink, 3)
+        # interning again changes nothing
+        image_store.intern(a)
+        self.assertEqual(os.stat(blob).st_nlink, 3)
+
+    def test_release_removes_last_reference(self):
+        a, b = self.path('a/1.jpg'), self.path('b/2.jpg')
+        write(a, b'same bytes')
+        write(b, b'same bytes')
+        blob = image_store.content_path(image_store.intern(a))
+        image_store.intern(b)
+        image_store.release(a)
+        self.assertFalse(os.path.exists(a))
+        self.assertEqual(os.stat(blob).st_nlink, 2)
+        image_store.release(b)
+        self.assertFalse(os.path.exists(blob))
+        # releasing a missing path is a no-op
+        image_store.release(b)
+
+    def test_detach(self):
+        a = self.path('a/1.jpg')
+        write(a, b'bytes')
+        blob = image_store.content_path(image_store.intern(a))
+        image_store.detach(a)
+        self.assertFalse(os.path.exists(a))
+        self.assertFalse(os.path.exists(blob))
+
+    def test_render_reuses_renditions(self):
+        a, b = self.path('a/1.jpg'), self.path('b/2.jpg')
+        write(a, b'source')
+        write(b, b'source')
+        calls = []
+        image_store.render(a, self.path('a/1-small.jpg'), (10, 10),
+                           copy_renderer(calls))
+        image_store.render(b, self.path('b/2-small.jpg'), (10, 10),
+                           copy_renderer(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(os.path.samefile(self.path('a/1-small.jpg'),
+                                         self.path('b/2-small.jpg')))
+        # another size or variant is rendered again
+        image_store.render(b, self.path('b/2-large.jpg'), (20, 20),
+                           copy_renderer(calls))
+        image_store.render(b, self.path('b/2-small-q.jpg'), (10, 10),
+                           copy_renderer(calls), variant='-q')
+        self.assertEqual(len(calls), 3)
+
+    def test_render_after_release(self):
+        a = self.path('a/1.jpg')
+        write(a, b'source')
+        calls = []
+        target = self.path('a/1-small.jpg')
+        image_store.render(a, target, (10, 10), copy_renderer(calls))
+        image_store.release(target)
+        # the rendition link dangles now and is rendered again
+        image_store.render(a, target, (10, 10), copy_renderer(calls))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(read(target), b'source')
+
+    def test_collect_garbage(self):
+        a, b = self.path('a/1.jpg'), self.path('b/2.jpg')
+        write(a, b'one')
+        write(b, b'two')
+        calls = []
+        image_store.render(a, self.path('a/1-small.jpg'), (10, 10),
+                           copy_renderer(calls))
+        image_store.intern(b)
+        partial = image_store.temp_name(image_store.content_path('ab' * 20))
+        write(partial, b'partial')
+        # a young temporary file may still be renamed into place
+        self.assertEqual(image_store.collect_garbage(), 0)
+        os.utime(partial, (0, 0))
+        self.assertEqual(image_store.collect_garbage(), 1)
+        image_store.release(b)
+        image_store.release(self.path('a/1-small.jpg'))
+        image_store.release(a)
+        # the blobs were released with their last path, the rendition link
+        # to the blob of a is left dangling
+        self.assertEqual(image_store.collect_garbage(), 1)
+        for dirpath, dirnames, filenames in os.walk(
+                image_store.content_dir()):
+            self.assertEqual(filenames, [])
+
+    def test_temp_name_per_thread(self):
+        names = []
+        thread = threading.Thread(
+            target=lambda: names.append(image_store.temp_name('x')))
+        thread.start()
+        thread.join()
+        names.append(image_store.temp_name('x'))
+        self.assertNotEqual(names[0], names[1])
+
+
+@unittest.skipIf(image_store is None, 'django is not installed')
+class TestCrossDevice(TestImageStore):
+    '''The same tests with hard links failing like across devices.'''
+
+    def setUp(self):
+        super(TestCrossDevice, self).setUp()
+        self.link = os.link
+
+        def link(source, target):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        os.link = link
+
+    def tearDown(self):
+        os.link = self.link
+        super(TestCrossDevice, self).tearDown()
+
+    def test_intern_shares_identical_content(self):
+        a = self.path('a/1.jpg')
+        write(a, b'same bytes')
+        blob = image_store.content_path(image_store.intern(a))
+        self.assertEqual(read(blob), b'same bytes')
+        self.assertFalse(os.path.samefile(a, blob))
+
+    def test_release_removes_last_reference(self):
+        a = self.path('a/1.jpg')
+        write(a, b'same bytes')
+        blob = image_store.content_path(image_store.intern(a))
+        image_store.release(a)
+        self.assertFalse(os.path.exists(a))
+        # the copy is only removed by collect_garbage
+        self.assertTrue(os.path.exists(blob))
+        self.assertEqual(image_store.collect_garbage(), 1)
+
+    def test_detach(self):
+        a = self.path('a/1.jpg')
+        write(a, b'bytes')
+        image_store.intern(a)
+        image_store.detach(a)
+        self.assertTrue(os.path.exists(a))
+
+    def test_render_reuses_renditions(self):
+        a, b = self.path('a/1.jpg'), self.path('b/2.jpg')
+        write(a, b'source')
+        write(b, b'source')
+        calls = []
+        image_store.render(a, self.path('a/1-small.jpg'), (10, 10),
+                           copy_renderer(calls))
+        image_store.render(b, self.path('b/2-small.jpg'), (10, 10),
+                           copy_renderer(calls))
+        # the second target is a copy of the stored rendition
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(read(self.path('b/2-small.jpg')), b'source')
+
+    def test_render_after_release(self):
+        a = self.path('a/1.jpg')
+        write(a, b'source')
+        calls = []
+        target = self.path('a/1-small.jpg')
+        image_store.render(a, target, (10, 10), copy_renderer(calls))
+        image_store.release(target)
+        # the stored copy outlives the target
+        image_store.render(a, target, (10, 10), copy_renderer(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(read(target), b'source')
+
+    def test_collect_garbage(self):
+        a = self.path('a/1.jpg')
+        write(a, b'one')
+        calls = []
+        target = self.path('a/1-small.jpg')
+        image_store.render(a, target, (10, 10), copy_renderer(calls))
+        # the copied blob and the rendition link to it, which may only
+        # dangle after the walk passed it
+        removed = image_store.collect_garbage()
+        self.assertEqual(removed + image_store.collect_garbage(), 2)
+        image_store.render(a, target, (10, 10), copy_renderer(calls))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(read(target), b'one')
+
+
+if __name__ == '__main__':
+    unittest.main()
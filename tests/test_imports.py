@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_imports
+----------------------------------
+
+Import-time regression tests: importing the commondata helpers must not pull
+in their heavy optional dependencies.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ['requests', 'pycountry', 'fuzzywuzzy', 'ftputil',
+                 'unidecode', 'PIL', 'PIL.Image']
+
+SCRIPT = '''
+import sys
+try:
+    import %s
+except ImportError:
+    sys.exit(3)
+for name in %r:
+    if name in sys.modules:
+        print(name)
+'''
+
+
+def loaded_after_import(module):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    p = subprocess.Popen([sys.executable, '-c', SCRIPT % (module, HEAVY_MODULES)],
+                         stdout=subprocess.PIPE, env=env)
+    out, _ = p.communicate()
+    return p.returncode, out.decode('utf8').split()
+
+
+class TestImportTime(unittest.TestCase):
+
+    def check(self, module):
+        returncode, loaded = loaded_after_import(module)
+        if returncode == 3:
+            self.skipTest('%s cannot be imported here' % module)
+        self.assertEqual(returncode, 0)
+        self.assertEqual(loaded, [])
+
+    def test_utils(self):
+        self.check('dr_django_tools.shared.commondata.utils')
+
+    def test_image_utils(self):
+        self.check('dr_django_tools.shared.commondata.image_utils')
+
+
+if __name__ == '__main__':
+    unittest.main()
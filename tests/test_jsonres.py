@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_jsonres
+----------------------------------
+
+Tests for the `jsonres` view decorator, its response cache and
+`serialize_values`.
+"""
+
+import datetime
+import json
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.core import serializers
+    from django.core.cache import cache
+    from django.test import RequestFactory
+    from dr_django_tools.shared.django import urlutils
+    from tests.testapp.models import Place
+except ImportError:
+    urlutils = None
+
+FIELDS = ('name', 'rating', 'updated_at')
+
+
+@unittest.skipIf(urlutils is None, 'django is not installed')
+class TestSerializeValues(unittest.TestCase):
+
+    def setUp(self):
+        Place.objects.bulk_create([
+            Place(name='Nice', slug='nice', rating=4,
+                  updated_at=datetime.datetime(2020, 5, 1, 12, 30, 15)),
+            Place(name=u'Caf\xe9', slug='cafe', rating=2),
+        ])
+        self.queryset = Place.objects.order_by('pk')
+        self.places = list(self.queryset)
+
+    def tearDown(self):
+        Place.objects.all().delete()
+
+    def serialize(self, shape):
+        return json.loads(urlutils.serialize_values(self.queryset, FIELDS,
+                                                    shape))
+
+    def test_serializer_shape(self):
+        expected = serializers.serialize('json', self.queryset, fields=FIELDS)
+        self.assertEqual(self.serialize(urlutils.SHAPE_SERIALIZER),
+                         json.loads(expected))
+
+    def test_dict_shape(self):
+        self.assertEqual(self.serialize(urlutils.SHAPE_DICT), [
+            {'pk': self.places[0].pk, 'name': 'Nice', 'rating': 4,
+             'updated_at': '2020-05-01T12:30:15'},
+            {'pk': self.places[1].pk, 'name': u'Caf\xe9', 'rating': 2,
+             'updated_at': None},
+        ])
+
+    def test_rows_shape(self):
+        self.assertEqual(self.serialize(urlutils.SHAPE_ROWS), [
+            [self.places[0].pk, 'Nice', 4, '2020-05-01T12:30:15'],
+            [self.places[1].pk, u'Caf\xe9', 2, None],
+        ])
+
+    def test_fields_projection(self):
+        for shape in urlutils.SHAPES:
+            data = json.loads(urlutils.serialize_values(self.queryset,
+                                                        ('slug',), shape))
+            if shape == urlutils.SHAPE_SERIALIZER:
+                data = [dict(row['fields'], pk=row['pk']) for row in data]
+            elif shape == urlutils.SHAPE_ROWS:
+                data = [dict(zip(('pk', 'slug'), row)) for row in data]
+            self.assertEqual(data, [{'pk': place.pk, 'slug': place.slug}
+                                    for place in self.places], shape)
+
+    def test_decorator(self):
+        @urlutils.jsonres(fields=('name',), shape=urlutils.SHAPE_ROWS)
+        def view(request):
+            return Place.objects.order_by('pk')
+
+        response = view(RequestFactory().get('/places/'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content.decode('utf8')),
+                         [[place.pk, place.name] for place in self.places])
+
+    def test_invalid_shape(self):
+        self.assertRaises(ValueError, urlutils.jsonres, fields=('name',),
+                          shape='xml')
+
+
+class User(object):
+
+    def __init__(self, pk=None):
+        self.pk = pk
+        self.is_authenticated = pk is not None
+
+
+@unittest.skipIf(urlutils is None, 'django is not installed')
+class TestCaching(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        cache.clear()
+
+    def view(self, **options):
+        @urlutils.jsonres(cache_timeout=60, **options)
+        def view(request):
+            self.calls.append(request)
+            user = getattr(request, 'user', None)
+            return {'user': user and user.pk,
+                    'lang': request.META.get('HTTP_ACCEPT_LANGUAGE')}
+        return view
+
+    def get(self, view, path='/x/', user=None, **headers):
+        request = self.factory.get(path, **headers)
+        if user is not None:
+            request.user = user
+        response = view(request)
+        body = None
+        if response.status_code == 200:
+            body = json.loads(response.content.decode('utf8'))
+        return response, body
+
+    def test_cached(self):
+        view = self.view()
+        first, body = self.get(view)
+        second, cached = self.get(view)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(cached, body)
+        self.assertEqual(first['ETag'], second['ETag'])
+        # another path is another entry
+        self.get(view, '/x/?page=2')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_not_modified(self):
+        view = self.view()
+        etag = self.get(view)[0]['ETag']
+        response, body = self.get(view, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response, body = self.get(view, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_version(self):
+        versions = ['1']
+        view = self.view(version=lambda request: versions[0])
+        response, body = self.get(view)
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(self.get(view, HTTP_IF_NONE_MATCH='"1"')[0]
+                         .status_code, 304)
+        versions[0] = '2'
+        response, body = self.get(view, HTTP_IF_NONE_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_per_user(self):
+        view = self.view()
+        self.assertEqual(self.get(view, user=User(1))[1]['user'], 1)
+        self.assertEqual(self.get(view, user=User(2))[1]['user'], 2)
+        self.assertEqual(self.get(view, user=User())[1]['user'], None)
+        response, body = self.get(view, user=User(1))
+        self.assertEqual(body['user'], 1)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(response['Vary'], 'Cookie')
+
+    def test_explicit_key_is_shared(self):
+        view = self.view(cache_key=lambda request: 'all')
+        self.get(view, user=User(1))
+        self.assertEqual(self.get(view, user=User(2))[1]['user'], 1)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_vary_on(self):
+        view = self.view(vary_on=('Accept-Language',))
+        response, body = self.get(view, HTTP_ACCEPT_LANGUAGE='fr')
+        self.assertEqual(body['lang'], 'fr')
+        self.assertEqual(response['Vary'], 'Accept-Language')
+        self.assertEqual(self.get(view, HTTP_ACCEPT_LANGUAGE='de')[1]['lang'],
+                         'de')
+        self.assertEqual(self.get(view, HTTP_ACCEPT_LANGUAGE='fr')[1]['lang'],
+                         'fr')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_post_is_not_cached(self):
+        view = self.view()
+        view(self.factory.post('/x/'))
+        view(self.factory.post('/x/'))
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
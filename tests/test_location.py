@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_location
+----------------------------------
+
+Tests for `get_location` and its process local and shared caches.
+"""
+
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from cities.models import City, Country, Region
+    # connects invalidate_locations to the cities models
+    from dr_django_tools.shared.commondata import models  # noqa
+    from dr_django_tools.shared.commondata import utils
+except ImportError:
+    utils = None
+
+
+@unittest.skipIf(utils is None, 'django is not installed')
+class TestGetLocation(unittest.TestCase):
+
+    def setUp(self):
+        self.country = Country.objects.create(name='France', slug='france',
+                                              code='FR')
+        self.region = Region.objects.create(name='Provence', slug='provence',
+                                            code='PR', country=self.country)
+        self.city = City.objects.create(name='Nice', slug='nice',
+                                        country=self.country,
+                                        region=self.region)
+        self.ttl = utils.LOCATION_LOCAL_TTL
+        utils.invalidate_locations()
+
+    def tearDown(self):
+        utils.LOCATION_LOCAL_TTL = self.ttl
+        Country.objects.all().delete()
+        utils.invalidate_locations()
+        cache.clear()
+
+    def queries(self, *slugs):
+        with CaptureQueriesContext(connection) as ctx:
+            location = utils.get_location(*slugs)
+        return location, len(ctx.captured_queries)
+
+    def test_levels(self):
+        for slugs, type_, item in [
+                (('france', '-', '-'), 'country', self.country),
+                (('france', 'provence', '-'), 'region', self.region),
+                (('france', 'provence', 'nice'), 'city', self.city)]:
+            location, queries = self.queries(*slugs)
+            self.assertEqual((location.type_, location.id),
+                             (type_, item.id))
+            self.assertEqual(queries, 1)
+            # the related objects came with the query
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(location.url_args(), list(slugs))
+            self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_missing_levels(self):
+        for slugs, exception in [
+                (('spain', '-', '-'), Country.DoesNotExist),
+                (('spain', 'provence', '-'), Country.DoesNotExist),
+                (('france', 'alps', '-'), Region.DoesNotExist),
+                (('spain', 'provence', 'nice'), Country.DoesNotExist),
+                (('france', 'alps', 'nice'), Region.DoesNotExist),
+                (('france', 'provence', 'cannes'), City.DoesNotExist)]:
+            self.assertRaises(exception, utils.get_location, *slugs)
+
+    def test_copies(self):
+        first = utils.get_location('france', 'provence', 'nice')
+        first.item.name = 'changed'
+        first.item.region.name = 'changed'
+        for flush_local in (False, True):
+            if flush_local:
+                utils._location_cache.clear()
+            location, queries = self.queries('france', 'provence', 'nice')
+            self.assertEqual(queries, 0)
+            self.assertIsNot(location, first)
+            self.assertEqual(location.item.name, 'Nice')
+            self.assertEqual(location.item.region.name, 'Provence')
+
+    def test_local_and_shared_cache(self):
+        self.queries('france', 'provence', '-')
+        self.assertEqual(self.queries('france', 'provence', '-')[1], 0)
+        # a new process: only the shared cache has it
+        utils._location_cache.clear()
+        self.assertEqual(self.queries('france', 'provence', '-')[1], 0)
+
+    def test_without_shared_cache(self):
+        with override_settings(LOCATION_CACHE_ALIAS=None):
+            self.queries('france', '-', '-')
+            self.assertEqual(self.queries('france', '-', '-')[1], 0)
+            utils._location_cache.clear()
+            self.assertEqual(self.queries('france', '-', '-')[1], 1)
+
+    def test_local_ttl(self):
+        utils.LOCATION_LOCAL_TTL = 0
+        self.queries('france', '-', '-')
+        # another process invalidated the shared cache
+        cache.incr(utils._LOCATION_GENERATION_KEY)
+        self.assertEqual(self.queries('france', '-', '-')[1], 1)
+        with override_settings(LOCATION_CACHE_ALIAS=None):
+            self.assertEqual(self.queries('france', '-', '-')[1], 1)
+
+    def test_invalidated_by_signals(self):
+        self.queries('france', 'provence', 'nice')
+        self.city.name = 'Nizza'
+        self.city.save()
+        location, queries = self.queries('france', 'provence', 'nice')
+        self.assertEqual((location.item.name, queries), ('Nizza', 1))
+
+        self.region.name = 'PACA'
+        self.region.save()
+        location = utils.get_location('france', 'provence', 'nice')
+        self.assertEqual(location.item.region.name, 'PACA')
+
+        self.city.delete()
+        self.assertRaises(City.DoesNotExist, utils.get_location, 'france',
+                          'provence', 'nice')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+
+Tests for the instrumentation hooks and sinks.
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from dr_django_tools.shared.commondata import metrics, utils
+except ImportError:
+    metrics = None
+
+try:
+    import PIL  # noqa
+except ImportError:
+    PIL = None
+
+# resizes without any Django settings, as a script or benchmark would
+UNCONFIGURED = '''
+import os, sys
+from PIL import Image
+from dr_django_tools.shared.commondata import image_utils
+source, target = sys.argv[1:]
+Image.new('RGB', (300, 200)).save(source, 'JPEG')
+image_utils.resize_and_crop(source, target, (120, 70))
+print(Image.open(target).size)
+'''
+
+
+@unittest.skipIf(metrics is None, 'django is not installed')
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.sink = metrics.add_sink(metrics.MemorySink())
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_disabled(self):
+        metrics.remove_sink(self.sink)
+        self.assertFalse(metrics.enabled())
+        with metrics.timer('x'):
+            pass
+        metrics.incr('y')
+        self.assertEqual(self.sink.timings, {})
+        self.assertEqual(self.sink.counts, {})
+
+    def test_timer_and_counters(self):
+        with metrics.timer('stage'):
+            pass
+        metrics.incr('calls')
+        metrics.incr('calls', 2)
+        metrics.add_bytes('stage.bytes', 100)
+        self.assertEqual(len(self.sink.timings['stage']), 1)
+        self.assertEqual(self.sink.counts, {'calls': 3, 'stage.bytes': 100})
+
+    def test_timed_counts_errors(self):
+        @metrics.timed('fails')
+        def fails():
+            raise ValueError()
+        self.assertRaises(ValueError, fails)
+        self.assertEqual(len(self.sink.timings['fails']), 1)
+        self.assertEqual(self.sink.counts['fails.errors'], 1)
+
+    def test_percentiles(self):
+        for ms in range(1, 101):
+            self.sink.timing('t', float(ms))
+        summary = self.sink.summary('t')
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual((summary['p50'], summary['p95'], summary['p99']),
+                         (50.0, 95.0, 99.0))
+        self.assertEqual(summary['max'], 100.0)
+        self.assertEqual(self.sink.percentile('t', 100), 100.0)
+        self.assertEqual(self.sink.percentile('t', 0), 1.0)
+        self.assertIsNone(self.sink.summary('missing'))
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            sink = metrics.StatsdSink('127.0.0.1', server.getsockname()[1],
+                                      prefix='img.')
+            sink.count('grab.bytes', 42)
+            self.assertEqual(server.recv(512), b'img.grab.bytes:42|c')
+            sink.timing('grab', 1.5)
+            self.assertEqual(server.recv(512), b'img.grab:1.500|ms')
+        finally:
+            server.close()
+
+    def test_grab_is_instrumented(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmpdir, 'source')
+            with open(source, 'wb') as f:
+                f.write(b'x' * 1000)
+            utils.grab(source, os.path.join(tmpdir, 'target'))
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(len(self.sink.timings['grab']), 1)
+        self.assertEqual(self.sink.counts['grab.bytes'], 1000)
+
+
+@unittest.skipIf(metrics is None or PIL is None,
+                 'django or PIL is not installed')
+class TestWithoutSettings(unittest.TestCase):
+
+    def test_resize_and_crop(self):
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        output = subprocess.check_output(
+            [sys.executable, '-c', UNCONFIGURED,
+             os.path.join(tmpdir, 'source.jpg'),
+             os.path.join(tmpdir, 'target.jpg')], cwd=root, env=env)
+        self.assertEqual(output.strip(), b'(120, 70)')
+
+
+if __name__ == '__main__':
+    unittest.main()
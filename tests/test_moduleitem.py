@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_moduleitem
+----------------------------------
+
+Tests for the cached dotted path resolver.
+"""
+
+import os.path
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.core.exceptions import ImproperlyConfigured
+    from dr_django_tools.shared.commondata import utils
+except ImportError:
+    utils = None
+
+
+@unittest.skipIf(utils is None, 'django is not installed')
+class TestModuleItem(unittest.TestCase):
+
+    def setUp(self):
+        utils._moduleitems.clear()
+
+    def tearDown(self):
+        utils._moduleitems.clear()
+
+    def test_resolve(self):
+        self.assertIs(utils.moduleitem('os.path.join'), os.path.join)
+        self.assertIs(utils.moduleitem('os.path'), os.path)
+
+    def test_cached(self):
+        utils.moduleitem('os.path.join')
+        utils._moduleitems['os.path.join'] = 'cached'
+        self.assertEqual(utils.moduleitem('os.path.join'), 'cached')
+
+    def test_bounded(self):
+        size = utils.MODULEITEM_CACHE_SIZE
+        utils.MODULEITEM_CACHE_SIZE = 2
+        try:
+            for name in ('join', 'split', 'basename'):
+                utils.moduleitem('os.path.' + name)
+        finally:
+            utils.MODULEITEM_CACHE_SIZE = size
+        self.assertEqual(list(utils._moduleitems),
+                         ['os.path.split', 'os.path.basename'])
+
+    def test_errors(self):
+        for path, message in [
+                ('join', 'not a dotted path'),
+                ('no_such_module_x.item', "Could not import "
+                                          "'no_such_module_x.item'"),
+                ('os.path.no_such_item', "module 'os.path' has no item "
+                                         "'no_such_item'")]:
+            try:
+                utils.moduleitem(path)
+            except ImportError as e:
+                self.assertIn(message, str(e))
+            else:
+                self.fail('%s resolved' % path)
+        self.assertEqual(len(utils._moduleitems), 0)
+
+    def test_configured_item(self):
+        self.assertIs(utils.configured_item('HOOK', 'os.path.join'),
+                      os.path.join)
+        self.assertIs(utils.configured_item('HOOK', os.path.split),
+                      os.path.split)
+        try:
+            utils.configured_item('HOOK', 'os.path.no_such_item')
+        except ImproperlyConfigured as e:
+            self.assertTrue(str(e).startswith('HOOK: '), str(e))
+        else:
+            self.fail('no ImproperlyConfigured')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiling
+----------------------------------
+
+Tests for the query profiler.  Most queries are simulated by appending to
+the connection's query log; the test client tests run real ones.
+"""
+
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.core.signals import request_started
+    from django.db import DEFAULT_DB_ALIAS, connections, reset_queries
+    from django.test import Client
+    from tests.testapp.models import Place
+    from dr_django_tools.shared.commondata import profiling
+except ImportError:
+    profiling = None
+
+
+def run_queries(n):
+    log = connections[DEFAULT_DB_ALIAS].queries_log
+    for x in range(n):
+        log.append({'sql': 'SELECT %i' % x, 'time': '0.000'})
+
+
+if profiling is not None:
+    @profiling.profiled('photo')
+    def photo():
+        run_queries(2)
+
+    @profiling.profiled('listing')
+    def listing(n):
+        run_queries(1)
+        for x in range(n):
+            photo()
+
+    @profiling.profiled('nested')
+    def nested(depth):
+        run_queries(1)
+        if depth:
+            nested(depth - 1)
+
+
+@unittest.skipIf(profiling is None, 'django is not installed')
+class TestProfile(unittest.TestCase):
+
+    def test_attribution(self):
+        with profiling.Profile() as profile:
+            listing(3)
+            run_queries(1)
+        self.assertEqual(profile.queries, 8)
+        self.assertEqual(profile.stats['listing'].queries, 7)
+        self.assertEqual(profile.stats['listing'].calls, 1)
+        self.assertEqual(profile.stats['photo'].queries, 6)
+        self.assertEqual(profile.stats['photo'].calls, 3)
+        report = profile.report()
+        self.assertTrue(report[0].startswith('total: 8 queries'))
+        self.assertTrue(report[1].startswith('listing: 7 queries'))
+        self.assertTrue(report[2].endswith('(3 calls)'))
+
+    def test_recursion_counted_once(self):
+        with profiling.Profile() as profile:
+            nested(3)
+        self.assertEqual(profile.stats['nested'].queries, 4)
+        self.assertEqual(profile.stats['nested'].calls, 1)
+
+    def test_inactive(self):
+        listing(2)
+        with profiling.section('x'):
+            run_queries(1)
+        with profiling.Profile() as profile:
+            pass
+        self.assertEqual(profile.queries, 0)
+        self.assertEqual(dict(profile.stats), {})
+
+    def test_nested_profiles(self):
+        with profiling.Profile() as outer:
+            photo()
+            with profiling.Profile() as inner:
+                photo()
+        self.assertEqual(outer.stats['photo'].calls, 2)
+        self.assertEqual(inner.stats['photo'].calls, 1)
+
+    def test_debug_cursor_restored(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        before = connection.force_debug_cursor
+        with profiling.Profile():
+            self.assertTrue(connection.force_debug_cursor)
+        self.assertEqual(connection.force_debug_cursor, before)
+
+
+@unittest.skipIf(profiling is None, 'django is not installed')
+class TestQueryBudget(unittest.TestCase):
+
+    def test_within_budget(self):
+        with profiling.query_budget(7, listing=7, photo=6):
+            listing(3)
+
+    def test_total_exceeded(self):
+        with self.assertRaises(profiling.QueryBudgetExceeded) as cm:
+            with profiling.query_budget(5):
+                listing(3)
+        self.assertIn('total: 7 queries, budget 5', str(cm.exception))
+        self.assertIn('photo: 6 queries', str(cm.exception))
+
+    def test_label_exceeded(self):
+        self.assertRaises(profiling.QueryBudgetExceeded,
+                          self._run_with_budget, photo=5)
+
+    def _run_with_budget(self, **budgets):
+        with profiling.query_budget(**budgets):
+            listing(3)
+
+
+@unittest.skipIf(profiling is None, 'django is not installed')
+class TestRequests(unittest.TestCase):
+
+    def setUp(self):
+        Place.objects.bulk_create([Place(name='a'), Place(name='b')])
+
+    def tearDown(self):
+        Place.objects.all().delete()
+
+    def test_queries_in_requests_are_counted(self):
+        client = Client()
+        with profiling.Profile() as profile:
+            for x in range(3):
+                self.assertEqual(client.get('/places/').content, b'2')
+            list(Place.objects.all())
+        self.assertEqual(profile.queries, 4)
+
+    def test_budget_through_test_client(self):
+        client = Client()
+        with self.assertRaises(profiling.QueryBudgetExceeded):
+            with profiling.query_budget(2):
+                for x in range(3):
+                    client.get('/places/')
+
+    def test_reset_queries_reconnected(self):
+        with profiling.Profile():
+            with profiling.Profile():
+                pass
+            self.assertFalse(self._reset_connected())
+        self.assertTrue(self._reset_connected())
+
+    def _reset_connected(self):
+        connected = request_started.disconnect(reset_queries)
+        if connected:
+            request_started.connect(reset_queries)
+        return connected
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_resize
+----------------------------------
+
+Tests for the crop geometry and resampling of `resize_and_crop`.
+"""
+
+import io
+import unittest
+
+try:
+    from PIL import Image
+    from tests import support
+    support.configure()
+    from dr_django_tools.shared.commondata import image_utils
+except ImportError:
+    image_utils = None
+
+
+def jpeg(size, color=(200, 120, 40), mode='RGB'):
+    buf = io.BytesIO()
+    Image.new(mode, size, color).save(buf, 'JPEG', quality=95)
+    buf.seek(0)
+    return buf
+
+
+@unittest.skipIf(image_utils is None, 'PIL or django is not installed')
+class TestCropBox(unittest.TestCase):
+
+    def test_same_ratio_keeps_everything(self):
+        self.assertEqual(image_utils.crop_box((240, 140), (120, 70)),
+                         (0, 0, 240, 140))
+
+    def test_vertical_crop(self):
+        self.assertEqual(image_utils.crop_box((600, 600), (120, 60), 'top'),
+                         (0, 0, 600, 300))
+        self.assertEqual(
+            image_utils.crop_box((600, 600), (120, 60), 'middle'),
+            (0, 150, 600, 450))
+        self.assertEqual(
+            image_utils.crop_box((600, 600), (120, 60), 'bottom'),
+            (0, 300, 600, 600))
+
+    def test_horizontal_crop(self):
+        self.assertEqual(
+            image_utils.crop_box((800, 200), (100, 100), 'middle'),
+            (300, 0, 500, 200))
+
+    def test_invalid_crop_type(self):
+        self.assertRaises(ValueError, image_utils.crop_box, (600, 600),
+                          (120, 60), 'left')
+
+
+@unittest.skipIf(image_utils is None, 'PIL or django is not installed')
+class TestResizeAndCrop(unittest.TestCase):
+
+    def resize(self, source, size, crop_type='middle'):
+        out = io.BytesIO()
+        image_utils.resize_and_crop(source, out, size, crop_type,
+                                    profile={'format': 'PNG'})
+        out.seek(0)
+        return Image.open(out)
+
+    def test_large_downscale(self):
+        img = self.resize(jpeg((3000, 2000)), (120, 70))
+        self.assertEqual((img.mode, img.size), ('RGB', (120, 70)))
+        for channel, expected in zip(img.getpixel((60, 35)), (200, 120, 40)):
+            self.assertTrue(abs(channel - expected) <= 3)
+
+    def test_keeps_cropped_region(self):
+        # left half red, right half blue: a middle crop to a tall box keeps
+        # the border between them in the middle
+        img = Image.new('RGB', (800, 200), (255, 0, 0))
+        img.paste((0, 0, 255), (400, 0, 800, 200))
+        buf = io.BytesIO()
+        img.save(buf, 'PNG')
+        buf.seek(0)
+        out = self.resize(buf, (50, 100))
+        self.assertEqual(out.getpixel((5, 50)), (255, 0, 0))
+        self.assertEqual(out.getpixel((45, 50)), (0, 0, 255))
+
+    def test_grayscale_and_palette_sources(self):
+        self.assertEqual(self.resize(jpeg((640, 480), 128, 'L'),
+                                     (120, 70)).mode, 'RGB')
+        buf = io.BytesIO()
+        Image.new('P', (640, 480), 3).save(buf, 'PNG')
+        buf.seek(0)
+        self.assertEqual(self.resize(buf, (120, 70)).size, (120, 70))
+
+    def test_upscale(self):
+        self.assertEqual(self.resize(jpeg((60, 40)), (120, 70)).size,
+                         (120, 70))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sitemap
+----------------------------------
+
+Tests for `sitemap.Columnizer` and `sitemap.SiteMap`.
+"""
+
+import datetime
+import unittest
+from xml.etree import ElementTree as etree
+
+try:
+    from tests import support
+    support.configure()
+    from django.db import connection
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.django import sitemap
+    from tests.testapp.models import Place
+except ImportError:
+    sitemap = None
+
+
+def reference_columns(results, collen):
+    cols = []
+    count = len(results)
+    multiple = int(count / collen)
+    if count % collen > 0:
+        multiple += 1
+    for (x, res) in enumerate(results):
+        if x % multiple == 0:
+            row = []
+            cols.append(row)
+        row.append(res)
+    return cols
+
+
+@unittest.skipIf(sitemap is None, 'django is not installed')
+class TestColumnizer(unittest.TestCase):
+
+    def test_matches_reference(self):
+        for n in range(40):
+            data = list(range(n))
+            for collen in range(1, 8):
+                expected = reference_columns(data, collen)
+                for results in (data, tuple(data), iter(data)):
+                    self.assertEqual(
+                        getattr(sitemap.Columnizer(results), str(collen)),
+                        expected, (n, collen))
+
+    def test_generator_is_read_once(self):
+        columnizer = sitemap.Columnizer(x for x in range(10))
+        self.assertEqual(getattr(columnizer, '3'),
+                         [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertEqual(getattr(columnizer, '2'),
+                         [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]])
+        self.assertEqual(columnizer.count, 10)
+
+    def test_columns_are_cached(self):
+        columnizer = sitemap.Columnizer([1, 2, 3])
+        self.assertIs(getattr(columnizer, '2'), getattr(columnizer, '2'))
+
+    def test_non_numeric_attribute(self):
+        columnizer = sitemap.Columnizer([1, 2, 3])
+        self.assertRaises(AttributeError, getattr, columnizer, 'foo')
+        self.assertFalse(hasattr(columnizer, '__html__'))
+
+
+@unittest.skipIf(sitemap is None, 'django is not installed')
+class TestColumnizerQuerySet(unittest.TestCase):
+
+    def setUp(self):
+        Place.objects.bulk_create([Place(name='place %i' % i, slug='p%i' % i)
+                                   for i in range(10)])
+        self.names = sorted(Place.objects.values_list('name', flat=True))
+
+    def tearDown(self):
+        Place.objects.all().delete()
+
+    def names_of(self, cols):
+        return [[place.name for place in col] for col in cols]
+
+    def test_ordered_queryset_is_sliced(self):
+        columnizer = sitemap.Columnizer(Place.objects.order_by('name'))
+        with CaptureQueriesContext(connection) as ctx:
+            cols = getattr(columnizer, '3')
+        # one COUNT and one LIMIT/OFFSET query per column
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertEqual(self.names_of(cols),
+                         reference_columns(self.names, 3))
+
+    def test_unordered_queryset_is_read_once(self):
+        queryset = Place.objects.all()
+        self.assertFalse(queryset.ordered)
+        columnizer = sitemap.Columnizer(queryset)
+        with CaptureQueriesContext(connection) as ctx:
+            cols = getattr(columnizer, '3')
+            self.assertEqual(getattr(columnizer, '4'),
+                             reference_columns(columnizer.results, 4))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('LIMIT', ctx.captured_queries[0]['sql'])
+        # every row exactly once
+        self.assertEqual(sorted(sum(self.names_of(cols), [])), self.names)
+
+
+def reference_render(sm, request):
+    # the ElementTree rendering SiteMap.render used to do
+    root = etree.Element(sm.top_type)
+    root.set('xmlns', 'http://www.sitemaps.org/schemas/sitemap/0.9')
+    for k, entry in enumerate(sm._entries):
+        url_el = etree.SubElement(root, sm.sub_type)
+        loc_el = etree.SubElement(url_el, 'loc')
+        loc_el.text = request.build_absolute_uri(entry)
+        try:
+            if sm._last_modified[k]:
+                loc_el = etree.SubElement(url_el, 'lastmod')
+                loc_el.text = sm._last_modified[k].strftime('%Y-%m-%d')
+        except IndexError:
+            pass
+        if sm.sub_type == 'url':
+            loc_el = etree.SubElement(url_el, 'changefreq')
+            loc_el.text = sm.change_freq
+    return etree.tostring(root)
+
+
+class FakeQuerySet(object):
+    # records the values_list() call a QuerySetSource makes
+    def __init__(self, rows):
+        self.rows = rows
+        self.selected = None
+
+    def values_list(self, *fields):
+        self.selected = fields
+        return self
+
+    def iterator(self):
+        return iter(self.rows)
+
+
+class Page(object):
+    def get_absolute_url(self):
+        return '/pages/about/'
+
+
+ENTRIES = [
+    '/',
+    '/destinations/france/provence/nice/',
+    '/search/?q=a&b=<c>',
+    '/a/../b/./c',
+    '//other.org/x',
+    'relative/path',
+    'http://example.org/abs?x=1#f',
+    u'/caf\xe9 bar/',
+    '/semi;colon/',
+    '/%7Euser/',
+]
+
+
+@unittest.skipIf(sitemap is None, 'django is not installed')
+class TestSiteMap(unittest.TestCase):
+
+    def setUp(self):
+        hosts = override_settings(ALLOWED_HOSTS=['testserver', 'example.com'])
+        hosts.enable()
+        self.addCleanup(hosts.disable)
+        factory = RequestFactory()
+        self.requests = [
+            factory.get('/sitemap.xml'),
+            factory.get('/sitemap.xml', secure=True,
+                        HTTP_HOST='example.com:8443'),
+        ]
+
+    def test_matches_etree_rendering(self):
+        lastmod = [datetime.date(2020, 1, 2), None,
+                   datetime.datetime(2021, 3, 4, 5, 6)]
+        for cls in (sitemap.SiteMap, sitemap.SiteMapIndex):
+            for entries in ([], ENTRIES):
+                for request in self.requests:
+                    sm = cls(entries)
+                    sm._last_modified = list(lastmod)
+                    self.assertEqual(sm.render(request).content,
+                                     reference_render(sm, request))
+
+    def test_add_objects_with_lastmod(self):
+        sm = sitemap.SiteMap(['/first/'])
+        sm.add(Page(), datetime.date(2020, 5, 6))
+        content = sm.render(self.requests[0]).content
+        self.assertEqual(
+            content,
+            b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            b'<url><loc>http://testserver/first/</loc>'
+            b'<changefreq>monthly</changefreq></url>'
+            b'<url><loc>http://testserver/pages/about/</loc>'
+            b'<lastmod>2020-05-06</lastmod>'
+            b'<changefreq>monthly</changefreq></url></urlset>')
+
+    def test_add_queryset(self):
+        qs = FakeQuerySet([('nice', datetime.date(2020, 1, 2)),
+                           ('paris', None)])
+        sm = sitemap.SiteMap(['/'])
+        sm.add_queryset(qs, '/cities/%s/')
+        self.assertEqual(list(sm.iter_entries()),
+                         [('/', None),
+                          ('/cities/nice/', datetime.date(2020, 1, 2)),
+                          ('/cities/paris/', None)])
+        self.assertEqual(qs.selected, ('slug', 'updated_at'))
+
+    def test_add_queryset_with_url_function(self):
+        qs = FakeQuerySet([(1, 'a'), (2, 'b')])
+        sm = sitemap.SiteMap()
+        sm.add_queryset(qs, lambda pk, slug: '/%s-%i/' % (slug, pk),
+                        fields=('pk', 'slug'), lastmod_field=None)
+        self.assertEqual(list(sm.iter_entries()),
+                         [('/a-1/', None), ('/b-2/', None)])
+        self.assertEqual(qs.selected, ('pk', 'slug'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_slugs
+----------------------------------
+
+Tests for the compiled slug templates.
+"""
+
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.core.exceptions import FieldDoesNotExist
+    from django.test.utils import override_settings
+    from dr_django_tools.shared.commondata import slugs
+except ImportError:
+    slugs = None
+
+
+class Obj(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Meta(object):
+    label = 'places.Place'
+
+    def get_field(self, name):
+        raise FieldDoesNotExist(name)
+
+
+class Place(Obj):
+    _meta = Meta()
+
+
+def hook(obj, additional_context=None):
+    if additional_context:
+        return u'hook %(resource_name)s' % additional_context
+    return u'hook %s' % obj.name
+
+
+@unittest.skipIf(slugs is None, 'django is not installed')
+class TestSlugTemplate(unittest.TestCase):
+
+    def test_format(self):
+        t = slugs.SlugTemplate('{name} in {city.name}')
+        self.assertEqual(t.fields, ('name', 'city.name'))
+        self.assertEqual(t.render(Obj(name=u'Caf\xe9', city=Obj(name='Nice'))),
+                         u'Caf\xe9 in Nice')
+
+    def test_percent(self):
+        t = slugs.SlugTemplate('%(name)s in %(city.name)s')
+        self.assertEqual(t.render(Obj(name='Hotel', city=Obj(name='Nice'))),
+                         u'Hotel in Nice')
+
+    def test_missing_and_none_render_empty(self):
+        t = slugs.SlugTemplate('{name}-{city.name}-{other}')
+        self.assertEqual(t.render(Obj(name=None, city=None)), u'--')
+
+    def test_spec_and_literal_braces(self):
+        t = slugs.SlugTemplate('{{x}} {stars:>3} {name!r}')
+        self.assertEqual(t.render(Obj(stars=5, name='a')), u"{x}   5 u'a'"
+                         if str is bytes else u"{x}   5 'a'")
+
+    def test_context(self):
+        t = slugs.SlugTemplate('{resource_name} {description}')
+        self.assertTrue(t.uses_context)
+        self.assertEqual(t.render(Obj(description='pool'),
+                                  {'resource_name': 'Hotel'}),
+                         u'Hotel pool')
+        self.assertFalse(slugs.SlugTemplate('{name}').uses_context)
+
+
+@unittest.skipIf(slugs is None, 'django is not installed')
+class TestSlugBase(unittest.TestCase):
+
+    def setUp(self):
+        self.override = override_settings(
+            RESOURCE_SLUG_BASE=hook,
+            COMPILED_SLUG_TEMPLATES=True,
+            SLUG_TEMPLATES={'Place': '{name} {code}'},
+            IMAGE_SLUG_TEMPLATES={})
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+
+    def test_template_by_class_name(self):
+        self.assertEqual(slugs.slug_base(Place(name='a', code='b')), u'a b')
+
+    def test_label_wins(self):
+        with override_settings(SLUG_TEMPLATES={'Place': '{name}',
+                                               'places.Place': '{code}'}):
+            self.assertEqual(slugs.slug_base(Place(name='a', code='b')),
+                             u'b')
+
+    def test_hook_without_template(self):
+        image = Place(resource=Obj(name='Hotel'), description='')
+        self.assertEqual(slugs.slug_base(image, image=True), u'hook Hotel')
+        with override_settings(SLUG_TEMPLATES={}):
+            self.assertEqual(slugs.slug_base(Place(name='a')), u'hook a')
+
+    def test_hook_by_default(self):
+        with override_settings(COMPILED_SLUG_TEMPLATES=False):
+            self.assertEqual(slugs.slug_base(Place(name='a', code='b')),
+                             u'hook a')
+            self.assertEqual(slugs.slug_bases([Place(name='a', code='b')]),
+                             [u'hook a'])
+        self.assertEqual(slugs.slug_base(Place(name='a', code='b')), u'a b')
+
+    def test_bases(self):
+        objects = [Place(name='a', code=1), Place(name='b', code=2)]
+        self.assertEqual(slugs.slug_bases(objects), [u'a 1', u'b 2'])
+        self.assertEqual(slugs.slug_bases([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_text
+----------------------------------
+
+Equivalence tests for `strip_tags` and `shorten` against the HTMLParser
+based `MLStripper` they replaced.
+"""
+
+import random
+import sys
+import unittest
+
+try:
+    from dr_django_tools.shared.commondata import utils
+except ImportError:
+    utils = None
+
+# the reference MLStripper is written against the Python 2 HTMLParser
+skip_reason = None
+if utils is None:
+    skip_reason = 'commondata dependencies are not installed'
+elif sys.version_info[0] > 2:
+    skip_reason = 'MLStripper reference needs the Python 2 HTMLParser'
+
+
+SAMPLES = [
+    u'',
+    u'plain text',
+    u'<p>Hello <b>World</b></p>',
+    u'AT&T &amp; co &#169; &#x27;x&#x27; &nbsp;end',
+    u'a < b and c > d',
+    u'trailing <',
+    u'trailing &',
+    u'<!-- comment --> x <!DOCTYPE html><?xml version="1.0"?>',
+    u'<a title="x>y">link</a>',
+    u'<script>if (a<b) x();</script>after',
+    u'<style>p {}</style>styled',
+    u'<script src="x.js"/>self closed',
+    u'<br/>line<br />two',
+    u'unclosed <b',
+    u'unclosed <!-- comment',
+    u'caf\xe9 <i>na\xefve</i>',
+    u'<![CDATA[x]]>y',
+    u'5 &1 & 2',
+    u"<p>Don't <b>stop</b></p>",
+    u'<p\nclass="a">multi\nline</p>',
+]
+
+FUZZ_TOKENS = [u'<', u'>', u'&', u';', u'#', u'x', u'a', u'b', u'p', u'/',
+               u'!', u'-', u'"', u"'", u' ', u'1', u'=', u'?', u'\n', u'<b>',
+               u'</b>', u'&amp;', u'<!--', u'-->', u'script']
+
+
+def reference_strip_tags(html):
+    s = utils.MLStripper()
+    s.feed(html)
+    return s.get_data()
+
+
+def reference_shorten(text, width):
+    text = reference_strip_tags(text or u'')
+    if len(text) < width:
+        return text
+    res = u''
+    for x in text.strip().split():
+        res += u' ' + x
+        if len(res) >= width:
+            break
+    if len(res) >= width:
+        res += u' ...'
+    return res
+
+
+@unittest.skipIf(skip_reason, skip_reason)
+class TestStripTags(unittest.TestCase):
+
+    def test_samples(self):
+        for html in SAMPLES:
+            self.assertEqual(utils.strip_tags(html),
+                             reference_strip_tags(html), repr(html))
+
+    def test_fuzz(self):
+        rand = random.Random(7)
+        for x in range(5000):
+            html = u''.join(rand.choice(FUZZ_TOKENS)
+                            for y in range(rand.randint(0, 12)))
+            self.assertEqual(utils.strip_tags(html),
+                             reference_strip_tags(html), repr(html))
+
+    def test_many(self):
+        self.assertEqual(utils.strip_tags_many(SAMPLES),
+                         [reference_strip_tags(x) for x in SAMPLES])
+
+
+@unittest.skipIf(skip_reason, skip_reason)
+class TestShorten(unittest.TestCase):
+
+    def test_short_text_is_returned_stripped(self):
+        self.assertEqual(utils.shorten(u'<b>short</b>', 20), u'short')
+        self.assertEqual(utils.shorten(None, 20), u'')
+
+    def test_cut_after_width(self):
+        self.assertEqual(utils.shorten(u'<p>one two <i>three</i> four</p>', 8),
+                         u' one two ...')
+
+    def test_word_split_by_tags_is_kept_whole(self):
+        self.assertEqual(utils.shorten(u'ab<b>cd</b>ef gh', 3),
+                         u' abcdef ...')
+
+    def test_fuzz(self):
+        rand = random.Random(11)
+        words = [u'alpha', u'<b>be', u'ta</b>', u'gamma', u'&amp;', u'\n',
+                 u'  ', u'<br>', u'delta-epsilon', u'x']
+        for x in range(2000):
+            text = u' '.join(rand.choice(words)
+                             for y in range(rand.randint(0, 30)))
+            width = rand.randint(1, 80)
+            self.assertEqual(utils.shorten(text, width),
+                             reference_shorten(text, width),
+                             '%r %i' % (text, width))
+
+    def test_many(self):
+        self.assertEqual(utils.shorten_many([u'one two three', None], 5),
+                         [u' one two ...', u''])
+
+
+if __name__ == '__main__':
+    unittest.main()
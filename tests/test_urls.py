@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_urls
+----------------------------------
+
+Tests that `URLTemplate` builds exactly the urls `reverse()` does.
+"""
+
+import unittest
+
+try:
+    from tests import support
+    support.configure()
+    from django.conf.urls import url
+    from django.conf.urls.i18n import i18n_patterns
+    from django.core.urlresolvers import (NoReverseMatch, reverse,
+                                          set_script_prefix)
+    from django.utils import translation
+    from dr_django_tools.shared.django import urlutils
+except ImportError:
+    urlutils = None
+
+
+def view(request, *args, **kwargs):
+    pass
+
+
+if urlutils is not None:
+    urlpatterns = [
+        url(r'^d/(?P<country>[-\w]+)/(?P<region>[-\w]+)/(?P<city>[-\w]+)/$',
+            view, name='destination'),
+        url(r'^d/([-\w]+)/([-\w]+)/([-\w]+)/deals/$', view, name='deals'),
+        url(r'^n/(\d+)/([a-z]+)/(\w+)/$', view, name='strict'),
+    ]
+
+    class I18nURLs(object):
+        urlpatterns = i18n_patterns(
+            url(r'^dest/([-\w]+)/([-\w]+)/([-\w]+)/$', view,
+                name='destination'))
+
+ARGS = [
+    ['france', 'provence', 'nice'],
+    ['a.b', '-', '-'],
+    [u'caf\xe9', 'x', 'y'],
+    ['a b', 'c', 'd'],
+    ['', 'x', 'y'],
+    [1, 2, 3],
+    ['12', 'abc', 'x_1'],
+]
+
+
+@unittest.skipIf(urlutils is None, 'django is not installed')
+class TestURLTemplate(unittest.TestCase):
+
+    def tearDown(self):
+        set_script_prefix('/')
+
+    def build(self, func, name, args):
+        try:
+            return func(name, args)
+        except NoReverseMatch:
+            return NoReverseMatch
+
+    def check(self):
+        for name in ('destination', 'deals', 'strict'):
+            template = urlutils.URLTemplate(name, 3, __name__)
+            for args in ARGS:
+                self.assertEqual(
+                    self.build(lambda n, a: template(*a), name, args),
+                    self.build(lambda n, a: reverse(n, args=a,
+                                                    urlconf=__name__),
+                               name, args),
+                    (name, args))
+
+    def test_matches_reverse(self):
+        self.check()
+
+    def test_matches_reverse_with_script_prefix(self):
+        set_script_prefix('/app%20x/')
+        self.check()
+
+    def test_template_is_compiled(self):
+        template = urlutils.URLTemplate('deals', 3, __name__)
+        self.assertEqual(template.template, '/d/%s/%s/%s/deals/')
+
+    def test_unknown_name(self):
+        template = urlutils.URLTemplate('nope', 3, __name__)
+        self.assertIsNone(template.template)
+        self.assertRaises(NoReverseMatch, template, 'a', 'b', 'c')
+
+
+@unittest.skipIf(urlutils is None, 'django is not installed')
+class TestURLTemplates(unittest.TestCase):
+
+    def setUp(self):
+        urlutils._url_templates.clear()
+
+    def tearDown(self):
+        urlutils._url_templates.clear()
+
+    def test_cached(self):
+        template = urlutils.url_template('deals', 3, __name__)
+        self.assertIs(urlutils.url_template('deals', 3, __name__), template)
+
+    def test_per_language(self):
+        for language in ('en', 'de', 'en'):
+            with translation.override(language):
+                self.assertEqual(
+                    urlutils.url_template('destination', 3, I18nURLs)(
+                        'a', 'b', 'c'),
+                    reverse('destination', args=['a', 'b', 'c'],
+                            urlconf=I18nURLs))
+        with translation.override('de'):
+            self.assertEqual(reverse('destination', args=['a', 'b', 'c'],
+                                     urlconf=I18nURLs), '/de/dest/a/b/c/')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_xml
+----------------------------------
+
+Tests for the cached XPath compiler and the XML helpers.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from lxml import etree
+    from tests import support
+    support.configure()
+    from dr_django_tools.shared.commondata import utils
+except ImportError:
+    utils = None
+
+NS = {'v': 'http://example.com/v'}
+
+DOC = b'''<feed xmlns:v="http://example.com/v">
+  <v:property id="1"><name>Nice</name></v:property>
+  <v:property id="2"><name>Lyon</name></v:property>
+</feed>'''
+
+
+@unittest.skipIf(utils is None, 'lxml or django is not installed')
+class TestCompileXPath(unittest.TestCase):
+
+    def setUp(self):
+        utils._xpath_cache.clear()
+        self.root = etree.fromstring(DOC)
+
+    def tearDown(self):
+        utils._xpath_cache.clear()
+
+    def test_compile(self):
+        xpath = utils.compile_xpath('//v:property/@id', NS)
+        self.assertIsInstance(xpath, etree.XPath)
+        self.assertEqual(xpath(self.root), ['1', '2'])
+
+    def test_cached(self):
+        xpath = utils.compile_xpath('//name', None)
+        self.assertIs(utils.compile_xpath('//name'), xpath)
+        self.assertIs(utils.compile_xpath('//name', {}), xpath)
+        self.assertIs(utils.compile_xpath('//v:property', dict(NS)),
+                      utils.compile_xpath('//v:property', NS))
+
+    def test_namespaces_are_part_of_the_key(self):
+        other = {'v': 'http://example.com/other'}
+        xpath = utils.compile_xpath('//v:property', NS)
+        self.assertIsNot(utils.compile_xpath('//v:property', other), xpath)
+        self.assertEqual(len(utils.compile_xpath('//v:property', NS)
+                             (self.root)), 2)
+        self.assertEqual(utils.compile_xpath('//v:property', other)
+                         (self.root), [])
+
+    def test_bounded(self):
+        size = utils.XPATH_CACHE_SIZE
+        utils.XPATH_CACHE_SIZE = 2
+        try:
+            for xp in ('//a', '//b', '//c'):
+                utils.compile_xpath(xp)
+        finally:
+            utils.XPATH_CACHE_SIZE = size
+        self.assertEqual([key[0] for key in utils._xpath_cache],
+                         ['//b', '//c'])
+
+    def test_invalid(self):
+        self.assertRaises(etree.XPathSyntaxError, utils.compile_xpath,
+                          '//[')
+        self.assertEqual(len(utils._xpath_cache), 0)
+
+    def test_helpers(self):
+        helper = utils.XMLNodeHelper(self.root, NS)
+        self.assertEqual(helper.xpath_attr('v:property', 'id'), '1')
+        self.assertEqual(helper.xpath_text('v:property/name'), 'Nice')
+        self.assertEqual(helper.xpath_text('missing'), '')
+        tree = utils.TreeHelper(etree.ElementTree(etree.fromstring(
+            b'<a><b x="1">text</b></a>')))
+        self.assertEqual(tree.xpath_text('b'), 'text')
+        self.assertEqual(tree.xpath_attr('b', 'x'), '1')
+        self.assertIs(tree.xpath_single('c'), False)
+
+
+def feed(count):
+    records = ''.join('<v:property id="%i"><name>p%i</name></v:property>'
+                      % (i, i) for i in range(count))
+    return ('<feed xmlns:v="http://example.com/v"><head>x</head>%s<tail/>'
+            '</feed>' % records).encode('utf8')
+
+
+@unittest.skipIf(utils is None, 'lxml or django is not installed')
+class TestIterXMLRecords(unittest.TestCase):
+
+    def test_records(self):
+        records = utils.iter_xml_records(io.BytesIO(feed(3)), 'v:property',
+                                         NS)
+        self.assertEqual([(r.node.get('id'), r.xpath_text('name'))
+                          for r in records],
+                         [('0', 'p0'), ('1', 'p1'), ('2', 'p2')])
+
+    def test_clark_name(self):
+        records = utils.iter_xml_records(
+            io.BytesIO(feed(2)), '{http://example.com/v}property')
+        self.assertEqual([r.node.get('id') for r in records], ['0', '1'])
+
+    def test_tag_without_namespace(self):
+        records = list(utils.iter_xml_records(io.BytesIO(DOC), 'name'))
+        self.assertEqual(len(records), 2)
+        # the unprefixed name does not match namespaced elements
+        records = utils.iter_xml_records(io.BytesIO(DOC), 'property')
+        self.assertEqual(list(records), [])
+
+    def test_namespaces_reach_the_helper(self):
+        doc = (b'<feed xmlns:v="http://example.com/v"><v:property>'
+               b'<v:name>Nice</v:name></v:property></feed>')
+        record = next(utils.iter_xml_records(io.BytesIO(doc), 'v:property',
+                                             NS))
+        self.assertEqual(record.xpath_text('v:name'), 'Nice')
+
+    def test_unknown_prefix(self):
+        self.assertRaises(KeyError, list,
+                          utils.iter_xml_records(io.BytesIO(DOC), 'x:property',
+                                                 NS))
+
+    def test_path_source(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'feed.xml')
+        with open(path, 'wb') as f:
+            f.write(feed(2))
+        records = utils.iter_xml_records(path, 'v:property', NS)
+        self.assertEqual([r.node.get('id') for r in records], ['0', '1'])
+
+    def test_processed_records_are_cleared(self):
+        records = utils.iter_xml_records(io.BytesIO(feed(5)), 'v:property',
+                                         NS)
+        seen = []
+        for record in records:
+            node = record.node
+            if seen:
+                # only the emptied previous record is left before it
+                self.assertIs(node.getprevious(), seen[-1])
+                self.assertEqual(len(seen[-1]), 0)
+            if len(seen) > 1:
+                self.assertIsNone(seen[-2].getparent())
+            seen.append(node)
+        for node in seen:
+            self.assertEqual(len(node), 0)
+            self.assertEqual(node.attrib, {})
+        self.assertEqual(len(seen), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
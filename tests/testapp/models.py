@@ -0,0 +1,32 @@
+from django.db import models
+
+from dr_django_tools.shared.commondata.models import (BaseImage,
+                                                      LocationAware, Resource)
+
+
+def slug_base(obj, additional_context=None):
+    if additional_context:
+        return u'%(resource_name)s %(image_description)s' % additional_context
+    return obj.name
+
+
+class Hotel(Resource, LocationAware):
+    name = models.CharField(max_length=100)
+
+
+class HotelImage(BaseImage):
+    resource = models.ForeignKey(Hotel, on_delete=models.CASCADE)
+    parent = models.ForeignKey('self', null=True, blank=True,
+                               on_delete=models.CASCADE)
+    source = models.CharField(max_length=200, default='', blank=True)
+    image_type = models.IntegerField(default=0)
+    width = models.IntegerField(null=True)
+    height = models.IntegerField(null=True)
+    description = models.CharField(max_length=200, blank=True, default='')
+
+
+class Place(models.Model):
+    name = models.CharField(max_length=200)
+    slug = models.CharField(max_length=200, null=True, blank=True)
+    rating = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(null=True)
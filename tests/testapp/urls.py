@@ -0,0 +1,13 @@
+from django.conf.urls import url
+from django.http import HttpResponse
+
+from .models import Place
+
+
+def places(request):
+    return HttpResponse(str(len(list(Place.objects.all()))))
+
+
+urlpatterns = [
+    url(r'^places/$', places),
+]